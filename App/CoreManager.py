@@ -97,6 +97,14 @@ class CoreManager(Singleton):
         self.cmdPipe = cmdPipe
 
         self.config = Config("config.ini", log_level)
+        # The count of the worker processes to convert the external resources. 0 is the count of cpu.
+        self.config.setDefaultValue('Resource', 'jobs', 0)
+        # Load the textures on the background thread, and upload them in the budget of a frame.
+        self.config.setDefaultValue('Resource', 'async_load', 1)
+        self.config.setDefaultValue('Resource', 'async_finalize_budget_ms', 2.0)
+        self.config.setDefaultValue('Resource', 'program_binary_cache_size_mb', 256)
+        # Submit the shader compiles at once, and draw with the default material until they are compiled.
+        self.config.setDefaultValue('Resource', 'parallel_shader_compile', 1)
 
         self.registCommand()
 
@@ -489,6 +497,7 @@ class CoreManager(Singleton):
 
         startTime = time.perf_counter()
         self.updateCommand()
+        self.resource_manager.update()
         self.updateCamera()
 
         # update actors
@@ -536,6 +545,13 @@ class CoreManager(Singleton):
         self.font_manager.log("GPU : %.2f ms" % self.avg_gpuTime)
         self.font_manager.log("Render : %.2f ms" % self.avg_renderTime)
         self.font_manager.log("Present : %.2f ms" % self.avg_presentTime)
+        self.font_manager.log(self.scene_manager.main_culling.get_log())
+        self.font_manager.log(self.scene_manager.shadow_culling.get_log())
+        self.font_manager.log(self.scene_manager.animation_pose_cache.get_log())
+        self.font_manager.log(self.resource_manager.async_loader.get_log())
+        self.font_manager.log(self.resource_manager.material_compile_queue.get_log())
+        self.font_manager.log(self.renderer.gl_state_cache.get_log())
+        self.font_manager.log(self.renderer.render_graph.get_log())
 
         # selected object transform info
         selected_object = self.scene_manager.getSelectedObject()
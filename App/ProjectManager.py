@@ -47,6 +47,9 @@ class ProjectManager(Singleton):
             self.config.setDefaultValue("Camera", "move_speed", meter_per_unit)
             self.config.setDefaultValue("Camera", "pan_speed", meter_per_unit)
             self.config.setDefaultValue("Camera", "rotation_speed", 0.3)
+            self.config.setDefaultValue("Animation", "pose_cache_size", 1024)
+            # 0 is no quantization of the animation time.
+            self.config.setDefaultValue("Animation", "samples_per_second", 0)
         except:
             logger.info("Cannot open %s : %s" % (GetClassName(self), project_filename))
             return False
@@ -8,9 +8,11 @@ import time as timeModule
 import numpy as np
 
 from Common import logger
-from Object import Atmosphere, SkeletonActor, StaticActor, Camera, Light, LightProbe, Sky, PostProcess, RenderInfo
+from Object import Atmosphere, TransformSystem, AnimationPoseCache, SkeletonActor, StaticActor, Camera, Light, \
+    LightProbe, Sky, PostProcess, RenderInfo, RenderInstanceInfo
 from OpenGLContext import UniformBlock
-from Utilities import Singleton, GetClassName, Attributes, FLOAT_ZERO, FLOAT4_ZERO, MATRIX4_IDENTITY, Matrix4, Profiler
+from Utilities import Singleton, GetClassName, Attributes, FLOAT_ZERO, FLOAT4_ZERO, MATRIX4_IDENTITY, Matrix4, Profiler, \
+    BoundingVolumeHierarchy, FrustumCulling, transform_aabb
 
 
 class SceneManager(Singleton):
@@ -19,6 +21,8 @@ class SceneManager(Singleton):
         self.resource_manager = None
         self.sceneLoader = None
         self.renderer = None
+        self.transform_system = TransformSystem.instance()
+        self.animation_pose_cache = AnimationPoseCache.instance()
         self.__current_scene_name = ""
 
         # Scene Objects
@@ -41,9 +45,23 @@ class SceneManager(Singleton):
         # render group
         self.static_solid_render_infos = []
         self.static_translucent_render_infos = []
+        self.static_solid_render_instance_infos = []
         self.skeleton_solid_render_infos = []
         self.skeleton_translucent_render_infos = []
 
+        # culling of static actors
+        self.static_actor_bvh = BoundingVolumeHierarchy()
+        self.static_actor_transform_indices = np.zeros(0, dtype=np.int32)
+        self.static_actor_bound_min = np.zeros((0, 3), dtype=np.float32)
+        self.static_actor_bound_max = np.zeros((0, 3), dtype=np.float32)
+        self.static_solid_render_info_indices = np.zeros(0, dtype=np.int32)
+        self.static_translucent_render_info_indices = np.zeros(0, dtype=np.int32)
+        self.main_culling = FrustumCulling("main")
+        self.shadow_culling = FrustumCulling("shadow")
+        self.visible_static_solid_render_infos = []
+        self.visible_static_translucent_render_infos = []
+        self.shadow_static_solid_render_infos = []
+
     def initialize(self, core_manager):
         logger.info("initialize " + GetClassName(self))
         self.core_manager = core_manager
@@ -51,6 +69,10 @@ class SceneManager(Singleton):
         self.sceneLoader = self.resource_manager.sceneLoader
         self.renderer = core_manager.renderer
 
+        config = core_manager.projectManager.config
+        self.animation_pose_cache.initialize(max_pose_count=config.Animation.pose_cache_size,
+                                             samples_per_second=config.Animation.samples_per_second)
+
         # new scene
         self.new_scene()
 
@@ -66,6 +88,9 @@ class SceneManager(Singleton):
         self.main_camera = None
         self.main_light = None
         self.main_light_probe = None
+        self.animation_pose_cache.clear()
+        for obj in self.objectMap.values():
+            obj.delete()
         self.cameras = []
         self.lights = []
         self.light_probes = []
@@ -73,6 +98,13 @@ class SceneManager(Singleton):
         self.skeleton_actors = []
         self.objectMap = {}
 
+        # the instancing batches and the bvh have the transform indices of the deleted objects, which are reused.
+        self.update_static_render_info()
+        self.update_skeleton_render_info()
+        self.visible_static_solid_render_infos = []
+        self.visible_static_translucent_render_infos = []
+        self.shadow_static_solid_render_infos = []
+
         # delete empty scene
         # resource = self.resource_manager.sceneLoader.getResource(self.__current_scene_name)
         # if resource is not None and not os.path.exists(resource.meta_data.resource_filepath):
@@ -191,6 +223,7 @@ class SceneManager(Singleton):
             object_list = self.get_object_list(object_type)
             object_list.remove(object)
             self.objectMap.pop(object.name)
+            object.delete()
             self.update_render_info(object_type)
             self.core_manager.notifyDeleteObject(object.name)
         else:
@@ -242,6 +275,8 @@ class SceneManager(Singleton):
         return self.addObject(model=model, pos=pos)
 
     def clearObjects(self):
+        for obj in self.objectMap.values():
+            obj.delete()
         self.cameras = []
         self.lights = []
         self.static_actors = []
@@ -334,9 +369,72 @@ class SceneManager(Singleton):
                                        solid_render_infos=self.static_solid_render_infos,
                                        translucent_render_infos=self.static_translucent_render_infos)
 
-        self.static_solid_render_infos.sort(key=lambda x: (id(x.geometry), id(x.material)))
+        self.static_solid_render_infos.sort(key=lambda x: (id(x.geometry), id(x.material), id(x.material_instance)))
         self.static_translucent_render_infos.sort(key=lambda x: (id(x.geometry), id(x.material)))
 
+        # rebuild instancing batches
+        for render_instance_info in self.static_solid_render_instance_infos:
+            render_instance_info.delete()
+        self.static_solid_render_instance_infos = []
+
+        RenderInstanceInfo.gather_render_infos(render_infos=self.static_solid_render_infos,
+                                               render_instance_infos=self.static_solid_render_instance_infos)
+
+        self.build_static_actor_bvh()
+
+    def build_static_actor_bvh(self):
+        static_actor_count = len(self.static_actors)
+        static_actor_indices = dict((id(actor), i) for i, actor in enumerate(self.static_actors))
+        self.static_actor_transform_indices = np.array([actor.transform.index for actor in self.static_actors],
+                                                       dtype=np.int32)
+        self.static_actor_bound_min = np.zeros((static_actor_count, 3), dtype=np.float32)
+        self.static_actor_bound_max = np.zeros((static_actor_count, 3), dtype=np.float32)
+        for i, actor in enumerate(self.static_actors):
+            mesh = actor.get_mesh()
+            if mesh:
+                self.static_actor_bound_min[i] = mesh.bound_min
+                self.static_actor_bound_max[i] = mesh.bound_max
+
+        self.static_solid_render_info_indices = np.array(
+            [static_actor_indices[id(render_info.actor)] for render_info in self.static_solid_render_infos],
+            dtype=np.int32)
+        self.static_translucent_render_info_indices = np.array(
+            [static_actor_indices[id(render_info.actor)] for render_info in self.static_translucent_render_infos],
+            dtype=np.int32)
+        for render_instance_info in self.static_solid_render_instance_infos:
+            render_instance_info.item_indices = np.array(
+                [static_actor_indices[id(render_info.actor)] for render_info in render_instance_info.render_infos],
+                dtype=np.int32)
+
+        matrices = self.transform_system.matrix[self.static_actor_transform_indices]
+        bound_min, bound_max = transform_aabb(self.static_actor_bound_min, self.static_actor_bound_max, matrices)
+        self.static_actor_bvh.build(bound_min, bound_max)
+
+    def update_static_actor_bvh(self):
+        # refit the bounding boxes of the moved actors only.
+        items = np.flatnonzero(self.transform_system.updated[self.static_actor_transform_indices])
+        if len(items) > 0:
+            matrices = self.transform_system.matrix[self.static_actor_transform_indices[items]]
+            bound_min, bound_max = transform_aabb(self.static_actor_bound_min[items],
+                                                  self.static_actor_bound_max[items],
+                                                  matrices)
+            self.static_actor_bvh.update_items(items, bound_min, bound_max)
+            self.static_actor_bvh.refit()
+
+    def update_culling(self):
+        """
+        Frustum culling of the main camera and the shadow of the main light.
+        """
+        self.main_culling.update(self.static_actor_bvh, self.main_camera.view_projection)
+        self.visible_static_solid_render_infos = self.main_culling.cull_render_infos(
+            self.static_solid_render_infos, self.static_solid_render_info_indices)
+        self.visible_static_translucent_render_infos = self.main_culling.cull_render_infos(
+            self.static_translucent_render_infos, self.static_translucent_render_info_indices)
+
+        self.shadow_culling.update(self.static_actor_bvh, self.main_light.shadow_view_projection)
+        self.shadow_static_solid_render_infos = self.shadow_culling.cull_render_infos(
+            self.static_solid_render_infos, self.static_solid_render_info_indices)
+
     def update_skeleton_render_info(self):
         self.skeleton_solid_render_infos = []
         self.skeleton_translucent_render_infos = []
@@ -348,19 +446,39 @@ class SceneManager(Singleton):
         self.skeleton_solid_render_infos.sort(key=lambda x: (id(x.geometry), id(x.material)))
         self.skeleton_translucent_render_infos.sort(key=lambda x: (id(x.geometry), id(x.material)))
 
+    def update_skeleton_actors(self, dt):
+        # gather the frames of the same animation, and get the poses at once.
+        animation_requests = OrderedDict()
+        for skeleton_actor in self.skeleton_actors:
+            skeleton_actor.update(dt)
+            if skeleton_actor.has_mesh:
+                for i, animation in enumerate(skeleton_actor.model.mesh.animations):
+                    if animation:
+                        buffer_owners, frames = animation_requests.setdefault(animation, ([], []))
+                        buffer_owners.append((skeleton_actor, i))
+                        frames.append(skeleton_actor.animation_frames[i])
+
+        for animation, (buffer_owners, frames) in animation_requests.items():
+            poses = self.animation_pose_cache.get_poses(animation, frames)
+            for (skeleton_actor, i), pose in zip(buffer_owners, poses):
+                skeleton_actor.animation_buffers[i] = pose
+
     def update_scene(self, dt):
         self.renderer.postprocess.update()
 
+        self.transform_system.update()
+
+        self.update_static_actor_bvh()
+
+        for render_instance_info in self.static_solid_render_instance_infos:
+            render_instance_info.update_instance_data()
+
         for camera in self.cameras:
             camera.update()
 
         for light in self.lights:
             light.update(self.main_camera)
 
-        for static_actor in self.static_actors:
-            static_actor.update(dt)
-
-        for skeleton_actor in self.skeleton_actors:
-            skeleton_actor.update(dt)
+        self.update_skeleton_actors(dt)
 
         self.atmosphere.update(self.main_camera, self.main_light)
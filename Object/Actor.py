@@ -4,7 +4,7 @@ import math
 import numpy as np
 
 from Common import logger
-from Object import TransformObject, Model
+from Object import TransformObject, Model, AnimationPoseCache
 from OpenGLContext import UniformBlock
 from Utilities import *
 from App import CoreManager
@@ -70,8 +70,12 @@ class StaticActor:
     def setSelected(self, selected):
         self.selected = selected
 
+    def delete(self):
+        self.transform.delete()
+
     def update(self, dt):
-        self.transform.updateTransform()
+        # transform is updated by TransformSystem.update
+        pass
 
 
 class SkeletonActor(StaticActor):
@@ -79,6 +83,7 @@ class SkeletonActor(StaticActor):
         StaticActor.__init__(self, name, **object_data)
 
         self.animation_time = 0.0
+        self.animation_frames = []
         self.animation_buffers = []
         self.prev_animation_buffers = []
 
@@ -87,6 +92,7 @@ class SkeletonActor(StaticActor):
                 if animation:
                     animation_buffer = animation.get_animation_transforms(0.0)
                     # just initialize
+                    self.animation_frames.append(0.0)
                     self.animation_buffers.append(animation_buffer.copy())
                     self.prev_animation_buffers.append(animation_buffer.copy())
 
@@ -102,18 +108,17 @@ class SkeletonActor(StaticActor):
         # self.transform.setYaw((time.time() * 0.4) % (math.pi * 2.0))
         # self.transform.setRoll((time.time() * 0.5) % (math.pi * 2.0))
 
-        # update
-        self.transform.updateTransform()
-
-        # update animation
+        # update animation frame. The animation buffers are sampled by SceneManager.update_skeleton_actors at once.
         if self.has_mesh:
             for i, animation in enumerate(self.model.mesh.animations):
                 if animation:
                     frame_count = animation.frame_count
                     if frame_count > 1:
                         self.animation_time = math.fmod(self.animation_time + dt, animation.animation_length)
-                        frame = animation.get_time_to_frame(self.animation_time)
+                        animation_time = AnimationPoseCache.instance().quantize_time(self.animation_time)
+                        frame = animation.get_time_to_frame(animation_time)
                     else:
                         frame = 0.0
-                    self.prev_animation_buffers[i][...] = self.animation_buffers[i]
-                    self.animation_buffers[i][...] = animation.get_animation_transforms(frame)
+                    # The animation buffers are read-only poses shared by AnimationPoseCache, so just swap them.
+                    self.prev_animation_buffers[i] = self.animation_buffers[i]
+                    self.animation_frames[i] = frame
@@ -1,9 +1,66 @@
 import copy
+import math
+from collections import OrderedDict
 
 from Common import logger
 from Utilities import *
 
 
+class AnimationPoseCache(Singleton):
+    """
+    LRU cache of the sampled bone matrices keyed by (animation, frame).
+    SkeletonActors playing the same animation at the same frame share one read-only pose.
+    """
+    def __init__(self):
+        self.max_pose_count = 1024
+        # Quantize the animation time to raise the hit rate. 0 is no quantization.
+        self.samples_per_second = 0
+        self.poses = OrderedDict()
+        self.hit_count = 0
+        self.miss_count = 0
+
+    def initialize(self, max_pose_count, samples_per_second):
+        self.max_pose_count = max(1, int(max_pose_count))
+        self.samples_per_second = max(0, int(samples_per_second))
+        self.clear()
+
+    def clear(self):
+        self.poses = OrderedDict()
+        self.hit_count = 0
+        self.miss_count = 0
+
+    def quantize_time(self, animation_time):
+        if 0 < self.samples_per_second:
+            return math.floor(animation_time * self.samples_per_second) / self.samples_per_second
+        return animation_time
+
+    def get_poses(self, animation, frames):
+        """
+        :return: read-only pose list of the frames. The missed frames are sampled at once.
+        """
+        poses = [self.poses.get((animation, frame)) for frame in frames]
+        missed_frames = list(OrderedDict.fromkeys(frame for frame, pose in zip(frames, poses) if pose is None))
+        self.miss_count += len(missed_frames)
+        self.hit_count += len(frames) - len(missed_frames)
+
+        if missed_frames:
+            animation_transforms = animation.get_animation_transforms_array(missed_frames)
+            animation_transforms.flags.writeable = False
+            for frame, animation_transform in zip(missed_frames, animation_transforms):
+                self.poses[(animation, frame)] = animation_transform
+            poses = [self.poses[(animation, frame)] for frame in frames]
+
+        for frame in frames:
+            self.poses.move_to_end((animation, frame))
+
+        while self.max_pose_count < len(self.poses):
+            self.poses.popitem(last=False)
+        return poses
+
+    def get_log(self):
+        return "Pose Cache : %d poses, hit %d, miss %d" % (len(self.poses), self.hit_count, self.miss_count)
+
+
 class Animation:
     def __init__(self, name, index, skeleton, animation_data):
         self.name = name
@@ -22,35 +79,72 @@ class Animation:
             self.nodes.append(animation_node)
         if 0 < self.frame_count:
             self.animation_length = max(self.frame_times)
+        self.frame_times = np.array(self.frame_times, dtype=np.float32)
         self.last_frame = 0.0
-        self.current_frame = 0
         self.animation_time = 0.0
 
-        # just update animation transforms
-        self.animation_transforms = np.array([Matrix4() for i in range(len(self.nodes))], dtype=np.float32)
-        self.get_animation_transforms(0.0)
+        # bake animation nodes into arrays. ( frames, bones, 4 or 3 )
+        node_count = len(self.nodes)
+        frame_count = max(1, self.frame_count)
+        self.node_frame_counts = np.array([node.frame_count for node in self.nodes], dtype=np.int32)
+        self.is_animated_node = 0 < self.node_frame_counts
+        self.rotations = np.zeros((frame_count, node_count, 4), dtype=np.float32)
+        self.rotations[..., 0] = 1.0
+        self.locations = np.zeros((frame_count, node_count, 3), dtype=np.float32)
+        self.scales = np.ones((frame_count, node_count, 3), dtype=np.float32)
+        self.inv_bind_matrices = np.array([node.bone.inv_bind_matrix for node in self.nodes],
+                                          dtype=np.float32).reshape(node_count, 4, 4)
+        for i, node in enumerate(self.nodes):
+            if 0 < node.frame_count:
+                self.rotations[:node.frame_count, i] = node.rotations
+                self.locations[:node.frame_count, i] = node.locations
+                self.scales[:node.frame_count, i] = node.scales
+
+        self.animation_transforms = self.get_animation_transforms_array(np.array([0.0, ], dtype=np.float32))[0]
 
     def get_time_to_frame(self, deltaTime):
         if 1 < self.frame_count:
             current_time = self.animation_time + deltaTime
-
-            while True:
-                if self.frame_times[self.current_frame] <= current_time <= self.frame_times[self.current_frame + 1]:
-                    break
-                self.current_frame = (self.current_frame + 1) % (self.frame_count - 1)
-
-            frame_time = self.frame_times[self.current_frame]
-            next_frame_time = self.frame_times[self.current_frame + 1]
+            current_frame = np.searchsorted(self.frame_times, current_time, side='right') - 1
+            current_frame = min(max(0, current_frame), self.frame_count - 2)
+            frame_time = self.frame_times[current_frame]
+            next_frame_time = self.frame_times[current_frame + 1]
             ratio = (current_time - frame_time) / (next_frame_time - frame_time)
-            return float(self.current_frame) + ratio
+            return float(current_frame) + float(ratio)
         return 0.0
 
     def get_animation_transforms(self, frame=0.0):
-        if self.last_frame == frame:
-            return self.animation_transforms
-        else:
-            self.animation_transforms[...] = [node.get_transform(frame) for node in self.nodes]
-            return self.animation_transforms
+        if self.last_frame != frame:
+            self.last_frame = frame
+            self.animation_transforms[...] = self.get_animation_transforms_array(np.array([frame, ]))[0]
+        return self.animation_transforms
+
+    def get_animation_transforms_array(self, frames):
+        """
+        Sample the bone matrices of all bones for each frame at once.
+        :param frames: (N,) array of frame
+        :return: (N, bones, 4, 4) array
+        """
+        frames = np.asarray(frames, dtype=np.float32)
+        node_frame_counts = np.maximum(self.node_frame_counts, 1)
+        rates = (frames - np.floor(frames))[:, np.newaxis]
+        current_frames = frames.astype(np.int32)[:, np.newaxis] % node_frame_counts
+        next_frames = (current_frames + 1) % node_frame_counts
+        nodes = np.arange(len(self.nodes))
+
+        rotations = slerp_array(self.rotations[current_frames, nodes], self.rotations[next_frames, nodes], rates)
+        rates = rates[..., np.newaxis]
+        locations = lerp(self.locations[current_frames, nodes], self.locations[next_frames, nodes], rates)
+        scales = lerp(self.scales[current_frames, nodes], self.scales[next_frames, nodes], rates)
+
+        # rotation * scale, and location
+        transforms = quaternion_to_matrix_array(rotations)
+        transforms[..., 0:3] *= scales[..., np.newaxis, :]
+        transforms[..., 3, 0:3] = locations
+        transforms = np.matmul(self.inv_bind_matrices, transforms)
+        # The nodes without keys are identity.
+        transforms[:, np.logical_not(self.is_animated_node)] = MATRIX4_IDENTITY
+        return transforms
 
 
 class AnimationNode:
@@ -41,6 +41,8 @@ class Camera(StaticActor):
         self.prev_view_projection = Matrix4()
         self.prev_view_origin_projection = Matrix4()
 
+        self.transform.set_view_transform(True)
+
     def initialize(self):
         config = CoreManager.instance().projectManager.config
         # get properties
@@ -106,12 +108,14 @@ class Camera(StaticActor):
     def update(self, force_update = False):
         self.update_projection()
 
-        self.transform.updateTransform(update_view_transform=True, force_update=force_update)
+        # transform is updated by TransformSystem.update, except for the forced update. ex) light probe
+        if force_update:
+            self.transform.updateTransform(update_view_transform=True, force_update=force_update)
 
         # negative front
         self.front[...] = -self.transform.front
 
-        self.prev_view = self.transform.prev_inverse_matrix
+        self.prev_view[...] = self.transform.prev_inverse_matrix
         self.prev_view_origin[...] = self.view_origin
         self.prev_view_projection[...] = self.view_projection
         self.prev_view_origin_projection[...] = self.view_origin_projection
@@ -121,7 +125,7 @@ class Camera(StaticActor):
         self.projection[2][0] = -self.postprocess.jitter[0]
         self.projection[2][1] = -self.postprocess.jitter[1]
 
-        self.view = self.transform.inverse_matrix
+        self.view[...] = self.transform.inverse_matrix
         self.view_origin[...] = self.view
         self.view_origin[3, 0:3] = [0.0, 0.0, 0.0]
         self.view_projection[...] = np.dot(self.view, self.projection)
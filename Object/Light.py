@@ -11,6 +11,7 @@ class Light(StaticActor):
         StaticActor.__init__(self, name, **object_data)
         self.lightColor = Float4(*object_data.get('lightColor', (1.0, 1.0, 1.0, 1.0)))
         self.shadow_view_projection = MATRIX4_IDENTITY.copy()
+        self.transform.set_view_transform(True)
 
     def getAttribute(self):
         super().getAttribute()
@@ -28,8 +29,6 @@ class Light(StaticActor):
         return save_data
 
     def update(self, current_camera):
-        self.transform.updateTransform(update_view_transform=True)
-
         if current_camera:
             shadow_distance = 50.0 / current_camera.meter_per_unit
             width, height = shadow_distance * 0.5, shadow_distance * 0.5
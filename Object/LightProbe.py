@@ -13,13 +13,14 @@ from .Camera import Camera
 
 
 class LightProbe(StaticActor):
+    # The faces are copied to the cube texture, and the cube texture generates the mipmap.
     texture_datas = dict(
         texture_type=Texture2D,
         width=512,
         height=512,
         internal_format=GL_RGBA16F,
         texture_format=GL_RGBA,
-        min_filter=GL_LINEAR_MIPMAP_LINEAR,
+        min_filter=GL_LINEAR,
         mag_filter=GL_LINEAR,
         data_type=GL_FLOAT,
         wrap=GL_MIRRORED_REPEAT
@@ -40,30 +41,26 @@ class LightProbe(StaticActor):
 
     def clear(self):
         self.clear_texture_faces()
-        self.texture_probe.clear()
-        self.texture_probe = None
+        if self.texture_probe:
+            self.texture_probe.delete()
+            self.texture_probe = None
 
     def clear_texture_faces(self):
-        if self.texture_right:
-            self.texture_right.clear()
-            self.texture_right = None
-        if self.texture_left:
-            self.texture_left.clear()
-            self.texture_left = None
-        if self.texture_top:
-            self.texture_top.clear()
-            self.texture_top = None
-        if self.texture_bottom:
-            self.texture_bottom.clear()
-            self.texture_bottom = None
-        if self.texture_front:
-            self.texture_front.clear()
-            self.texture_front = None
-        if self.texture_back:
-            self.texture_back.clear()
-            self.texture_back = None
+        # the frame buffers of the faces are cached by the renderer, so they are deleted with the faces.
+        framebuffer_manager = CoreManager.instance().renderer.framebuffer_manager
+        for face in ('texture_right', 'texture_left', 'texture_top', 'texture_bottom', 'texture_front', 'texture_back'):
+            texture = getattr(self, face)
+            if texture:
+                if framebuffer_manager is not None:
+                    framebuffer_manager.delete_framebuffers_of(texture)
+                texture.delete()
+                setattr(self, face, None)
 
     def generate_texture_faces(self):
+        # the faces are reused, when the probe is rendered again.
+        if self.texture_right is not None:
+            return
+
         self.texture_right = CreateTexture(name=self.name + "_right", **self.texture_datas)
         self.texture_left = CreateTexture(name=self.name + "_left", **self.texture_datas)
         self.texture_top = CreateTexture(name=self.name + "_top", **self.texture_datas)
@@ -72,7 +69,13 @@ class LightProbe(StaticActor):
         self.texture_back = CreateTexture(name=self.name + "_back", **self.texture_datas)
 
     def generate_texture_probe(self):
+        if self.texture_probe is not None:
+            # copy the rendered faces on the gpu.
+            self.texture_probe.copy_face_textures()
+            return
+
         cube_texture_datas = copy.copy(self.texture_datas)
+        cube_texture_datas['min_filter'] = GL_LINEAR_MIPMAP_LINEAR
         cube_texture_datas['texture_type'] = TextureCube
         cube_texture_datas['texture_positive_x'] = self.texture_right
         cube_texture_datas['texture_negative_x'] = self.texture_left
@@ -81,7 +84,6 @@ class LightProbe(StaticActor):
         cube_texture_datas['texture_positive_z'] = self.texture_front
         cube_texture_datas['texture_negative_z'] = self.texture_back
         self.texture_probe = CreateTexture(name=self.name + "_cube", **cube_texture_datas)
-        # self.clear_texture_faces()
 
     def get_texture(self, face):
         return getattr(self, "texture_" + face)
\ No newline at end of file
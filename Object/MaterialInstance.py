@@ -10,7 +10,7 @@ from numpy import array, float32
 
 from Common import logger
 from App import CoreManager
-from OpenGLContext import CreateUniformBuffer, CreateUniformDataFromString
+from OpenGLContext import CreateUniformBuffer, CreateUniformDataFromString, MaterialUniformBlock, UniformBlockMember
 from Utilities import Attributes
 
 
@@ -26,6 +26,14 @@ class MaterialInstance:
         self.macros = copy.copy(data.get('macros', OrderedDict()))
         self.linked_uniform_map = dict()
         self.linked_material_component_map = dict()
+        # [bind function without arguments, ...] of the material components, rebuilt when the data is changed.
+        self.binding_table = None
+        # the uniform buffer of the material components which are in the material uniform block.
+        self.material_uniform_block = None
+        self.is_linked = False
+        # the loaded uniform data is set when the material is linked.
+        self.pending_uniform_datas = dict(data.get('uniform_datas', {}))
+        self.instancing_material_instance = None
         self.Attributes = Attributes()
 
         material = data.get('material')
@@ -33,12 +41,7 @@ class MaterialInstance:
         # link uniform_buffers and uniform_data
         self.set_material(material)
 
-        if self.material:
-            # and set the loaded uniform data.
-            uniform_datas = data.get('uniform_datas', {})
-            for data_name, data_value in uniform_datas.items():
-                self.set_uniform_data_from_string(data_name, data_value)
-        else:
+        if self.material is None:
             logger.error("%s material instance has no material." % self.name)
             return
 
@@ -46,12 +49,14 @@ class MaterialInstance:
 
     def clear(self):
         self.linked_uniform_map = OrderedDict({})
+        self.binding_table = None
         self.Attributes.clear()
 
     def is_translucent(self):
         return self.material.is_translucent
 
     def get_save_data(self):
+        self.link_material()
         uniform_datas = {}
         for uniform_name in self.linked_uniform_map:
             uniform_buffer, uniform_data = self.linked_uniform_map[uniform_name]
@@ -75,38 +80,140 @@ class MaterialInstance:
             self.material = material
             self.material_name = material.name
             self.macros = copy.copy(material.macros)
+            self.instancing_material_instance = None
+            self.is_linked = False
+
+            # the material which is still compiling is linked later.
+            if material.is_finalized:
+                self.link_material()
+
+    def link_material(self, wait=True):
+        """
+        Link the uniform buffers of the material and the uniform datas.
+        :param wait: If False, return False without waiting for the material that is still compiling.
+        """
+        if self.is_linked or self.material is None:
+            return self.is_linked
+
+        material = self.material
+        if not wait and not material.is_completed():
+            return False
+        if not material.finalize():
+            logger.error("%s material instance uses the invalid material %s." % (self.name, material.name))
+        self.is_linked = True
+        self.binding_table = None
+
+        # link_uniform_buffers
+        old_uniform_names = list(self.linked_uniform_map.keys())
+        self.linked_material_component_map = dict()
+        material_uniform_names = material.uniform_buffers.keys()
+        material_component_names = material.material_component_names
+        for uniform_name in material_uniform_names:
+            if uniform_name in old_uniform_names:
+                old_uniform_names.remove(uniform_name)
+            uniform_buffer = material.uniform_buffers[uniform_name]
+            if uniform_name not in self.linked_uniform_map:
+                # cannot found uniform data. just set default uniform data.
+                uniform_data = CreateUniformDataFromString(uniform_buffer.uniform_type)
+                if uniform_data is not None:
+                    # link between uniform buffer and data.
+                    self.linked_uniform_map[uniform_name] = [uniform_buffer, uniform_data]
+                else:
+                    logger.error("%s material instance failed to create %s uniform data %s." % (
+                        self.name, uniform_name, uniform_data))
+                    continue
+
+            if uniform_name in material_component_names:
+                self.linked_material_component_map[uniform_name] = self.linked_uniform_map[uniform_name]
+        # Remove the uniform data that is not in Material and Shader.
+        for uniform_name in old_uniform_names:
+            self.linked_uniform_map.pop(uniform_name)
+
+        if self.material_uniform_block is not None:
+            self.material_uniform_block.delete()
+            self.material_uniform_block = None
+
+        if 0 < material.uniform_block_size:
+            self.material_uniform_block = MaterialUniformBlock(material.uniform_block_size)
+            for uniform_buffer, uniform_data in self.linked_uniform_map.values():
+                self.update_material_uniform_block(uniform_buffer, uniform_data)
+
+        # and set the loaded uniform data.
+        pending_uniform_datas = self.pending_uniform_datas
+        self.pending_uniform_datas = {}
+        for data_name, data_value in pending_uniform_datas.items():
+            self.set_uniform_data_from_string(data_name, data_value)
+        return True
+
+    def is_ready(self):
+        """
+        :return: True if the material has been compiled and linked, without waiting for the driver.
+        """
+        return self.link_material(wait=False) and self.material.valid
 
-            # link_uniform_buffers
-            old_uniform_names = list(self.linked_uniform_map.keys())
-            self.linked_material_component_map = dict()
-            material_uniform_names = material.uniform_buffers.keys()
-            material_component_names = material.material_component_names
-            for uniform_name in material_uniform_names:
-                if uniform_name in old_uniform_names:
-                    old_uniform_names.remove(uniform_name)
-                uniform_buffer = material.uniform_buffers[uniform_name]
-                if uniform_name not in self.linked_uniform_map:
-                    # cannot found uniform data. just set default uniform data.
-                    uniform_data = CreateUniformDataFromString(uniform_buffer.uniform_type)
-                    if uniform_data is not None:
-                        # link between uniform buffer and data.
-                        self.linked_uniform_map[uniform_name] = [uniform_buffer, uniform_data]
-                    else:
-                        logger.error("%s material instance failed to create %s uniform data %s." % (
-                            self.name, uniform_name, uniform_data))
-                        continue
-
-                if uniform_name in material_component_names:
-                    self.linked_material_component_map[uniform_name] = self.linked_uniform_map[uniform_name]
-            # Remove the uniform data that is not in Material and Shader.
-            for uniform_name in old_uniform_names:
-                self.linked_uniform_map.pop(uniform_name)
+    def get_instancing_material_instance(self):
+        """
+        The in-memory variant of this material instance which reads the model matrix from the instance buffer.
+        Return None if the shader doesn't support INSTANCING, or the materials are still compiling.
+        """
+        if not self.is_ready():
+            return None
+
+        if self.instancing_material_instance is None:
+            if self.macros.get('INSTANCING') is None:
+                return None
+            macros = copy.copy(self.macros)
+            macros['INSTANCING'] = 1
+            material = CoreManager.instance().resource_manager.getMaterial(self.material.shader_name, macros)
+            if material is None or material.macros.get('INSTANCING') != 1:
+                return None
+            self.instancing_material_instance = MaterialInstance(self.name + "_instancing",
+                                                                 material=material,
+                                                                 shader_name=self.shader_name)
+
+        if not self.instancing_material_instance.is_ready():
+            return None
+
+        # share the uniform datas of this material instance.
+        for uniform_name, (uniform_buffer, uniform_data) in self.linked_uniform_map.items():
+            self.instancing_material_instance.set_uniform_data(uniform_name, uniform_data)
+        return self.instancing_material_instance
+
+    def update_material_uniform_block(self, uniform_buffer, uniform_data):
+        if self.material_uniform_block is not None and isinstance(uniform_buffer, UniformBlockMember):
+            self.material_uniform_block.set_data(uniform_buffer.uniform_type, uniform_buffer.offset, uniform_data)
+
+    def build_binding_table(self):
+        self.binding_table = [uniform_buffer.get_binder(uniform_data)
+                              for uniform_buffer, uniform_data in self.linked_material_component_map.values()
+                              if not isinstance(uniform_buffer, UniformBlockMember)]
+        if self.material_uniform_block is not None:
+            self.binding_table.append(self.material_uniform_block.bind)
 
     def bind_material_instance(self):
-        for uniform_buffer, uniform_data in self.linked_material_component_map.values():
-            uniform_buffer.bind_uniform(uniform_data)
+        if self.binding_table is None:
+            if not self.is_linked:
+                self.link_material()
+            self.build_binding_table()
+
+        for bind in self.binding_table:
+            bind()
+
+    def get_uniform_slot(self, uniform_name):
+        """
+        :return: the uniform buffer to bind the data of every draw call directly without the name lookup, or None.
+        """
+        if not self.is_linked:
+            self.link_material()
+        uniform = self.linked_uniform_map.get(uniform_name)
+        if uniform:
+            return uniform[0]
+        logger.warn('%s material instance has no %s uniform variable.' % (self.name, uniform_name))
+        return None
 
     def bind_uniform_data(self, uniform_name, uniform_data, num=1, transpose=False):
+        if not self.is_linked:
+            self.link_material()
         uniform = self.linked_uniform_map.get(uniform_name)
         if uniform:
             uniform[0].bind_uniform(uniform_data, num, transpose)
@@ -114,15 +221,23 @@ class MaterialInstance:
             logger.warn('%s material instance has no %s uniform variable.' % (self.name, uniform_name))
 
     def get_uniform_data(self, uniform_name):
+        if not self.is_linked:
+            self.link_material()
         uniform = self.linked_uniform_map.get(uniform_name)
         return uniform[1] if uniform else None
 
     def set_uniform_data(self, uniform_name, uniform_data):
+        if not self.is_linked:
+            self.link_material()
         uniform = self.linked_uniform_map.get(uniform_name)
-        if uniform:
+        if uniform and uniform[1] is not uniform_data:
             uniform[1] = uniform_data
+            self.update_material_uniform_block(uniform[0], uniform_data)
+            self.binding_table = None
 
     def set_uniform_data_from_string(self, uniform_name, str_uniform_data):
+        if not self.is_linked:
+            self.link_material()
         uniform = self.linked_uniform_map.get(uniform_name)
         if uniform:
             uniform_buffer = uniform[0]
@@ -130,6 +245,8 @@ class MaterialInstance:
                 uniform_data = CreateUniformDataFromString(uniform_buffer.uniform_type, str_uniform_data)
                 if uniform_data is not None:
                     uniform[1] = uniform_data
+                    self.update_material_uniform_block(uniform_buffer, uniform_data)
+                    self.binding_table = None
                     return True
         logger.error('%s material instance set data error : %s uniform variable %s.' % (
             self.name, uniform_name, str_uniform_data))
@@ -141,6 +258,8 @@ class MaterialInstance:
         self.material.use_program()
 
     def getAttribute(self):
+        if not self.is_linked:
+            self.link_material()
         self.Attributes.setAttribute('name', self.name)
         self.Attributes.setAttribute('shader_name', self.shader_name)
         self.Attributes.setAttribute('material_name', self.material_name)
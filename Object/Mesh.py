@@ -5,7 +5,8 @@ import numpy as np
 
 from Common import logger
 from OpenGLContext import CreateVertexArrayBuffer, UniformMatrix4
-from Utilities import Attributes, GetClassName, normalize, Matrix4, MATRIX4_IDENTITY
+from Utilities import Attributes, GetClassName, normalize, magnitude, Float3, Matrix4, MATRIX4_IDENTITY, \
+    FLOAT3_ZERO, FLOAT32_MIN, FLOAT32_MAX
 from Object import Skeleton, Animation
 from App import CoreManager
 
@@ -16,6 +17,9 @@ class Geometry:
         self.index = geometry_data.get('index', 0)
         self.vertex_buffer = geometry_data.get('vertex_buffer')
         self.skeleton = geometry_data.get('skeleton')
+        self.bound_min = np.array(geometry_data.get('bound_min', FLOAT3_ZERO), dtype=np.float32)
+        self.bound_max = np.array(geometry_data.get('bound_max', FLOAT3_ZERO), dtype=np.float32)
+        self.radius = geometry_data.get('radius', 0.0)
 
     def create_instance_buffer(self, instance_name, layout_location, element_data):
         self.vertex_buffer.create_instance_buffer(instance_name, layout_location, element_data)
@@ -63,6 +67,8 @@ class Mesh:
                 self.animations.append(None)
 
         self.geometries = []
+        self.bound_min = Float3(FLOAT32_MAX, FLOAT32_MAX, FLOAT32_MAX)
+        self.bound_max = Float3(FLOAT32_MIN, FLOAT32_MIN, FLOAT32_MIN)
         for i, geometry_data in enumerate(mesh_data.get('geometry_datas', [])):
             vertex_buffer = CreateVertexArrayBuffer(geometry_data)
             if vertex_buffer:
@@ -77,14 +83,33 @@ class Mesh:
                     if skeleton.name == geometry_data.get('skeleton_name', ''):
                         break
 
+                # bounding box
+                if 'bound_min' in geometry_data and 'bound_max' in geometry_data:
+                    bound_min = geometry_data['bound_min']
+                    bound_max = geometry_data['bound_max']
+                else:
+                    positions = np.array(geometry_data['positions'], dtype=np.float32)
+                    bound_min = np.min(positions, axis=0)
+                    bound_max = np.max(positions, axis=0)
+
                 # create geometry
                 geometry = Geometry(
                     name=vertex_buffer.name,
                     index=i,
                     vertex_buffer=vertex_buffer,
-                    skeleton=skeleton
+                    skeleton=skeleton,
+                    bound_min=bound_min,
+                    bound_max=bound_max,
+                    radius=geometry_data.get('radius', magnitude(np.subtract(bound_max, bound_min)))
                 )
                 self.geometries.append(geometry)
+                self.bound_min = np.minimum(self.bound_min, geometry.bound_min)
+                self.bound_max = np.maximum(self.bound_max, geometry.bound_max)
+
+        if len(self.geometries) == 0:
+            self.bound_min = Float3()
+            self.bound_max = Float3()
+        self.radius = magnitude(self.bound_max - self.bound_min)
         self.attributes = Attributes()
 
     def has_bone(self):
@@ -233,9 +233,9 @@ class PostProcess:
         self.blur.bind_uniform_data("texture_diffuse", texture_diffuse)
         self.quad_geometry.draw_elements()
 
-    def render_gaussian_blur(self, frame_buffer, texture_target, texture_temp, blur_scale=1.0):
-        frame_buffer.set_color_textures(texture_temp)
-        frame_buffer.bind_framebuffer()
+    def render_gaussian_blur(self, texture_target, texture_temp, blur_scale=1.0):
+        framebuffer_manager = self.renderer.framebuffer_manager
+        framebuffer_manager.bind_framebuffer(texture_temp, depth_texture=None)
 
         self.gaussian_blur.use_program()
         self.gaussian_blur.bind_material_instance()
@@ -243,8 +243,7 @@ class PostProcess:
         self.gaussian_blur.bind_uniform_data("texture_diffuse", texture_target)
         self.quad_geometry.draw_elements()
 
-        frame_buffer.set_color_textures(texture_target)
-        frame_buffer.bind_framebuffer()
+        framebuffer_manager.bind_framebuffer(texture_target, depth_texture=None)
 
         self.gaussian_blur.bind_uniform_data("blur_scale", (0.0, blur_scale))
         self.gaussian_blur.bind_uniform_data("texture_diffuse", texture_temp)
@@ -259,10 +258,13 @@ class PostProcess:
         self.motion_blur.bind_uniform_data("texture_velocity", texture_velocity)
         self.quad_geometry.draw_elements()
 
-    def render_bloom(self, frame_buffer, texture_target):
-        texture_highlight = self.rendertarget_manager.get_temporary('highlight', texture_target)
-        frame_buffer.set_color_textures(texture_highlight)
-        frame_buffer.bind_framebuffer()
+    def render_bloom(self, texture_target, texture_highlight, bloom_targets, temp_bloom_rendertargets):
+        """
+        :param bloom_targets: 4 textures of the 1/2, 1/4, 1/8, 1/16 size of the texture_target.
+        :param temp_bloom_rendertargets: 4 textures of the same size as bloom_targets for the blur.
+        """
+        framebuffer_manager = self.renderer.framebuffer_manager
+        framebuffer_manager.bind_framebuffer(texture_highlight, depth_texture=None)
         self.bloom_highlight.use_program()
         self.bloom_highlight.bind_material_instance()
         self.bloom_highlight.bind_uniform_data('bloom_threshold_min', self.bloom_threshold_min)
@@ -270,21 +272,10 @@ class PostProcess:
         self.bloom_highlight.bind_uniform_data('texture_diffuse', texture_target)
         self.quad_geometry.draw_elements()
 
-        texture_bloom0 = self.rendertarget_manager.get_temporary('bloom0', texture_target, 1.0 / 2.0)
-        texture_bloom1 = self.rendertarget_manager.get_temporary('bloom1', texture_target, 1.0 / 4.0)
-        texture_bloom2 = self.rendertarget_manager.get_temporary('bloom2', texture_target, 1.0 / 8.0)
-        texture_bloom3 = self.rendertarget_manager.get_temporary('bloom3', texture_target, 1.0 / 16.0)
-        texture_bloom0_temp = self.rendertarget_manager.get_temporary('bloom0_temp', texture_target, 1.0 / 2.0)
-        texture_bloom1_temp = self.rendertarget_manager.get_temporary('bloom1_temp', texture_target, 1.0 / 4.0)
-        texture_bloom2_temp = self.rendertarget_manager.get_temporary('bloom2_temp', texture_target, 1.0 / 8.0)
-        texture_bloom3_temp = self.rendertarget_manager.get_temporary('bloom3_temp', texture_target, 1.0 / 16.0)
-
-        bloom_targets = [texture_bloom0, texture_bloom1, texture_bloom2, texture_bloom3]
-        temp_bloom_rendertargets = [texture_bloom0_temp, texture_bloom1_temp, texture_bloom2_temp, texture_bloom3_temp]
+        texture_bloom0, texture_bloom1, texture_bloom2, texture_bloom3 = bloom_targets
 
         def copy_bloom(src, dst):
-            frame_buffer.set_color_textures(dst)
-            frame_buffer.bind_framebuffer()
+            framebuffer_manager.bind_framebuffer(dst, depth_texture=None)
             self.copy_texture(src)
             self.quad_geometry.draw_elements()
 
@@ -299,14 +290,12 @@ class PostProcess:
             bloom_target = bloom_targets[i]
             temp_bloom_target = temp_bloom_rendertargets[i]
 
-            frame_buffer.set_color_textures(temp_bloom_target)
-            frame_buffer.bind_framebuffer()
+            framebuffer_manager.bind_framebuffer(temp_bloom_target, depth_texture=None)
             self.gaussian_blur.bind_uniform_data("blur_scale", (self.bloom_scale, 0.0))
             self.gaussian_blur.bind_uniform_data("texture_diffuse", bloom_target)
             self.quad_geometry.draw_elements()
 
-            frame_buffer.set_color_textures(bloom_target)
-            frame_buffer.bind_framebuffer()
+            framebuffer_manager.bind_framebuffer(bloom_target, depth_texture=None)
             self.gaussian_blur.bind_uniform_data("blur_scale", (0.0, self.bloom_scale))
             self.gaussian_blur.bind_uniform_data("texture_diffuse", temp_bloom_target)
             self.quad_geometry.draw_elements()
@@ -314,8 +303,7 @@ class PostProcess:
         # set additive
         self.renderer.set_blend_state(True, GL_FUNC_ADD, GL_ONE, GL_ONE)
 
-        frame_buffer.set_color_textures(texture_target)
-        frame_buffer.bind_framebuffer()
+        framebuffer_manager.bind_framebuffer(texture_target, depth_texture=None)
         self.bloom.use_program()
         self.bloom.bind_material_instance()
         self.bloom.bind_uniform_data("bloom_intensity", self.bloom_intensity)
@@ -0,0 +1,225 @@
+from collections import OrderedDict
+
+from Common import logger
+
+
+class RenderPass:
+    def __init__(self, name, execute, inputs=(), outputs=(), enable=True, side_effect=False):
+        """
+        :param execute: execute() renders the pass.
+        :param inputs: the resource names which are read in the pass, or function which returns them.
+            ex) the pass which reads the texture selected at runtime.
+        :param outputs: the resource names which are written in the pass. The pass which blends to the resource
+            must have it in the inputs too.
+        :param enable: bool or function which returns bool. The disabled pass is removed before the compile.
+        :param side_effect: the pass is not culled even if the outputs are unused. ex) history of the next frame.
+        """
+        self.name = name
+        self.execute = execute
+        self.inputs = inputs if callable(inputs) else tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.enable = enable
+        self.side_effect = side_effect
+
+    def is_enabled(self):
+        return bool(self.enable() if callable(self.enable) else self.enable)
+
+    def get_inputs(self):
+        return tuple(self.inputs()) if callable(self.inputs) else self.inputs
+
+
+class TransientResource:
+    """
+    The texture which is valid only in the frame. It has the format of the reference resource and scaled size,
+    and the transient resources of the same description share a texture if their lifetimes do not overlap.
+    """
+    def __init__(self, name, reference, scale=1.0):
+        self.name = name
+        self.reference = reference
+        self.scale = scale
+
+    def get_desc(self):
+        return self.reference, self.scale
+
+
+class CompiledRenderGraph:
+    def __init__(self):
+        self.passes = []
+        self.culled_passes = []
+        # [(resource name, writer pass name, reader pass name), ...]
+        self.barriers = []
+        # { transient name : (first pass index, last pass index) }
+        self.lifetimes = OrderedDict()
+        # { transient name : physical resource name }
+        self.physical_resources = OrderedDict()
+
+    def get_pass_names(self):
+        return [render_pass.name for render_pass in self.passes]
+
+
+class RenderGraph:
+    """
+    Declarative frame description. Each pass declares the resources which it reads and writes,
+    and compile derives the dependencies between the passes, culls the passes whose outputs are unused,
+    and assigns the transient resources to the physical resources by their lifetimes.
+    The compile doesn't need the gl context, and the compiled plan is reused until the enabled passes or
+    the outputs of the graph are changed.
+    """
+    def __init__(self, name='RenderGraph'):
+        self.name = name
+        self.passes = []
+        self.transient_resources = OrderedDict()
+        self.outputs = []
+        self.compiled = None
+        self.compiled_key = None
+        self.compile_count = 0
+
+        # allocate_transient(physical_name, reference, scale) returns the texture.
+        self.allocate_transient = None
+        # release_transient(physical_name) is called when the physical resource is not used any more.
+        self.release_transient = None
+        self.allocated_transients = {}
+
+    def clear(self):
+        self.passes = []
+        self.transient_resources = OrderedDict()
+        self.outputs = []
+        self.invalidate()
+
+    def invalidate(self):
+        self.compiled = None
+        self.compiled_key = None
+
+    def add_pass(self, name, execute, inputs=(), outputs=(), enable=True, side_effect=False):
+        render_pass = RenderPass(name, execute, inputs, outputs, enable, side_effect)
+        self.passes.append(render_pass)
+        self.invalidate()
+        return render_pass
+
+    def add_transient_resource(self, name, reference, scale=1.0):
+        self.transient_resources[name] = TransientResource(name, reference, scale)
+        self.invalidate()
+
+    def set_outputs(self, *outputs):
+        self.outputs = list(outputs)
+
+    def get_compile_key(self):
+        return tuple(render_pass.get_inputs() if render_pass.is_enabled() else None for render_pass in self.passes), \
+            tuple(self.outputs)
+
+    def get_compiled(self):
+        compile_key = self.get_compile_key()
+        if self.compiled is None or self.compiled_key != compile_key:
+            self.compiled = self.compile()
+            self.compiled_key = compile_key
+        return self.compiled
+
+    def compile(self):
+        self.compile_count += 1
+        compiled = CompiledRenderGraph()
+        passes = [render_pass for render_pass in self.passes if render_pass.is_enabled()]
+        pass_inputs = [render_pass.get_inputs() for render_pass in passes]
+        pass_count = len(passes)
+
+        # The passes are declared in the submission order, so a pass depends on the previous writer of the resources
+        # which it reads. The write after read and write after write hazards keep the declaration order.
+        read_dependencies = [[] for i in range(pass_count)]  # [(resource, writer index), ...]
+        last_writer = {}
+        for index, render_pass in enumerate(passes):
+            for resource in pass_inputs[index]:
+                if resource in last_writer:
+                    read_dependencies[index].append((resource, last_writer[resource]))
+                elif resource in self.transient_resources:
+                    error_msg = "%s : %s pass reads %s before it is written." % (self.name, render_pass.name, resource)
+                    logger.error(error_msg)
+                    raise BaseException(error_msg)
+                # otherwise the resource is written before this frame. ex) the history of the previous frame
+
+            for resource in render_pass.outputs:
+                last_writer[resource] = index
+
+        # cull the passes which don't contribute to the outputs of the graph.
+        used = [False, ] * pass_count
+        stack = [index for index, render_pass in enumerate(passes) if render_pass.side_effect]
+        stack += [last_writer[resource] for resource in self.outputs if resource in last_writer]
+        while stack:
+            index = stack.pop()
+            if not used[index]:
+                used[index] = True
+                stack += [writer for resource, writer in read_dependencies[index]]
+        order = [index for index in range(pass_count) if used[index]]
+
+        compiled.passes = [passes[index] for index in order]
+        compiled.culled_passes = [render_pass.name for index, render_pass in enumerate(passes) if not used[index]]
+
+        # the resource written by a pass is read by the next passes.
+        for index in order:
+            for resource, writer in read_dependencies[index]:
+                compiled.barriers.append((resource, passes[writer].name, passes[index].name))
+
+        # lifetimes of the transient resources
+        for position, index in enumerate(order):
+            for resource in pass_inputs[index] + passes[index].outputs:
+                if resource in self.transient_resources:
+                    first, last = compiled.lifetimes.get(resource, (position, position))
+                    compiled.lifetimes[resource] = (min(first, position), max(last, position))
+
+        # alias the transient resources of the same description which have the non-overlapping lifetimes.
+        physical_resources = {}  # { desc : [last pass index of each physical resource, ...] }
+        for resource, (first, last) in sorted(compiled.lifetimes.items(), key=lambda item: item[1]):
+            transient_resource = self.transient_resources[resource]
+            desc = transient_resource.get_desc()
+            slots = physical_resources.setdefault(desc, [])
+            for slot, slot_last in enumerate(slots):
+                if slot_last < first:
+                    slots[slot] = last
+                    break
+            else:
+                slot = len(slots)
+                slots.append(last)
+            compiled.physical_resources[resource] = "%s_%g_%d" % (transient_resource.reference,
+                                                                  transient_resource.scale, slot)
+        return compiled
+
+    def get_transient(self, name):
+        """
+        :return: the texture of the transient resource in the compiled plan.
+        """
+        physical_name = self.compiled.physical_resources[name]
+        texture = self.allocated_transients.get(physical_name)
+        if texture is None:
+            transient_resource = self.transient_resources[name]
+            texture = self.allocate_transient(physical_name, transient_resource.reference, transient_resource.scale)
+            self.allocated_transients[physical_name] = texture
+        return texture
+
+    def release_unused_transients(self, compiled):
+        physical_names = set(compiled.physical_resources.values())
+        for physical_name in list(self.allocated_transients.keys()):
+            if physical_name not in physical_names:
+                self.allocated_transients.pop(physical_name)
+                if self.release_transient is not None:
+                    self.release_transient(physical_name)
+
+    def clear_transients(self):
+        """
+        Forget the allocated textures. ex) The render targets are recreated.
+        """
+        self.allocated_transients = {}
+
+    def execute(self):
+        compiled = self.compiled
+        if compiled is not self.get_compiled():
+            compiled = self.compiled
+            self.release_unused_transients(compiled)
+            logger.info("%s : %s" % (self.name, ", ".join(compiled.get_pass_names())))
+
+        for render_pass in compiled.passes:
+            render_pass.execute()
+
+    def get_log(self):
+        if self.compiled is None:
+            return "%s : not compiled" % self.name
+        return "%s : %d passes, %d culled, %d transients (%d textures)" % (
+            self.name, len(self.compiled.passes), len(self.compiled.culled_passes), len(self.compiled.lifetimes),
+            len(set(self.compiled.physical_resources.values())))
@@ -1,3 +1,10 @@
+import numpy as np
+
+from OpenGLContext import InstanceBuffer
+from Utilities import MATRIX4_IDENTITY
+from .TransformObject import TransformSystem
+
+
 class RenderInfo:
     def __init__(self):
         self.actor = None
@@ -22,57 +29,87 @@ class RenderInfo:
 
 
 class RenderInstanceInfo:
-    def __init__(self):
-        self.actor = None
-        self.geometry = None
-        self.material_instance = None
-        self.model_instance_data = []
-        self.model_instance_location = -1
+    """
+    A batch of static actors which have the same geometry and material instance.
+    The visible model matrices of the batch are drawn at once with glDrawElementsInstanced.
+    Each culling view has its own instance buffer, which is uploaded again only when the actors moved
+    or the visibility is changed.
+    """
+    def __init__(self, geometry, material_instance, model_instance_location):
+        self.geometry = geometry
+        self.material = material_instance.material
+        self.material_instance = material_instance
+        self.render_infos = []
+        self.item_indices = None
+        self.transform_indices = None
+        self.transform_system = None
+        self.model_instance_location = model_instance_location
+        self.instance_buffers = {}  # { culling name : InstanceBuffer }
+        self.instance_counts = {}
+        self.visible_masks = {}
+        self.uploaded_names = set()
+
+    def delete(self):
+        for instance_buffer in self.instance_buffers.values():
+            instance_buffer.delete()
+        self.instance_buffers = {}
+
+    def build(self):
+        self.transform_system = TransformSystem.instance()
+        self.transform_indices = np.array([render_info.actor.transform.index for render_info in self.render_infos],
+                                          dtype=np.int32)
+        self.uploaded_names = set()
+
+    def update_instance_data(self):
+        # The model matrices are uploaded again only if any actor of the batch has moved.
+        if self.transform_system.updated[self.transform_indices].any():
+            self.uploaded_names.clear()
+
+    def bind_instance_buffer(self, culling):
+        """
+        :param culling: FrustumCulling
+        :return: visible instance count
+        """
+        visible = culling.visible[self.item_indices]
+        name = culling.name
+        if name not in self.instance_buffers:
+            self.instance_buffers[name] = InstanceBuffer(name="model",
+                                                         layout_location=self.model_instance_location,
+                                                         element_data=MATRIX4_IDENTITY)
+
+        instance_data = None
+        if name not in self.uploaded_names or not np.array_equal(visible, self.visible_masks[name]):
+            instance_data = self.transform_system.matrix[self.transform_indices[visible]]
+            self.instance_counts[name] = len(instance_data)
+            self.visible_masks[name] = visible
+            self.uploaded_names.add(name)
+
+        instance_count = self.instance_counts[name]
+        if 0 < instance_count:
+            self.instance_buffers[name].bind_instance_buffer(instance_data)
+        return instance_count
+
+    def unbind_instance_buffer(self, culling):
+        self.instance_buffers[culling.name].unbind_instance_buffer()
 
     @staticmethod
-    def gather_render_infos(actor_list, check_actor_change, model_instance_location, solid_render_infos,
-                            translucent_render_infos):
-        last_actor = None
-        last_geometry = None
-        last_material_instance = None
-
-        render_info = None
-        new_render_info = True
-        for actor in actor_list:
-            for geometry in actor.get_geometries():
-                material_instance = actor.get_material_instance(geometry.index)
-                if last_geometry != geometry:
-                    new_render_info = True
-                elif last_material_instance != material_instance:
-                    new_render_info = True
-                elif check_actor_change and last_actor != actor:
-                    new_render_info = True
-
-                if new_render_info and geometry  is not None and material_instance is not None:
-                    # convert to numpy array.
-                    if render_info:
-                        render_info.model_instance_data = np.array(render_info.model_instance_data, np.float32)
-
-                    render_info = RenderInfo()
-                    render_info.actor = actor
-                    render_info.geometry = geometry
-                    render_info.material_instance = material_instance
-                    render_info.material = material_instance.material
-                    render_info.model_instance_location = model_instance_location
-                    if render_info.material_instance.is_translucent():
-                        translucent_render_infos.append(render_info)
-                    else:
-                        solid_render_infos.append(render_info)
-                    new_render_info = False
-
-                # append instance data
-                if render_info:
-                    render_info.model_instance_data.append(actor.transform.matrix)
-
-                last_actor = actor
-                last_geometry = geometry
-                last_material_instance = material_instance
-        else:
-            # At the end, you should convert to numpy.array unconditionally.
-            if render_info:
-                render_info.model_instance_data = np.array(render_info.model_instance_data, np.float32)
\ No newline at end of file
+    def gather_render_infos(render_infos, render_instance_infos):
+        """
+        :param render_infos: RenderInfo list sorted by geometry and material instance.
+        """
+        render_instance_info = None
+        for render_info in render_infos:
+            geometry = render_info.geometry
+            material_instance = render_info.material_instance
+            if geometry is None or material_instance is None:
+                continue
+
+            if render_instance_info is None or render_instance_info.geometry != geometry or \
+                    render_instance_info.material_instance != material_instance:
+                model_instance_location = render_info.actor.model.mesh.instance_location_model
+                render_instance_info = RenderInstanceInfo(geometry, material_instance, model_instance_location)
+                render_instance_infos.append(render_instance_info)
+            render_instance_info.render_infos.append(render_info)
+
+        for render_instance_info in render_instance_infos:
+            render_instance_info.build()
@@ -6,6 +6,7 @@ class RenderOption:
     RENDER_LIGHT_PROBE = False
     RENDER_FONT = True
     RENDER_STATIC_ACTOR = True
+    RENDER_INSTANCING = True
     RENDER_SKELETON_ACTOR = True
 
 
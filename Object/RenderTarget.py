@@ -1,7 +1,3 @@
-import random
-
-import numpy as np
-
 from OpenGL.GL import *
 from OpenGL.GL.ARB.framebuffer_object import *
 from OpenGL.GL.EXT.framebuffer_object import *
@@ -55,9 +51,15 @@ class RenderTargetManager(Singleton):
         self.clear()
 
     def clear(self):
+        self.clear_framebuffers()
         self.clear_rendertargets()
         self.clear_temp_rendertargets()
 
+    def clear_framebuffers(self):
+        # the cached frame buffers refer to the render targets.
+        if self.renderer.framebuffer_manager is not None:
+            self.renderer.framebuffer_manager.clear()
+
     def clear_rendertargets(self):
         for key, rendertarget in self.rendertargets.items():
             rendertarget.delete()
@@ -68,6 +70,9 @@ class RenderTargetManager(Singleton):
         for key, rendertarget in self.temp_rendertargets.items():
             rendertarget.delete()
         self.temp_rendertargets = dict()
+        # the transient resources of the render graph are the temporary render targets.
+        if self.renderer.render_graph is not None:
+            self.renderer.render_graph.clear_transients()
         self.core_manager.gc_collect()
 
     def find_rendertarget(self, rendertarget_index, rendertarget_name):
@@ -102,6 +107,15 @@ class RenderTargetManager(Singleton):
             logger.warn("Failed to get temporary %s render target." % rendertarget_name)
         return temp_rendertarget
 
+    def release_temporary(self, rendertarget_name):
+        if rendertarget_name in self.temp_rendertargets:
+            temp_rendertarget = self.temp_rendertargets.pop(rendertarget_name)
+            if self.renderer.framebuffer_manager is not None:
+                self.renderer.framebuffer_manager.delete_framebuffers_of(temp_rendertarget)
+            if self.renderer.debug_texture is temp_rendertarget:
+                self.renderer.set_debug_texture(None)
+            temp_rendertarget.delete()
+
     def create_rendertarget(self, rendertarget_name, **kwargs):
         datas = Data(**kwargs)
         option = datas.option or Option.NONE
@@ -136,6 +150,7 @@ class RenderTargetManager(Singleton):
         return rendertarget
 
     def recreate_rendertargets(self):
+        self.clear_framebuffers()
         for rendertarget_name in self.rendertargets:
             rendertarget = self.rendertargets[rendertarget_name]
             datas = rendertarget.get_save_data(get_image_data=False)
@@ -329,27 +344,8 @@ class RenderTargetManager(Singleton):
             wrap=GL_CLAMP
         )
 
-        texture_size = 256
-        texture_data = np.zeros((texture_size * texture_size, 3), dtype=np.float16)
-        for i in range(texture_size * texture_size):
-            texture_data[i][0] = random.uniform(-1.0, 1.0)
-            texture_data[i][1] = 0.0
-            texture_data[i][2] = random.uniform(-1.0, 1.0)
-            texture_data[i][:] = normalize(texture_data[i])
-
-        RenderTargets.SSAO_ROTATION_NOISE = self.create_rendertarget(
-            "SSAO_ROTATION_NOISE",
-            texture_type=Texture2D,
-            width=texture_size,
-            height=texture_size,
-            internal_format=GL_RGB16F,
-            texture_format=GL_RGB,
-            data_type=GL_FLOAT,
-            min_filter=GL_LINEAR,
-            mag_filter=GL_LINEAR,
-            wrap=GL_REPEAT,
-            data=texture_data
-        )
+        # the noise doesn't depend on the screen size, so it's the procedural texture resource.
+        RenderTargets.SSAO_ROTATION_NOISE = self.core_manager.resource_manager.getTexture('ssao_rotation_noise')
 
         RenderTargets.VELOCITY = self.create_rendertarget(
             "VELOCITY",
@@ -10,8 +10,10 @@ from PIL import Image
 
 from Common import logger, log_level, COMMAND
 from Utilities import *
-from OpenGLContext import FrameBuffer, FrameBufferManager, RenderBuffer, UniformMatrix4, UniformBlock
+from OpenGLContext import FrameBuffer, FrameBufferManager, RenderBuffer, UniformMatrix4, UniformBlock, \
+    FrameRingBuffer, GLStateCache
 from .PostProcess import AntiAliasing, PostProcess
+from .RenderGraph import RenderGraph
 from .RenderTarget import RenderTargets
 from .RenderOptions import RenderOption, RenderingType, RenderGroup, RenderMode
 
@@ -32,14 +34,13 @@ class Renderer(Singleton):
         self.rendertarget_manager = None
         self.framebuffer_manager = None
         self.postprocess = None
+        self.render_graph = None
+        self.gl_state_cache = GLStateCache.instance()
 
         # components
         self.lastShader = None
         self.screen = None
         self.framebuffer = None
-        self.framebuffer_shadow = None
-        self.framebuffer_copy = None
-        self.framebuffer_msaa = None
         self.debug_texture = None
 
         self.blend_enable = False
@@ -81,12 +82,17 @@ class Renderer(Singleton):
         self.postprocess = PostProcess()
         self.postprocess.initialize()
 
+        # the render passes bind the cached frame buffers of the render targets.
         self.framebuffer_manager = FrameBufferManager()
-
+        # the frame buffer of the atmosphere precomputation. The attachments are changed every time.
         self.framebuffer = FrameBuffer()
-        self.framebuffer_shadow = FrameBuffer()
-        self.framebuffer_copy = FrameBuffer()
-        self.framebuffer_msaa = FrameBuffer()
+
+        # the per-frame uniform blocks and instance datas are written to the frame ring buffer.
+        FrameRingBuffer.instance().initialize(size_per_frame=4 * 1024 * 1024, frame_count=3)
+
+        # the passes of a frame. The compiled plan is reused until the render options are changed.
+        self.render_graph = RenderGraph('FrameGraph')
+        self.build_render_graph()
 
         # Test Code : scene constants uniform buffer
         material_instance = self.resource_manager.getMaterialInstance('scene_constants')
@@ -130,7 +136,7 @@ class Renderer(Singleton):
         self.core_manager.sendRenderingTypeList(rendering_type_list)
 
     def close(self):
-        pass
+        FrameRingBuffer.instance().delete()
 
     def set_blend_state(self, blend_enable=True, equation=GL_FUNC_ADD, func_src=GL_SRC_ALPHA,
                         func_dst=GL_ONE_MINUS_SRC_ALPHA):
@@ -144,11 +150,11 @@ class Renderer(Singleton):
             self.blend_equation = equation
             self.blend_func_src = func_src
             self.blend_func_dst = func_dst
-            glEnable(GL_BLEND)
-            glBlendEquation(equation)
-            glBlendFunc(func_src, func_dst)
+            self.gl_state_cache.enable(GL_BLEND)
+            self.gl_state_cache.blend_equation(equation)
+            self.gl_state_cache.blend_func(func_src, func_dst)
         else:
-            glDisable(GL_BLEND)
+            self.gl_state_cache.disable(GL_BLEND)
 
     def restore_blend_state_prev(self):
         self.set_blend_state(self.blend_enable_prev,
@@ -182,9 +188,10 @@ class Renderer(Singleton):
         # resize render targets
         if changed:
             self.rendertarget_manager.create_rendertargets()
-            self.framebuffer_manager.clear()
             if self.scene_manager.atmosphere:
                 self.scene_manager.atmosphere.initialize()
+            # the atmosphere precomputation changes the gl states directly.
+            self.gl_state_cache.invalidate()
         self.core_manager.gc_collect()
 
     def ortho_view(self):
@@ -248,14 +255,8 @@ class Renderer(Singleton):
 
             dst_texture = self.scene_manager.main_light_probe.get_texture(cube_dir)
 
-            self.framebuffer.set_color_textures(RenderTargets.HDR)
-            self.framebuffer.bind_framebuffer()
-            self.framebuffer_copy.set_color_textures(dst_texture)
-            self.framebuffer_copy.bind_framebuffer()
-            self.framebuffer_copy.mirror_framebuffer(self.framebuffer)
-
-            # generate mipmaps per face
-            dst_texture.generate_mipmap()
+            # the faces are reused for each capture, so the frame buffers of the faces are cached.
+            self.framebuffer_manager.mirror_framebuffer(RenderTargets.HDR, dst_texture)
 
         self.scene_manager.main_light_probe.generate_texture_faces()
         pos = self.scene_manager.main_light_probe.transform.getPos()
@@ -292,6 +293,12 @@ class Renderer(Singleton):
         if not camera or not light:
             return
 
+        self.scene_manager.update_culling()
+
+        frame_ring_buffer = FrameRingBuffer.instance()
+        frame_ring_buffer.begin_frame()
+        self.gl_state_cache.begin_frame()
+
         self.uniformSceneConstants.bind_uniform_block(
             Float4(self.core_manager.currentTime,
                    self.core_manager.frame_count if self.postprocess.anti_aliasing else 0.0,
@@ -317,60 +324,34 @@ class Renderer(Singleton):
                                                       light.shadow_view_projection)
 
         self.set_blend_state(False)
-        glPolygonMode(GL_FRONT_AND_BACK, self.viewMode)
+        self.gl_state_cache.polygon_mode(GL_FRONT_AND_BACK, self.viewMode)
         # glEnable(GL_FRAMEBUFFER_SRGB)
-        glEnable(GL_MULTISAMPLE)
-        glDepthFunc(GL_LEQUAL)
-        glEnable(GL_CULL_FACE)
-        glFrontFace(GL_CCW)
-        glEnable(GL_DEPTH_TEST)
-        glDepthMask(True)
+        self.gl_state_cache.enable(GL_MULTISAMPLE)
+        self.gl_state_cache.depth_func(GL_LEQUAL)
+        self.gl_state_cache.depth_mask(True)
 
-        if self.render_option_manager.rendering_type == RenderingType.DEFERRED_RENDERING:
-            self.render_deferred()
+        # the light probe needs only the HDR target, so the post processes are culled.
+        if RenderOption.RENDER_LIGHT_PROBE:
+            self.render_graph.set_outputs('HDR')
         else:
-            self.render_pre_pass()
-
-        glDisable(GL_DEPTH_TEST)
-        self.render_preprocess()
-
-        glFrontFace(GL_CW)
-        glEnable(GL_DEPTH_TEST)
-        self.render_shadow()
-
-        glFrontFace(GL_CCW)
-        glDepthMask(False)  # cause depth prepass and gbuffer
-        self.framebuffer.set_color_textures(RenderTargets.HDR)
-        self.framebuffer.set_depth_texture(RenderTargets.DEPTHSTENCIL)
-        self.framebuffer.bind_framebuffer()
-        self.render_solid()
-
-        self.set_blend_state(True, GL_FUNC_ADD, GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-        self.render_translucent()
+            self.render_graph.set_outputs('BACKBUFFER')
+        self.render_graph.execute()
 
         if RenderOption.RENDER_LIGHT_PROBE:
-            glUseProgram(0)
+            self.gl_state_cache.use_program(0)
+            frame_ring_buffer.end_frame()
             endTime = timeModule.perf_counter()
             renderTime = endTime - startTime
             presentTime = 0.0
             return renderTime, presentTime
 
-        glDisable(GL_DEPTH_TEST)
-        glDisable(GL_CULL_FACE)
-        self.set_blend_state(False)
-        self.render_postprocess()
-
-        if RenderOption.RENDER_FONT:
-            self.set_blend_state(True, GL_FUNC_ADD, GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-            self.render_font()
-
         # reset shader program
-        glUseProgram(0)
+        self.gl_state_cache.use_program(0)
 
         # blit frame buffer
-        self.framebuffer.set_color_textures(RenderTargets.BACKBUFFER)
-        self.framebuffer.bind_framebuffer()
-        self.framebuffer.blit_framebuffer(self.width, self.height)
+        framebuffer = self.framebuffer_manager.bind_framebuffer(RenderTargets.BACKBUFFER, depth_texture=None)
+        framebuffer.blit_framebuffer(self.width, self.height)
+        frame_ring_buffer.end_frame()
 
         endTime = timeModule.perf_counter()
         renderTime = endTime - startTime
@@ -382,76 +363,199 @@ class Renderer(Singleton):
         presentTime = timeModule.perf_counter() - startTime
         return renderTime, presentTime
 
-    def render_pre_pass(self):
-        self.framebuffer.set_color_textures(RenderTargets.WORLD_NORMAL)
-        self.framebuffer.set_depth_texture(RenderTargets.DEPTHSTENCIL)
-        self.framebuffer.bind_framebuffer()
-        glClearBufferfv(GL_DEPTH, 0, (1.0, 1.0, 1.0, 1.0))
+    def build_render_graph(self):
+        """
+        Declare the render passes of a frame. The resource names are the names of RenderTargets,
+        and the lower case names are the transient resources of the render graph.
+        """
+        render_graph = self.render_graph
+        render_graph.clear()
+        render_graph.allocate_transient = lambda name, reference, scale: self.rendertarget_manager.get_temporary(
+            name, getattr(RenderTargets, reference), scale)
+        render_graph.release_transient = self.rendertarget_manager.release_temporary
+
+        def is_deferred():
+            return self.render_option_manager.rendering_type == RenderingType.DEFERRED_RENDERING
+
+        def is_forward():
+            return not is_deferred()
+
+        def is_render_postprocess():
+            return not RenderOption.RENDER_LIGHT_PROBE
+
+        def is_render_taa():
+            return is_render_postprocess() and AntiAliasing.TAA == self.postprocess.anti_aliasing
+
+        def is_render_debug_texture():
+            return is_render_postprocess() and self.debug_texture is not None and \
+                self.debug_texture is not RenderTargets.BACKBUFFER and type(self.debug_texture) != RenderBuffer
+
+        render_graph.add_transient_resource('bloom_highlight', 'HDR')
+        for i in range(4):
+            scale = 1.0 / float(2 << i)
+            render_graph.add_transient_resource('bloom%d' % i, 'HDR', scale)
+            render_graph.add_transient_resource('bloom%d_temp' % i, 'HDR', scale)
+        render_graph.add_transient_resource('backbuffer_copy', 'BACKBUFFER')
+
+        gbuffer = ('DIFFUSE', 'MATERIAL', 'WORLD_NORMAL', 'DEPTHSTENCIL')
+        render_graph.add_pass('gbuffer', self.render_gbuffer, outputs=gbuffer, enable=is_deferred)
+        render_graph.add_pass('pre_pass', self.render_pre_pass, outputs=('WORLD_NORMAL', 'DEPTHSTENCIL'),
+                              enable=is_forward)
+        render_graph.add_pass('velocity', self.render_velocity, inputs=('DEPTHSTENCIL',), outputs=('VELOCITY',))
+        render_graph.add_pass('gbuffer_skeletal', self.render_gbuffer_skeletal,
+                              inputs=gbuffer + ('VELOCITY',), outputs=gbuffer + ('VELOCITY',),
+                              enable=lambda: is_deferred() and RenderOption.RENDER_SKELETON_ACTOR)
+        render_graph.add_pass('pre_pass_skeletal', self.render_pre_pass_skeletal,
+                              inputs=('WORLD_NORMAL', 'VELOCITY', 'DEPTHSTENCIL'),
+                              outputs=('WORLD_NORMAL', 'VELOCITY', 'DEPTHSTENCIL'),
+                              enable=lambda: is_forward() and RenderOption.RENDER_SKELETON_ACTOR)
+        # reflects the HDR of the previous frame.
+        render_graph.add_pass('screen_space_reflection', self.render_screen_space_reflection,
+                              inputs=('HDR', 'WORLD_NORMAL', 'VELOCITY', 'DEPTHSTENCIL'),
+                              outputs=('SCREEN_SPACE_REFLECTION',), enable=lambda: self.postprocess.is_render_ssr)
+        render_graph.add_pass('linear_depth', self.render_linear_depth, inputs=('DEPTHSTENCIL',),
+                              outputs=('LINEAR_DEPTH',))
+        render_graph.add_pass('ssao', self.render_ssao, inputs=('WORLD_NORMAL', 'LINEAR_DEPTH'), outputs=('SSAO',),
+                              enable=lambda: self.postprocess.is_render_ssao)
+        render_graph.add_pass('shadow', self.render_shadow, outputs=('SHADOWMAP',))
+        render_graph.add_pass('solid', self.render_solid,
+                              inputs=gbuffer + ('SHADOWMAP', 'SSAO', 'SCREEN_SPACE_REFLECTION'),
+                              outputs=('HDR',))
+        render_graph.add_pass('translucent', self.render_translucent,
+                              inputs=('HDR', 'DEPTHSTENCIL', 'LINEAR_DEPTH', 'SHADOWMAP', 'SSAO',
+                                      'SCREEN_SPACE_REFLECTION'),
+                              outputs=('HDR',))
+
+        # post processes
+        render_graph.add_pass('precomputed_atmosphere', self.render_precomputed_atmosphere,
+                              inputs=('HDR', 'LINEAR_DEPTH'), outputs=('HDR',), enable=is_render_postprocess)
+        render_graph.add_pass('bloom', self.render_bloom, inputs=('HDR',),
+                              outputs=('HDR', 'bloom_highlight', 'bloom0', 'bloom1', 'bloom2', 'bloom3',
+                                       'bloom0_temp', 'bloom1_temp', 'bloom2_temp', 'bloom3_temp'),
+                              enable=lambda: is_render_postprocess() and self.postprocess.is_render_bloom)
+        render_graph.add_pass('copy_hdr', self.render_copy_hdr, inputs=('HDR',), outputs=('HDR_PREV',),
+                              enable=is_render_postprocess)
+        render_graph.add_pass('temporal_antialiasing', self.render_temporal_antialiasing,
+                              inputs=('HDR_PREV', 'TAA_RESOLVE', 'VELOCITY', 'LINEAR_DEPTH'), outputs=('HDR',),
+                              enable=is_render_taa)
+        # the resolved image is the history of the next frame.
+        render_graph.add_pass('copy_taa_resolve', self.render_copy_taa_resolve, inputs=('HDR',),
+                              outputs=('TAA_RESOLVE',), enable=is_render_taa, side_effect=True)
+        render_graph.add_pass('tone_map', self.render_tone_map, inputs=('HDR',), outputs=('BACKBUFFER',),
+                              enable=is_render_postprocess)
+        render_graph.add_pass('msaa_resolve', self.render_msaa_resolve, inputs=('HDR',), outputs=('BACKBUFFER',),
+                              enable=lambda: is_render_postprocess() and
+                              AntiAliasing.MSAA == self.postprocess.anti_aliasing)
+        render_graph.add_pass('motion_blur', self.render_motion_blur, inputs=('VELOCITY', 'BACKBUFFER'),
+                              outputs=('backbuffer_copy', 'BACKBUFFER'),
+                              enable=lambda: is_render_postprocess() and self.postprocess.is_render_motion_blur)
+        # the debug texture is drawn over the back buffer, and the pass which writes it must not be culled.
+        render_graph.add_pass('debug_texture', self.render_debug_texture,
+                              inputs=lambda: ('BACKBUFFER', self.debug_texture.name), outputs=('BACKBUFFER',),
+                              enable=is_render_debug_texture)
+        render_graph.add_pass('font', self.render_font, inputs=('BACKBUFFER',), outputs=('BACKBUFFER',),
+                              enable=lambda: is_render_postprocess() and RenderOption.RENDER_FONT)
+
+    def set_geometry_state(self, front_face=GL_CCW):
+        self.set_blend_state(False)
+        self.gl_state_cache.enable(GL_CULL_FACE)
+        self.gl_state_cache.front_face(front_face)
+        self.gl_state_cache.enable(GL_DEPTH_TEST)
 
-        camera = self.scene_manager.main_camera
-        self.uniformViewProjection.bind_uniform_block(camera.view_projection, camera.prev_view_projection, )
+    def set_screen_state(self):
+        self.set_blend_state(False)
+        self.gl_state_cache.disable(GL_DEPTH_TEST)
+        self.gl_state_cache.disable(GL_CULL_FACE)
+        self.postprocess.bind_quad()
 
-        # render background normal, depth
-        material_instance = self.resource_manager.getMaterialInstance("pre_pass")
-        self.render_actors(RenderGroup.STATIC_ACTOR, RenderMode.PRE_PASS,
-                           self.scene_manager.static_solid_render_infos, material_instance)
+    def bind_camera_view_projection(self):
+        camera = self.scene_manager.main_camera
+        self.uniformViewProjection.bind_uniform_block(camera.view_projection, camera.prev_view_projection)
 
-        # render velocity
-        self.postprocess.bind_quad()
-        self.framebuffer_manager.bind_framebuffer(RenderTargets.VELOCITY, depth_texture=None)
-        self.postprocess.render_velocity(RenderTargets.DEPTHSTENCIL)
+    def render_pre_pass(self):
+        self.set_geometry_state()
+        self.framebuffer_manager.bind_framebuffer(RenderTargets.WORLD_NORMAL, depth_texture=RenderTargets.DEPTHSTENCIL)
+        glClearBufferfv(GL_DEPTH, 0, (1.0, 1.0, 1.0, 1.0))
+        self.bind_camera_view_projection()
 
-        # render character normal, velocity
-        if RenderOption.RENDER_SKELETON_ACTOR:
-            self.framebuffer.set_color_textures(RenderTargets.WORLD_NORMAL, RenderTargets.VELOCITY)
-            self.framebuffer.bind_framebuffer()
-            material_instance = self.resource_manager.getMaterialInstance(name="pre_pass_skeletal",
+        # render background normal, depth
+        if RenderOption.RENDER_INSTANCING:
+            material_instance = self.resource_manager.getMaterialInstance(name="pre_pass_instancing",
                                                                           shader_name="pre_pass",
-                                                                          macros={"SKELETAL": 1})
-            self.render_actors(RenderGroup.SKELETON_ACTOR, RenderMode.PRE_PASS,
-                               self.scene_manager.skeleton_solid_render_infos, material_instance)
+                                                                          macros={"INSTANCING": 1})
+            self.render_actors_instancing(RenderMode.PRE_PASS,
+                                          self.scene_manager.static_solid_render_instance_infos,
+                                          self.scene_manager.main_culling, material_instance)
+        else:
+            material_instance = self.resource_manager.getMaterialInstance("pre_pass")
+            self.render_actors(RenderGroup.STATIC_ACTOR, RenderMode.PRE_PASS,
+                               self.scene_manager.visible_static_solid_render_infos, material_instance)
 
-    def render_deferred(self):
+    def render_pre_pass_skeletal(self):
+        # render character normal, velocity
+        self.set_geometry_state()
+        self.framebuffer_manager.bind_framebuffer(RenderTargets.WORLD_NORMAL, RenderTargets.VELOCITY,
+                                                  depth_texture=RenderTargets.DEPTHSTENCIL)
+        self.bind_camera_view_projection()
+        material_instance = self.resource_manager.getMaterialInstance(name="pre_pass_skeletal",
+                                                                      shader_name="pre_pass",
+                                                                      macros={"SKELETAL": 1})
+        self.render_actors(RenderGroup.SKELETON_ACTOR, RenderMode.PRE_PASS,
+                           self.scene_manager.skeleton_solid_render_infos, material_instance)
+
+    def render_gbuffer(self):
+        self.set_geometry_state()
         framebuffer = self.framebuffer_manager.bind_framebuffer(RenderTargets.DIFFUSE,
                                                                 RenderTargets.MATERIAL,
                                                                 RenderTargets.WORLD_NORMAL,
                                                                 depth_texture=RenderTargets.DEPTHSTENCIL)
         framebuffer.clear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT, (0.0, 0.0, 0.0, 0.0))
-
-        camera = self.scene_manager.main_camera
-        self.uniformViewProjection.bind_uniform_block(camera.view_projection, camera.prev_view_projection, )
+        self.bind_camera_view_projection()
 
         # render static gbuffer
-        self.render_actors(RenderGroup.STATIC_ACTOR, RenderMode.GBUFFER,
-                           self.scene_manager.static_solid_render_infos)
+        if RenderOption.RENDER_INSTANCING:
+            self.render_actors_instancing(RenderMode.GBUFFER, self.scene_manager.static_solid_render_instance_infos,
+                                          self.scene_manager.main_culling)
+        else:
+            self.render_actors(RenderGroup.STATIC_ACTOR, RenderMode.GBUFFER,
+                               self.scene_manager.visible_static_solid_render_infos)
 
-        # render velocity
-        self.postprocess.bind_quad()
+    def render_gbuffer_skeletal(self):
+        # render character gbuffer
+        self.set_geometry_state()
+        self.framebuffer_manager.bind_framebuffer(RenderTargets.DIFFUSE,
+                                                  RenderTargets.MATERIAL,
+                                                  RenderTargets.WORLD_NORMAL,
+                                                  RenderTargets.VELOCITY,
+                                                  depth_texture=RenderTargets.DEPTHSTENCIL)
+        self.bind_camera_view_projection()
+        self.render_actors(RenderGroup.SKELETON_ACTOR, RenderMode.GBUFFER,
+                           self.scene_manager.skeleton_solid_render_infos)
+
+    def render_velocity(self):
+        self.set_screen_state()
         self.framebuffer_manager.bind_framebuffer(RenderTargets.VELOCITY, depth_texture=None)
         self.postprocess.render_velocity(RenderTargets.DEPTHSTENCIL)
 
-        # render character gbuffer
-        if RenderOption.RENDER_SKELETON_ACTOR:
-            self.framebuffer_manager.bind_framebuffer(RenderTargets.DIFFUSE,
-                                                      RenderTargets.MATERIAL,
-                                                      RenderTargets.WORLD_NORMAL,
-                                                      RenderTargets.VELOCITY,
-                                                      depth_texture=RenderTargets.DEPTHSTENCIL)
-            self.render_actors(RenderGroup.SKELETON_ACTOR, RenderMode.GBUFFER,
-                               self.scene_manager.skeleton_solid_render_infos)
-
     def render_shadow(self):
-        self.framebuffer_shadow.set_color_textures()
-        self.framebuffer_shadow.set_depth_texture(RenderTargets.SHADOWMAP)
-        self.framebuffer_shadow.bind_framebuffer()
-        self.framebuffer.clear(GL_DEPTH_BUFFER_BIT)
+        self.set_geometry_state(front_face=GL_CW)
+        framebuffer = self.framebuffer_manager.bind_framebuffer(depth_texture=RenderTargets.SHADOWMAP)
+        framebuffer.clear(GL_DEPTH_BUFFER_BIT)
 
         light = self.scene_manager.main_light
         self.uniformViewProjection.bind_uniform_block(light.shadow_view_projection, light.shadow_view_projection)
 
-        material_instance = self.resource_manager.getMaterialInstance("shadowmap")
-        self.render_actors(RenderGroup.STATIC_ACTOR, RenderMode.SHADOW,
-                           self.scene_manager.static_solid_render_infos, material_instance)
+        if RenderOption.RENDER_INSTANCING:
+            material_instance = self.resource_manager.getMaterialInstance(name="shadowmap_instancing",
+                                                                          shader_name="shadowmap",
+                                                                          macros={"INSTANCING": 1})
+            self.render_actors_instancing(RenderMode.SHADOW,
+                                          self.scene_manager.static_solid_render_instance_infos,
+                                          self.scene_manager.shadow_culling, material_instance)
+        else:
+            material_instance = self.resource_manager.getMaterialInstance("shadowmap")
+            self.render_actors(RenderGroup.STATIC_ACTOR, RenderMode.SHADOW,
+                               self.scene_manager.shadow_static_solid_render_infos, material_instance)
 
         if RenderOption.RENDER_SKELETON_ACTOR:
             material_instance = self.resource_manager.getMaterialInstance(name="shadowmap_skeletal",
@@ -459,38 +563,34 @@ class Renderer(Singleton):
                                                                           macros={"SKELETAL": 1})
             self.render_actors(RenderGroup.SKELETON_ACTOR, RenderMode.SHADOW,
                                self.scene_manager.skeleton_solid_render_infos, material_instance)
-            self.framebuffer_shadow.unbind_framebuffer()
 
-    def render_preprocess(self):
-        self.postprocess.bind_quad()
-        self.framebuffer.set_depth_texture(None)
-
-        # Screen Space Reflection
-        if self.postprocess.is_render_ssr:
-            self.framebuffer.set_color_textures(RenderTargets.SCREEN_SPACE_REFLECTION)
-            self.framebuffer.bind_framebuffer()
-            self.postprocess.render_screen_space_reflection(RenderTargets.HDR, RenderTargets.WORLD_NORMAL,
-                                                            RenderTargets.VELOCITY, RenderTargets.DEPTHSTENCIL)
-
-        # Linear depth
-        self.framebuffer.set_color_textures(RenderTargets.LINEAR_DEPTH)
-        self.framebuffer.bind_framebuffer()
+    def render_screen_space_reflection(self):
+        self.set_screen_state()
+        self.framebuffer_manager.bind_framebuffer(RenderTargets.SCREEN_SPACE_REFLECTION, depth_texture=None)
+        self.postprocess.render_screen_space_reflection(RenderTargets.HDR, RenderTargets.WORLD_NORMAL,
+                                                        RenderTargets.VELOCITY, RenderTargets.DEPTHSTENCIL)
+
+    def render_linear_depth(self):
+        self.set_screen_state()
+        self.framebuffer_manager.bind_framebuffer(RenderTargets.LINEAR_DEPTH, depth_texture=None)
         self.postprocess.render_linear_depth(RenderTargets.DEPTHSTENCIL)
 
-        # SSAO
-        if self.postprocess.is_render_ssao:
-            self.framebuffer_manager.bind_framebuffer(RenderTargets.SSAO, depth_texture=None)
-            self.postprocess.render_ssao((RenderTargets.SSAO.width, RenderTargets.SSAO.height),
-                                         texture_normal=RenderTargets.WORLD_NORMAL,
-                                         texture_linear_depth=RenderTargets.LINEAR_DEPTH)
+    def render_ssao(self):
+        self.set_screen_state()
+        self.framebuffer_manager.bind_framebuffer(RenderTargets.SSAO, depth_texture=None)
+        self.postprocess.render_ssao((RenderTargets.SSAO.width, RenderTargets.SSAO.height),
+                                     texture_normal=RenderTargets.WORLD_NORMAL,
+                                     texture_linear_depth=RenderTargets.LINEAR_DEPTH)
 
     def render_solid(self):
-        camera = self.scene_manager.main_camera
-        self.uniformViewProjection.bind_uniform_block(camera.view_projection, camera.prev_view_projection)
+        self.set_geometry_state()
+        self.gl_state_cache.depth_mask(False)  # cause depth prepass and gbuffer
+        self.framebuffer_manager.bind_framebuffer(RenderTargets.HDR, depth_texture=RenderTargets.DEPTHSTENCIL)
+        self.bind_camera_view_projection()
 
         # render solid
         if self.render_option_manager.rendering_type == RenderingType.DEFERRED_RENDERING:
-            glDisable(GL_DEPTH_TEST)
+            self.gl_state_cache.disable(GL_DEPTH_TEST)
             if RenderOption.RENDER_LIGHT_PROBE:
                 texture_probe = self.resource_manager.getTexture('field')
             else:
@@ -505,21 +605,32 @@ class Renderer(Singleton):
                                                      RenderTargets.SCREEN_SPACE_REFLECTION,
                                                      texture_probe)
         elif self.render_option_manager.rendering_type == RenderingType.FORWARD_RENDERING:
-            glEnable(GL_DEPTH_TEST)
-            self.render_actors(RenderGroup.STATIC_ACTOR, RenderMode.LIGHTING, self.scene_manager.static_solid_render_infos)
+            self.gl_state_cache.enable(GL_DEPTH_TEST)
+            if RenderOption.RENDER_INSTANCING:
+                self.render_actors_instancing(RenderMode.LIGHTING,
+                                              self.scene_manager.static_solid_render_instance_infos,
+                                              self.scene_manager.main_culling)
+            else:
+                self.render_actors(RenderGroup.STATIC_ACTOR, RenderMode.LIGHTING,
+                                   self.scene_manager.visible_static_solid_render_infos)
             self.render_actors(RenderGroup.SKELETON_ACTOR, RenderMode.LIGHTING,
                                self.scene_manager.skeleton_solid_render_infos)
 
     def render_translucent(self):
+        self.set_geometry_state()
+        self.set_blend_state(True, GL_FUNC_ADD, GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        self.framebuffer_manager.bind_framebuffer(RenderTargets.HDR, depth_texture=RenderTargets.DEPTHSTENCIL)
+        self.bind_camera_view_projection()
+
         # atmospherer
-        glDisable(GL_DEPTH_TEST)
+        self.gl_state_cache.disable(GL_DEPTH_TEST)
         self.postprocess.bind_quad()
         self.postprocess.render_atmosphere()
 
         # render translucent
-        glEnable(GL_DEPTH_TEST)
+        self.gl_state_cache.enable(GL_DEPTH_TEST)
         self.render_actors(RenderGroup.STATIC_ACTOR, RenderMode.LIGHTING,
-                           self.scene_manager.static_translucent_render_infos)
+                           self.scene_manager.visible_static_translucent_render_infos)
         self.render_actors(RenderGroup.SKELETON_ACTOR, RenderMode.LIGHTING,
                            self.scene_manager.skeleton_translucent_render_infos)
 
@@ -529,6 +640,8 @@ class Renderer(Singleton):
 
         if material_instance and material_instance.material:
             material_instance.material.use_program()
+            # bind the material uniform block too.
+            material_instance.bind_material_instance()
 
         if RenderOption.RENDER_LIGHT_PROBE:
             texture_probe = self.resource_manager.getTexture('field')
@@ -540,6 +653,9 @@ class Renderer(Singleton):
         last_geometry = None
         last_material = None
         last_material_instance = None
+        model_slot = None
+        bone_matrices_slot = None
+        prev_bone_matrices_slot = None
 
         # render
         for render_info in render_infos:
@@ -550,6 +666,12 @@ class Renderer(Singleton):
                 material = render_info.material
                 material_instance = render_info.material_instance
 
+                if not material_instance.is_ready():
+                    # draw with the default material instance until the material has been compiled.
+                    material_instance = self.resource_manager.getDefaultMaterialInstance(
+                        skeletal=render_group == RenderGroup.SKELETON_ACTOR)
+                    material = material_instance.material
+
                 if last_material != material:
                     material.use_program()
 
@@ -572,14 +694,23 @@ class Renderer(Singleton):
             else:
                 logger.error("Undefined render mode.")
 
-            if True or last_actor != actor and material_instance:
-                material_instance.bind_uniform_data('model', actor.transform.matrix)
+            if last_material_instance != material_instance:
+                # resolve the uniforms of every draw call once per material instance.
+                model_slot = material_instance.get_uniform_slot('model')
                 if render_group == RenderGroup.SKELETON_ACTOR:
+                    bone_matrices_slot = material_instance.get_uniform_slot('bone_matrices')
+                    prev_bone_matrices_slot = material_instance.get_uniform_slot('prev_bone_matrices')
+
+            if model_slot is not None:
+                model_slot.bind_uniform(actor.transform.matrix)
+
+            if render_group == RenderGroup.SKELETON_ACTOR:
+                if bone_matrices_slot is not None:
                     animation_buffer = actor.get_animation_buffer(geometry.skeleton.index)
+                    bone_matrices_slot.bind_uniform(animation_buffer, len(animation_buffer))
+                if prev_bone_matrices_slot is not None:
                     prev_animation_buffer = actor.get_prev_animation_buffer(geometry.skeleton.index)
-                    material_instance.bind_uniform_data('bone_matrices', animation_buffer, len(animation_buffer))
-                    material_instance.bind_uniform_data('prev_bone_matrices', prev_animation_buffer,
-                                                        len(prev_animation_buffer))
+                    prev_bone_matrices_slot.bind_uniform(prev_animation_buffer, len(prev_animation_buffer))
 
             if last_geometry != geometry:
                 geometry.bind_vertex_buffer()
@@ -592,9 +723,74 @@ class Renderer(Singleton):
             last_material = material
             last_material_instance = material_instance
 
+    def render_actors_instancing(self, render_mode, render_instance_infos, culling, material_instance=None):
+        if len(render_instance_infos) < 1:
+            return
+
+        if material_instance and material_instance.material:
+            material_instance.material.use_program()
+            # bind the material uniform block too.
+            material_instance.bind_material_instance()
+
+        if RenderOption.RENDER_LIGHT_PROBE:
+            texture_probe = self.resource_manager.getTexture('field')
+        else:
+            texture_probe = self.scene_manager.main_light_probe.texture_probe
+
+        last_material = None
+        last_material_instance = None
+
+        for render_instance_info in render_instance_infos:
+            geometry = render_instance_info.geometry
+
+            if RenderMode.LIGHTING == render_mode or RenderMode.GBUFFER == render_mode:
+                material_instance = render_instance_info.material_instance.get_instancing_material_instance()
+                if material_instance is None:
+                    # The shader doesn't support instancing.
+                    render_infos = culling.cull_render_infos(render_instance_info.render_infos,
+                                                             render_instance_info.item_indices)
+                    self.render_actors(RenderGroup.STATIC_ACTOR, render_mode, render_infos)
+                    last_material = None
+                    last_material_instance = None
+                    continue
+
+                material = material_instance.material
+
+                if last_material != material:
+                    material.use_program()
+
+                if last_material_instance != material_instance:
+                    material_instance.bind_material_instance()
+                    material_instance.bind_uniform_data('is_render_gbuffer', RenderMode.GBUFFER == render_mode)
+                    if RenderMode.LIGHTING == render_mode:
+                        material_instance.bind_uniform_data('texture_probe', texture_probe)
+                        material_instance.bind_uniform_data('texture_shadow', RenderTargets.SHADOWMAP)
+                        material_instance.bind_uniform_data('texture_ssao', RenderTargets.SSAO)
+                        material_instance.bind_uniform_data('texture_scene_reflect',
+                                                            RenderTargets.SCREEN_SPACE_REFLECTION)
+                last_material = material
+                last_material_instance = material_instance
+            elif RenderMode.PRE_PASS == render_mode or RenderMode.SHADOW == render_mode:
+                if last_material_instance != material_instance and material_instance:
+                    data_diffuse = material_instance.get_uniform_data('texture_diffuse')
+                    material_instance.bind_uniform_data('texture_diffuse', data_diffuse)
+                    if RenderMode.PRE_PASS == render_mode:
+                        data_normal = material_instance.get_uniform_data('texture_normal')
+                        material_instance.bind_uniform_data('texture_normal', data_normal)
+                last_material_instance = material_instance
+            else:
+                logger.error("Undefined render mode.")
+
+            # The instance buffer has its own vertex array, so the vertex buffer is bound after it.
+            instance_count = render_instance_info.bind_instance_buffer(culling)
+            if 0 < instance_count:
+                geometry.bind_vertex_buffer()
+                geometry.draw_elements_instanced(instance_count)
+                render_instance_info.unbind_instance_buffer(culling)
+
     def render_bones(self):
-        glDisable(GL_DEPTH_TEST)
-        glDisable(GL_CULL_FACE)
+        self.gl_state_cache.disable(GL_DEPTH_TEST)
+        self.gl_state_cache.disable(GL_CULL_FACE)
         mesh = self.resource_manager.getMesh("Cube")
         material_instance = self.resource_manager.getMaterialInstance("debug_bone")
         static_actors = self.scene_manager.static_actors[:]
@@ -641,84 +837,62 @@ class Renderer(Singleton):
                         for bone in skeleton.hierachy:
                             draw_bone(mesh, skeleton_mesh, Matrix4().copy(), material_instance, bone, matrix, isAnimation)
 
-    def render_postprocess(self):
-        # bind frame buffer
-        self.framebuffer.set_color_textures(RenderTargets.HDR)
-        self.framebuffer.set_depth_texture(None)
-        self.framebuffer.bind_framebuffer()
-
-        # atmosphere
+    def render_precomputed_atmosphere(self):
+        self.set_screen_state()
+        self.framebuffer_manager.bind_framebuffer(RenderTargets.HDR, depth_texture=None)
         self.scene_manager.atmosphere.render_precomputed_atmosphere()
 
-        # bind quad mesh
-        self.postprocess.bind_quad()
-
-        # Bloom
-        if self.postprocess.is_render_bloom:
-            self.postprocess.render_bloom(self.framebuffer, RenderTargets.HDR)
+    def render_bloom(self):
+        self.set_screen_state()
+        render_graph = self.render_graph
+        self.postprocess.render_bloom(RenderTargets.HDR,
+                                      render_graph.get_transient('bloom_highlight'),
+                                      [render_graph.get_transient('bloom%d' % i) for i in range(4)],
+                                      [render_graph.get_transient('bloom%d_temp' % i) for i in range(4)])
 
         # Blur Test
         # hdr_copy = self.rendertarget_manager.get_temporary('hdr_copy', RenderTargets.HDR)
-        # self.postprocess.render_gaussian_blur(self.framebuffer, RenderTargets.HDR, hdr_copy)
-
-        # copy HDR target
-        self.framebuffer.set_color_textures(RenderTargets.HDR)
-        self.framebuffer.bind_framebuffer()
-        self.framebuffer_copy.set_color_textures(RenderTargets.HDR_PREV)
-        self.framebuffer_copy.bind_framebuffer()
-        self.framebuffer_copy.copy_framebuffer(self.framebuffer)
-
-        # Temporal AA
-        if AntiAliasing.TAA == self.postprocess.anti_aliasing:
-            self.framebuffer.set_color_textures(RenderTargets.HDR)
-            self.framebuffer.bind_framebuffer()
-            self.postprocess.render_temporal_antialiasing(RenderTargets.HDR_PREV,
-                                                          RenderTargets.TAA_RESOLVE,
-                                                          RenderTargets.VELOCITY,
-                                                          RenderTargets.LINEAR_DEPTH)
-
-            self.framebuffer.set_color_textures(RenderTargets.HDR)
-            self.framebuffer.bind_framebuffer()
-            self.framebuffer_copy.set_color_textures(RenderTargets.TAA_RESOLVE)
-            self.framebuffer_copy.bind_framebuffer()
-            self.framebuffer_copy.copy_framebuffer(self.framebuffer)
-
-        # Tone Map
-        self.framebuffer.set_color_textures(RenderTargets.BACKBUFFER)
-        self.framebuffer.bind_framebuffer()
+        # self.postprocess.render_gaussian_blur(RenderTargets.HDR, hdr_copy)
+
+    def render_copy_hdr(self):
+        self.framebuffer_manager.copy_framebuffer(RenderTargets.HDR, RenderTargets.HDR_PREV)
+
+    def render_temporal_antialiasing(self):
+        self.set_screen_state()
+        self.framebuffer_manager.bind_framebuffer(RenderTargets.HDR, depth_texture=None)
+        self.postprocess.render_temporal_antialiasing(RenderTargets.HDR_PREV,
+                                                      RenderTargets.TAA_RESOLVE,
+                                                      RenderTargets.VELOCITY,
+                                                      RenderTargets.LINEAR_DEPTH)
+
+    def render_copy_taa_resolve(self):
+        self.framebuffer_manager.copy_framebuffer(RenderTargets.HDR, RenderTargets.TAA_RESOLVE)
+
+    def render_tone_map(self):
+        self.set_screen_state()
+        self.framebuffer_manager.bind_framebuffer(RenderTargets.BACKBUFFER, depth_texture=None)
         self.postprocess.render_tone_map(RenderTargets.HDR)
 
+    def render_msaa_resolve(self):
         # MSAA Test
-        if AntiAliasing.MSAA == self.postprocess.anti_aliasing:
-            self.framebuffer.set_color_textures(RenderTargets.BACKBUFFER)
-            self.framebuffer.bind_framebuffer()
-            self.framebuffer_msaa.set_color_textures(RenderTargets.HDR)
-            self.framebuffer_msaa.bind_framebuffer()
-            # resolve
-            self.framebuffer.copy_framebuffer(self.framebuffer_msaa)
-
-        # Motion Blur
-        if self.postprocess.is_render_motion_blur:
-            backbuffer_copy = self.rendertarget_manager.get_temporary('backbuffer_copy', RenderTargets.BACKBUFFER)
-            self.framebuffer.set_color_textures(backbuffer_copy)
-            self.framebuffer.bind_framebuffer()
-            self.postprocess.render_motion_blur(RenderTargets.VELOCITY, RenderTargets.BACKBUFFER)
-
-            # copy to backbuffer
-            self.framebuffer.set_color_textures(backbuffer_copy)
-            self.framebuffer.bind_framebuffer()
-            self.framebuffer_copy.set_color_textures(RenderTargets.BACKBUFFER)
-            self.framebuffer_copy.bind_framebuffer()
-            self.framebuffer_copy.copy_framebuffer(self.framebuffer)
-
-        # debug render target
-        if self.debug_texture and self.debug_texture is not RenderTargets.BACKBUFFER and \
-                type(self.debug_texture) != RenderBuffer:
-            self.framebuffer.set_color_textures(RenderTargets.BACKBUFFER)
-            self.framebuffer.bind_framebuffer()
-            self.postprocess.render_texture(self.debug_texture)
+        self.framebuffer_manager.copy_framebuffer(RenderTargets.HDR, RenderTargets.BACKBUFFER)
+
+    def render_motion_blur(self):
+        self.set_screen_state()
+        backbuffer_copy = self.render_graph.get_transient('backbuffer_copy')
+        self.framebuffer_manager.bind_framebuffer(backbuffer_copy, depth_texture=None)
+        self.postprocess.render_motion_blur(RenderTargets.VELOCITY, RenderTargets.BACKBUFFER)
+
+        # copy to backbuffer
+        self.framebuffer_manager.copy_framebuffer(backbuffer_copy, RenderTargets.BACKBUFFER)
+
+    def render_debug_texture(self):
+        self.set_screen_state()
+        self.framebuffer_manager.bind_framebuffer(RenderTargets.BACKBUFFER, depth_texture=None)
+        self.postprocess.render_texture(self.debug_texture)
 
     def render_font(self):
-        self.framebuffer.set_color_textures(RenderTargets.BACKBUFFER)
-        self.framebuffer.bind_framebuffer()
+        self.set_screen_state()
+        self.set_blend_state(True, GL_FUNC_ADD, GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        self.framebuffer_manager.bind_framebuffer(RenderTargets.BACKBUFFER, depth_texture=None)
         self.font_manager.render_font(self.width, self.height)
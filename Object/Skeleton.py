@@ -1,14 +1,12 @@
 import numpy as np
 
 from Common import logger
-from Object import TransformObject
 
 
 class Bone:
     def __init__(self, name, index, depth, inv_bind_matrix):
         # v += {[(v * BindShapeMatrix) * InvBindMatrix * JointMatrix(animation)] * JointWeight}
         self.name = name
-        self.transform = TransformObject.TransformObject()
         self.inv_bind_matrix = inv_bind_matrix
         self.parent = None
         self.children = []
@@ -4,96 +4,304 @@ import time
 from Utilities import *
 
 
+class TransformSystem(Singleton):
+    """
+    Structure of arrays for every TransformObject.
+    The transforms are stored in contiguous arrays and all of dirty world matrices are recomputed in one batch.
+    """
+    default_capacity = 256
+
+    def __init__(self):
+        self.capacity = 0
+        self.count = 0
+        self.free_indices = []
+
+        self.alive = np.zeros(0, dtype=np.bool_)
+        self.dirty = np.zeros(0, dtype=np.bool_)
+        self.updated = np.zeros(0, dtype=np.bool_)
+        self.view_transform = np.zeros(0, dtype=np.bool_)
+
+        self.pos = np.zeros((0, 3), dtype=np.float32)
+        self.rot = np.zeros((0, 3), dtype=np.float32)
+        self.scale = np.zeros((0, 3), dtype=np.float32)
+
+        self.prev_pos = np.zeros((0, 3), dtype=np.float32)
+        self.prev_rot = np.zeros((0, 3), dtype=np.float32)
+        self.prev_scale = np.zeros((0, 3), dtype=np.float32)
+
+        self.left = np.zeros((0, 3), dtype=np.float32)
+        self.up = np.zeros((0, 3), dtype=np.float32)
+        self.front = np.zeros((0, 3), dtype=np.float32)
+
+        self.local = np.zeros((0, 4, 4), dtype=np.float32)
+        self.matrix = np.zeros((0, 4, 4), dtype=np.float32)
+        self.inverse_matrix = np.zeros((0, 4, 4), dtype=np.float32)
+        self.prev_matrix = np.zeros((0, 4, 4), dtype=np.float32)
+        self.prev_inverse_matrix = np.zeros((0, 4, 4), dtype=np.float32)
+
+        self.resize(self.default_capacity)
+
+    def resize(self, capacity):
+        def resize_array(array, default_value=0):
+            new_array = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+            new_array[...] = default_value
+            new_array[:self.count] = array[:self.count]
+            return new_array
+
+        self.alive = resize_array(self.alive, False)
+        self.dirty = resize_array(self.dirty, False)
+        self.updated = resize_array(self.updated, False)
+        self.view_transform = resize_array(self.view_transform, False)
+
+        self.pos = resize_array(self.pos)
+        self.rot = resize_array(self.rot)
+        self.scale = resize_array(self.scale, 1.0)
+
+        self.prev_pos = resize_array(self.prev_pos)
+        self.prev_rot = resize_array(self.prev_rot)
+        self.prev_scale = resize_array(self.prev_scale, 1.0)
+
+        self.left = resize_array(self.left, WORLD_LEFT)
+        self.up = resize_array(self.up, WORLD_UP)
+        self.front = resize_array(self.front, WORLD_FRONT)
+
+        self.local = resize_array(self.local, MATRIX4_IDENTITY)
+        self.matrix = resize_array(self.matrix, MATRIX4_IDENTITY)
+        self.inverse_matrix = resize_array(self.inverse_matrix, MATRIX4_IDENTITY)
+        self.prev_matrix = resize_array(self.prev_matrix, MATRIX4_IDENTITY)
+        self.prev_inverse_matrix = resize_array(self.prev_inverse_matrix, MATRIX4_IDENTITY)
+
+        self.capacity = capacity
+
+    def allocate(self, local=None):
+        if self.free_indices:
+            index = self.free_indices.pop()
+        else:
+            if self.capacity <= self.count:
+                self.resize(self.capacity * 2)
+            index = self.count
+            self.count += 1
+
+        self.alive[index] = True
+        self.dirty[index] = True
+        self.updated[index] = True
+        self.view_transform[index] = False
+        self.pos[index] = FLOAT3_ZERO
+        self.rot[index] = FLOAT3_ZERO
+        self.scale[index] = 1.0
+        self.prev_pos[index] = FLOAT3_ZERO
+        self.prev_rot[index] = FLOAT3_ZERO
+        self.prev_scale[index] = 1.0
+        self.left[index] = WORLD_LEFT
+        self.up[index] = WORLD_UP
+        self.front[index] = WORLD_FRONT
+        self.local[index] = local if local is not None else MATRIX4_IDENTITY
+        self.matrix[index] = MATRIX4_IDENTITY
+        self.inverse_matrix[index] = MATRIX4_IDENTITY
+        self.prev_matrix[index] = MATRIX4_IDENTITY
+        self.prev_inverse_matrix[index] = MATRIX4_IDENTITY
+        return index
+
+    def release(self, index):
+        if self.alive[index]:
+            self.alive[index] = False
+            self.dirty[index] = False
+            self.updated[index] = False
+            self.free_indices.append(index)
+
+    def update(self, indices=None, force_update=False):
+        """
+        Recompute the world matrices of the dirty transforms.
+        :param indices: None is all of transforms, otherwise index array of transforms to update.
+        :return: bool array, whether each transform was updated.
+        """
+        if indices is None:
+            indices = np.arange(self.count)
+
+        if force_update:
+            changed = self.alive[indices]
+        else:
+            changed = self.dirty[indices] & self.alive[indices]
+            if changed.any():
+                changed_indices = indices[changed]
+                changed[changed] = np.any(self.prev_pos[changed_indices] != self.pos[changed_indices], axis=1) | \
+                    np.any(self.prev_rot[changed_indices] != self.rot[changed_indices], axis=1) | \
+                    np.any(self.prev_scale[changed_indices] != self.scale[changed_indices], axis=1)
+        self.dirty[indices] = False
+
+        # The previous matrix follows the matrix for one more frame after the transform stopped.
+        prev_indices = indices[changed | self.updated[indices]]
+        self.updated[indices] = changed
+        if len(prev_indices) > 0:
+            self.prev_matrix[prev_indices] = self.matrix[prev_indices]
+            view_indices = prev_indices[self.view_transform[prev_indices]]
+            self.prev_inverse_matrix[view_indices] = self.inverse_matrix[view_indices]
+
+        indices = indices[changed]
+        if len(indices) == 0:
+            return changed
+
+        pos = self.pos[indices]
+        rot = self.rot[indices]
+        scale = self.scale[indices]
+        self.prev_pos[indices] = pos
+        self.prev_rot[indices] = rot
+        self.prev_scale[indices] = scale
+
+        # same as matrix_rotation
+        cb, sb = np.cos(rot[:, 0]), np.sin(rot[:, 0])
+        ch, sh = np.cos(rot[:, 1]), np.sin(rot[:, 1])
+        ca, sa = np.cos(rot[:, 2]), np.sin(rot[:, 2])
+        rotation = np.empty((len(indices), 3, 3), dtype=np.float32)
+        rotation[:, 0, 0] = ch * ca
+        rotation[:, 1, 0] = sh * sb - ch * sa * cb
+        rotation[:, 2, 0] = ch * sa * sb + sh * cb
+        rotation[:, 0, 1] = sa
+        rotation[:, 1, 1] = ca * cb
+        rotation[:, 2, 1] = -ca * sb
+        rotation[:, 0, 2] = -sh * ca
+        rotation[:, 1, 2] = sh * sa * cb + ch * sb
+        rotation[:, 2, 2] = -sh * sa * sb + ch * cb
+
+        # same as matrix_to_vectors
+        self.left[indices] = rotation[:, 0]
+        self.up[indices] = rotation[:, 1]
+        self.front[indices] = rotation[:, 2]
+
+        # local * scale * rotation * translate
+        matrix = np.zeros((len(indices), 4, 4), dtype=np.float32)
+        matrix[:, 0:3, 0:3] = rotation * scale[:, :, np.newaxis]
+        matrix[:, 3, 0:3] = pos
+        matrix[:, 3, 3] = 1.0
+        self.matrix[indices] = np.matmul(self.local[indices], matrix)
+
+        view_indices = indices[self.view_transform[indices]]
+        if len(view_indices) > 0:
+            self.inverse_matrix[view_indices] = np.linalg.inv(self.matrix[view_indices])
+        return changed
+
+
 class TransformObject:
+    """
+    The transform data is a view of TransformSystem arrays.
+    """
     def __init__(self, local=None):
+        self.transform_system = TransformSystem.instance()
+        self.index = self.transform_system.allocate(local)
         self.quat = Float4(0.0, 0.0, 0.0, 1.0)
-        self.local = local if local is not None else Matrix4()
+        self.updateTransform(force_update=True)
+
+    def delete(self):
+        self.transform_system.release(self.index)
+
+    @property
+    def updated(self):
+        return self.transform_system.updated[self.index]
+
+    @property
+    def local(self):
+        return self.transform_system.local[self.index]
+
+    @property
+    def pos(self):
+        return self.transform_system.pos[self.index]
+
+    @property
+    def rot(self):
+        return self.transform_system.rot[self.index]
+
+    @property
+    def scale(self):
+        return self.transform_system.scale[self.index]
+
+    @property
+    def left(self):
+        return self.transform_system.left[self.index]
 
-        self.moved = True
-        self.rotated = True
-        self.scaled = True
-        self.updated = True
+    @property
+    def up(self):
+        return self.transform_system.up[self.index]
 
-        self.left = WORLD_LEFT.copy()
-        self.up = WORLD_UP.copy()
-        self.front = WORLD_FRONT.copy()
+    @property
+    def front(self):
+        return self.transform_system.front[self.index]
 
-        self.pos = Float3()
-        self.rot = Float3()
-        self.scale = Float3(1, 1, 1)
+    @property
+    def matrix(self):
+        return self.transform_system.matrix[self.index]
 
-        self.prev_Pos = Float3()
-        self.prev_Rot = Float3()
-        self.prev_Scale = Float3(1, 1, 1)
+    @property
+    def inverse_matrix(self):
+        return self.transform_system.inverse_matrix[self.index]
 
-        self.translateMatrix = Matrix4()
-        self.rotationMatrix = Matrix4()
-        self.scaleMatrix = Matrix4()
+    @property
+    def prev_matrix(self):
+        return self.transform_system.prev_matrix[self.index]
 
-        self.matrix = Matrix4()
-        self.inverse_matrix = Matrix4()
+    @property
+    def prev_inverse_matrix(self):
+        return self.transform_system.prev_inverse_matrix[self.index]
 
-        self.prev_matrix = Matrix4()
-        self.prev_inverse_matrix = Matrix4()
+    def set_dirty(self):
+        self.transform_system.dirty[self.index] = True
 
-        self.updateTransform(True)
+    def set_view_transform(self, view_transform):
+        self.transform_system.view_transform[self.index] = view_transform
+        if view_transform:
+            self.inverse_matrix[...] = np.linalg.inv(self.matrix)
 
     def resetTransform(self):
-        self.moved = True
-        self.rotated = True
-        self.scaled = True
-        self.updated = True
         self.setPos(Float3())
         self.setRot(Float3())
         self.setScale(Float3(1, 1, 1))
-        self.updateTransform(True)
+        self.updateTransform(force_update=True)
 
     # Translate
     def getPos(self):
         return self.pos
 
     def setPos(self, pos):
-        self.moved = True
+        self.set_dirty()
         self.pos[...] = pos
 
     def setPosX(self, x):
-        self.moved = True
+        self.set_dirty()
         self.pos[0] = x
 
     def setPosY(self, y):
-        self.moved = True
+        self.set_dirty()
         self.pos[1] = y
 
     def setPosZ(self, z):
-        self.moved = True
+        self.set_dirty()
         self.pos[2] = z
 
     def move(self, vDelta):
-        self.moved = True
+        self.set_dirty()
         self.pos[...] = self.pos + vDelta
 
     def moveToFront(self, delta):
-        self.moved = True
+        self.set_dirty()
         self.pos[...] = self.pos + self.front * delta
 
     def moveToLeft(self, delta):
-        self.moved = True
+        self.set_dirty()
         self.pos[...] = self.pos + self.left * delta
 
     def moveToUp(self, delta):
-        self.moved = True
+        self.set_dirty()
         self.pos[...] = self.pos + self.up * delta
 
     def moveX(self, delta):
-        self.moved = True
+        self.set_dirty()
         self.pos[0] += delta
 
     def moveY(self, delta):
-        self.moved = True
+        self.set_dirty()
         self.pos[1] += delta
 
     def moveZ(self, delta):
-        self.moved = True
+        self.set_dirty()
         self.pos[2] += delta
 
     # Rotation
@@ -101,41 +309,41 @@ class TransformObject:
         return self.rot
 
     def setRot(self, rot):
-        self.rotated = True
+        self.set_dirty()
         self.rot[...] = rot
 
     def setPitch(self, pitch):
-        self.rotated = True
+        self.set_dirty()
         if pitch > TWO_PI or pitch < 0.0:
             pitch %= TWO_PI
         self.rot[0] = pitch
 
     def setYaw(self, yaw):
-        self.rotated = True
+        self.set_dirty()
         if yaw > TWO_PI or yaw < 0.0:
             yaw %= TWO_PI
         self.rot[1] = yaw
 
     def setRoll(self, roll):
-        self.rotated = True
+        self.set_dirty()
         if roll > TWO_PI or roll < 0.0:
             roll %= TWO_PI
         self.rot[2] = roll
 
     def rotationPitch(self, delta=0.0):
-        self.rotated = True
+        self.set_dirty()
         self.rot[0] += delta
         if self.rot[0] > TWO_PI or self.rot[0] < 0.0:
             self.rot[0] %= TWO_PI
 
     def rotationYaw(self, delta=0.0):
-        self.rotated = True
+        self.set_dirty()
         self.rot[1] += delta
         if self.rot[1] > TWO_PI or self.rot[1] < 0.0:
             self.rot[1] %= TWO_PI
 
     def rotationRoll(self, delta=0.0):
-        self.rotated = True
+        self.set_dirty()
         self.rot[2] += delta
         if self.rot[2] > TWO_PI or self.rot[2] < 0.0:
             self.rot[2] %= TWO_PI
@@ -145,69 +353,30 @@ class TransformObject:
         return self.scale
 
     def setScale(self, vScale):
-        self.scaled = True
+        self.set_dirty()
         self.scale[...] = vScale
 
     def setScaleX(self, x):
-        self.scaled = True
+        self.set_dirty()
         self.scale[0] = x
 
     def setScaleY(self, y):
-        self.scaled = True
+        self.set_dirty()
         self.scale[1] = y
 
     def setScaleZ(self, z):
-        self.scaled = True
+        self.set_dirty()
         self.scale[2] = z
 
     # update Transform
     def updateTransform(self, update_view_transform=False, force_update=False):
-        prev_updated = self.updated
-        self.updated = False
-
-        if self.moved and any(self.prev_Pos != self.pos) or force_update:
-            self.prev_Pos[...] = self.pos
-            setTranslateMatrix(self.translateMatrix, self.pos[0], self.pos[1], self.pos[2])
-            self.moved = False
-            self.updated = True
-
-        if self.rotated and any(self.prev_Rot != self.rot) or force_update:
-            self.prev_Rot[...] = self.rot
-            self.rotated = False
-            self.updated = True
-
-            # Matrix Rotation - faster
-            matrix_rotation(*self.rot, self.rotationMatrix)
-            matrix_to_vectors(self.rotationMatrix, self.left, self.up, self.front)
-
-            # Euler Rotation - slow
-            # p = getRotationMatrixX(self.rot[0])
-            # y = getRotationMatrixY(self.rot[1])
-            # r = getRotationMatrixZ(self.rot[2])
-            # self.rotationMatrix = np.dot(p, np.dot(y, r))
-            # matrix_to_vectors(self.rotationMatrix, self.right, self.up, self.front)
-
-            # Quaternion Rotation - slower
-            # euler_to_quaternion(*self.rot, self.quat)
-            # quaternion_to_matrix(self.quat, self.rotationMatrix)
-            # matrix_to_vectors(self.rotationMatrix, self.right, self.up, self.front)
-
-        if self.scaled and any(self.prev_Scale != self.scale) or force_update:
-            self.prev_Scale[...] = self.scale
-            setScaleMatrix(self.scaleMatrix, self.scale[0], self.scale[1], self.scale[2])
-            self.scaled = False
-            self.updated = True
-
-        if prev_updated or self.updated:
-            self.prev_matrix[...] = self.matrix
-            if update_view_transform:
-                self.prev_inverse_matrix[...] = self.inverse_matrix
-
-        if self.updated:
-            self.matrix[...] = dot_arrays(self.local, self.scaleMatrix, self.rotationMatrix, self.translateMatrix)
-            if update_view_transform:
-                self.inverse_matrix[...] = np.linalg.inv(self.matrix)
-        return self.updated
+        """
+        Update only this transform. Usually TransformSystem.update updates all of transforms at once.
+        """
+        if update_view_transform:
+            self.set_view_transform(True)
+        indices = np.array([self.index, ])
+        return bool(self.transform_system.update(indices, force_update)[0])
 
     def getTransformInfos(self):
         text = "\tPosition : " + " ".join(["%2.2f" % i for i in self.pos])
@@ -2,17 +2,18 @@ from .Atmosphere import *
 from .RenderInfo import RenderInfo, RenderInstanceInfo
 from .RenderOptions import RenderOption, RenderingType, RenderGroup, RenderMode, RenderOptionManager
 from .MaterialInstance import MaterialInstance
-from .Animation import Animation, AnimationNode
+from .Animation import Animation, AnimationNode, AnimationPoseCache
 from .Skeleton import Skeleton, Bone
 from .Mesh import Geometry, Mesh, Triangle, Quad, Cube
 from .Model import Model
-from .TransformObject import TransformObject
+from .TransformObject import TransformSystem, TransformObject
 from .Actor import SkeletonActor, StaticActor
 from .Camera import Camera
 from .Light import Light
 from .LightProbe import LightProbe
 from .Sky import Sky
 from .PostProcess import PostProcess
+from .RenderGraph import RenderGraph, RenderPass
 from .RenderTarget import RenderTargets, RenderTargetManager
 from .Font import FontData, FontManager
 from .Renderer import Renderer, RenderOption
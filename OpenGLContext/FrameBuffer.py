@@ -1,10 +1,9 @@
-from functools import partial
-
 from OpenGL.GL import *
 
 from Utilities import GetClassName
 from Common import logger
 
+from .GLStateCache import GLStateCache
 from .RenderBuffer import RenderBuffer
 
 
@@ -31,7 +30,6 @@ class FrameBuffer:
         self.y = 0
         self.width = 0
         self.height = 0
-        self.commands = []
 
     def __del__(self):
         self.set_color_textures()
@@ -40,6 +38,7 @@ class FrameBuffer:
     def delete(self):
         logger.info("Delete %s" % GetClassName(self))
         glDeleteFramebuffers(1, [self.buffer, ])
+        GLStateCache.instance().delete_framebuffer(self.buffer)
 
     def clear(self, clear_flag=GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT, clear_color=(0.0, 0.0, 0.0, 1.0)):
         glClearColor(*clear_color)
@@ -50,7 +49,7 @@ class FrameBuffer:
         self.y = y
         self.width = width
         self.height = height
-        glViewport(x, y, width, height)
+        GLStateCache.instance().viewport(x, y, width, height)
 
     def set_color_textures(self, *textures):
         texture_count = len(textures)
@@ -78,70 +77,7 @@ class FrameBuffer:
             texture.set_attachment(True)
         self.depth_texture = texture
 
-    def add_command(self, *args):
-        self.commands.append(partial(*args))
-
-    def build_command(self):
-        self.add_command(glBindFramebuffer, GL_FRAMEBUFFER, self.buffer)
-
-        # bind color textures
-        for i, color_texture in enumerate(self.color_textures):
-            attachment = GL_COLOR_ATTACHMENT0 + i
-            if color_texture:
-                if type(color_texture) == RenderBuffer:
-                    self.add_command(glFramebufferRenderbuffer, GL_FRAMEBUFFER, attachment, GL_RENDERBUFFER,
-                                     color_texture.buffer)
-                else:
-                    self.add_command(glFramebufferTexture, GL_FRAMEBUFFER, attachment, color_texture.buffer, 0)
-                # just for single render target.
-                # self.add_command(glDrawBuffer, attachment)
-                # important
-                self.add_command(glReadBuffer, attachment)
-            # else:
-            #     self.add_command(glFramebufferTexture, GL_FRAMEBUFFER, attachment, 0, 0)
-
-        if self.attach_count > 0:
-            # Specifies a list of color buffers to be drawn into
-            self.add_command(glDrawBuffers, self.attach_count, self.attachments)
-        else:
-            # Important - We need to explicitly tell OpenGL we're not going to render any color data.
-            self.add_command(glDrawBuffer, GL_NONE)
-            self.add_command(glReadBuffer, GL_NONE)
-
-        # bind depth texture
-        if self.depth_texture:
-            if self.depth_texture.internal_format in (GL_DEPTH_STENCIL, GL_DEPTH24_STENCIL8, GL_DEPTH32F_STENCIL8):
-                attachment = GL_DEPTH_STENCIL_ATTACHMENT
-            else:
-                attachment = GL_DEPTH_ATTACHMENT
-            if type(self.depth_texture) == RenderBuffer:
-                self.add_command(glFramebufferRenderbuffer, GL_FRAMEBUFFER, attachment, GL_RENDERBUFFER,
-                                 self.depth_texture.buffer)
-            else:
-                self.add_command(glFramebufferTexture, GL_FRAMEBUFFER, attachment, self.depth_texture.buffer, 0)
-        else:
-            self.add_command(glFramebufferTexture, GL_FRAMEBUFFER, GL_DEPTH_STENCIL_ATTACHMENT, 0, 0)
-
-    def run_bind_framebuffer(self):
-        for cmd in self.commands:
-            cmd()
-
-        # set viewport
-        if self.attach_count > 0:
-            self.set_viewport(0, 0, self.color_textures[0].width, self.color_textures[0].height)
-        elif self.depth_texture:
-            # Set viewport if there isn't any color texture.
-            self.set_viewport(0, 0, self.depth_texture.width, self.depth_texture.height)
-
-        gl_error = glCheckFramebufferStatus(GL_FRAMEBUFFER)
-        if gl_error != GL_FRAMEBUFFER_COMPLETE:
-            error_message = "glCheckFramebufferStatus error %s." % self.get_error(gl_error)
-            logger.error(error_message)
-            raise BaseException(error_message)
-
-    def bind_framebuffer(self):
-        glBindFramebuffer(GL_FRAMEBUFFER, self.buffer)
-
+    def attach_textures(self):
         # bind color textures
         for i, color_texture in enumerate(self.color_textures):
             attachment = GL_COLOR_ATTACHMENT0 + i
@@ -185,12 +121,27 @@ class FrameBuffer:
             # Set viewport if there isn't any color texture.
             self.set_viewport(0, 0, self.depth_texture.width, self.depth_texture.height)
 
+    def check_framebuffer_status(self):
         gl_error = glCheckFramebufferStatus(GL_FRAMEBUFFER)
         if gl_error != GL_FRAMEBUFFER_COMPLETE:
             error_message = "glCheckFramebufferStatus error %s." % self.get_error(gl_error)
             logger.error(error_message)
             raise BaseException(error_message)
 
+    def bind_framebuffer(self):
+        """
+        Attach the textures, check the completeness and bind.
+        The attachments are the states of the frame buffer, so run_bind_framebuffer is enough to bind it again
+        if the textures are not changed.
+        """
+        GLStateCache.instance().bind_framebuffer(GL_FRAMEBUFFER, self.buffer)
+        self.attach_textures()
+        self.check_framebuffer_status()
+
+    def run_bind_framebuffer(self):
+        GLStateCache.instance().bind_framebuffer(GL_FRAMEBUFFER, self.buffer)
+        GLStateCache.instance().viewport(self.x, self.y, self.width, self.height)
+
     def get_error(self, error_code):
         for error in self.errors:
             if error == error_code:
@@ -199,32 +150,36 @@ class FrameBuffer:
     def unbind_framebuffer(self):
         self.set_color_textures()
         self.set_depth_texture(None)
-        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        GLStateCache.instance().bind_framebuffer(GL_FRAMEBUFFER, 0)
 
     def copy_framebuffer(self, src, target=GL_COLOR_BUFFER_BIT, filter_type=GL_LINEAR):
-        glBindFramebuffer(GL_READ_FRAMEBUFFER, src.buffer)
-        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self.buffer)
+        GLStateCache.instance().bind_framebuffer(GL_READ_FRAMEBUFFER, src.buffer)
+        GLStateCache.instance().bind_framebuffer(GL_DRAW_FRAMEBUFFER, self.buffer)
         glBlitFramebuffer(0, 0, src.width, src.height, 0, 0, self.width, self.height, target, filter_type)
 
     def mirror_framebuffer(self, src, target=GL_COLOR_BUFFER_BIT, filter_type=GL_LINEAR):
-        glBindFramebuffer(GL_READ_FRAMEBUFFER, src.buffer)
-        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self.buffer)
+        GLStateCache.instance().bind_framebuffer(GL_READ_FRAMEBUFFER, src.buffer)
+        GLStateCache.instance().bind_framebuffer(GL_DRAW_FRAMEBUFFER, self.buffer)
         glBlitFramebuffer(src.width, 0, 0, src.height, 0, 0, self.width, self.height, target, filter_type)
 
     def blit_framebuffer(self, window_width, window_height, filter_type=GL_LINEAR):
-        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, 0)  # the default framebuffer active
+        GLStateCache.instance().bind_framebuffer(GL_DRAW_FRAMEBUFFER, 0)  # the default framebuffer active
         glBlitFramebuffer(0, 0, self.width, self.height,
                           0, 0, window_width, window_height,
                           GL_COLOR_BUFFER_BIT, filter_type)
 
 
 class FrameBufferManager:
+    """
+    The frame buffers are cached by the attachments, so the frame buffer of the same render targets is created
+    and checked only once. The cache must be cleared if the render targets are recreated.
+    """
     def __init__(self):
         self.framebuffers = {}
         self.current_framebuffer = None
 
     def clear(self):
-        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        GLStateCache.instance().bind_framebuffer(GL_FRAMEBUFFER, 0)
         for framebuffer in self.framebuffers.values():
             framebuffer.delete()
         self.framebuffers = {}
@@ -236,6 +191,13 @@ class FrameBufferManager:
             framebuffer = self.framebuffers.pop(key)
             framebuffer.delete()
 
+    def delete_framebuffers_of(self, texture):
+        for key in [key for key in self.framebuffers if texture in key[0] or texture is key[1]]:
+            framebuffer = self.framebuffers.pop(key)
+            if framebuffer is self.current_framebuffer:
+                self.current_framebuffer = None
+            framebuffer.delete()
+
     def get_framebuffer(self, *textures, depth_texture):
         key = (textures, depth_texture)
         if key in self.framebuffers:
@@ -245,10 +207,20 @@ class FrameBufferManager:
             self.framebuffers[key] = framebuffer
             framebuffer.set_color_textures(*textures)
             framebuffer.set_depth_texture(depth_texture)
-            framebuffer.build_command()
+            framebuffer.bind_framebuffer()
         return framebuffer
 
     def bind_framebuffer(self, *textures, depth_texture):
         self.current_framebuffer = self.get_framebuffer(*textures, depth_texture=depth_texture)
         self.current_framebuffer.run_bind_framebuffer()
         return self.current_framebuffer
+
+    def copy_framebuffer(self, src_texture, dst_texture, target=GL_COLOR_BUFFER_BIT, filter_type=GL_LINEAR):
+        src_framebuffer = self.get_framebuffer(src_texture, depth_texture=None)
+        dst_framebuffer = self.get_framebuffer(dst_texture, depth_texture=None)
+        dst_framebuffer.copy_framebuffer(src_framebuffer, target, filter_type)
+
+    def mirror_framebuffer(self, src_texture, dst_texture, target=GL_COLOR_BUFFER_BIT, filter_type=GL_LINEAR):
+        src_framebuffer = self.get_framebuffer(src_texture, depth_texture=None)
+        dst_framebuffer = self.get_framebuffer(dst_texture, depth_texture=None)
+        dst_framebuffer.mirror_framebuffer(src_framebuffer, target, filter_type)
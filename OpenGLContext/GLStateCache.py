@@ -0,0 +1,220 @@
+from OpenGL.GL import *
+
+from Utilities import Singleton
+
+
+class GLStateCache(Singleton):
+    """
+    Shadow copy of the opengl states which are changed while rendering.
+    The call is skipped if the state is already set, and the skipped calls are counted for profiling.
+    The states changed by the direct gl calls are unknown, so invalidate is called at the beginning of the frame
+    and after such calls. The deleted objects must be notified by the delete_* functions,
+    because opengl resets the bindings of them and the name can be reused.
+    """
+    def __init__(self):
+        self.capabilities = {}
+        self.states = {}
+        self.program = None
+        self.vertex_array = None
+        self.buffers = {}  # { target : buffer }
+        self.indexed_buffers = {}  # { (target, index) : (buffer, offset, size) }
+        self.active_texture_unit = None
+        self.textures = {}  # { (texture_unit, target) : texture }
+        self.read_framebuffer = None
+        self.draw_framebuffer = None
+
+        # profiling
+        self.call_count = 0
+        self.redundant_count = 0
+        self.redundant_counts = {}
+        self.prev_call_count = 0
+        self.prev_redundant_count = 0
+
+    def invalidate(self):
+        self.capabilities.clear()
+        self.states.clear()
+        self.program = None
+        self.vertex_array = None
+        self.buffers.clear()
+        self.indexed_buffers.clear()
+        self.active_texture_unit = None
+        self.textures.clear()
+        self.read_framebuffer = None
+        self.draw_framebuffer = None
+
+    def begin_frame(self):
+        self.prev_call_count = self.call_count
+        self.prev_redundant_count = self.redundant_count
+        self.call_count = 0
+        self.redundant_count = 0
+        self.invalidate()
+
+    def skip(self, name):
+        self.redundant_count += 1
+        self.redundant_counts[name] = self.redundant_counts.get(name, 0) + 1
+
+    def get_log(self):
+        return "GL state : %d calls, %d redundant" % (self.prev_call_count, self.prev_redundant_count)
+
+    # Capabilities
+    def enable(self, capability):
+        if self.capabilities.get(capability) is True:
+            self.skip('glEnable')
+        else:
+            self.call_count += 1
+            self.capabilities[capability] = True
+            glEnable(capability)
+
+    def disable(self, capability):
+        if self.capabilities.get(capability) is False:
+            self.skip('glDisable')
+        else:
+            self.call_count += 1
+            self.capabilities[capability] = False
+            glDisable(capability)
+
+    def set_state(self, func, *args):
+        if self.states.get(func) == args:
+            self.skip(func.__name__)
+        else:
+            self.call_count += 1
+            self.states[func] = args
+            func(*args)
+
+    def depth_mask(self, flag):
+        self.set_state(glDepthMask, bool(flag))
+
+    def depth_func(self, func):
+        self.set_state(glDepthFunc, func)
+
+    def front_face(self, mode):
+        self.set_state(glFrontFace, mode)
+
+    def cull_face(self, mode):
+        self.set_state(glCullFace, mode)
+
+    def polygon_mode(self, face, mode):
+        self.set_state(glPolygonMode, face, mode)
+
+    def blend_equation(self, mode):
+        self.set_state(glBlendEquation, mode)
+
+    def blend_func(self, src, dst):
+        self.set_state(glBlendFunc, src, dst)
+
+    def viewport(self, x, y, width, height):
+        self.set_state(glViewport, x, y, width, height)
+
+    # Bindings
+    def use_program(self, program):
+        if self.program == program:
+            self.skip('glUseProgram')
+        else:
+            self.call_count += 1
+            self.program = program
+            glUseProgram(program)
+
+    def bind_vertex_array(self, vertex_array):
+        if self.vertex_array == vertex_array:
+            self.skip('glBindVertexArray')
+        else:
+            self.call_count += 1
+            self.vertex_array = vertex_array
+            # the element array buffer binding is a state of the vertex array.
+            self.buffers.pop(GL_ELEMENT_ARRAY_BUFFER, None)
+            glBindVertexArray(vertex_array)
+
+    def bind_buffer(self, target, buffer):
+        if self.buffers.get(target) == buffer:
+            self.skip('glBindBuffer')
+        else:
+            self.call_count += 1
+            self.buffers[target] = buffer
+            glBindBuffer(target, buffer)
+
+    def bind_buffer_base(self, target, index, buffer):
+        key = (target, index)
+        value = (buffer, None, None)
+        if self.indexed_buffers.get(key) == value:
+            self.skip('glBindBufferBase')
+        else:
+            self.call_count += 1
+            self.indexed_buffers[key] = value
+            # also binds the generic binding point.
+            self.buffers[target] = buffer
+            glBindBufferBase(target, index, buffer)
+
+    def bind_buffer_range(self, target, index, buffer, offset, size):
+        key = (target, index)
+        value = (buffer, offset, size)
+        if self.indexed_buffers.get(key) == value:
+            self.skip('glBindBufferRange')
+        else:
+            self.call_count += 1
+            self.indexed_buffers[key] = value
+            # also binds the generic binding point.
+            self.buffers[target] = buffer
+            glBindBufferRange(target, index, buffer, offset, size)
+
+    def active_texture(self, texture_unit):
+        if self.active_texture_unit == texture_unit:
+            self.skip('glActiveTexture')
+        else:
+            self.call_count += 1
+            self.active_texture_unit = texture_unit
+            glActiveTexture(texture_unit)
+
+    def bind_texture(self, target, texture):
+        """
+        Bind the texture to the active texture unit.
+        """
+        if self.active_texture_unit is None:
+            # the active texture unit is unknown.
+            self.active_texture(GL_TEXTURE0)
+
+        key = (self.active_texture_unit, target)
+        if self.textures.get(key) == texture:
+            self.skip('glBindTexture')
+        else:
+            self.call_count += 1
+            self.textures[key] = texture
+            glBindTexture(target, texture)
+
+    def bind_framebuffer(self, target, framebuffer):
+        read = target in (GL_FRAMEBUFFER, GL_READ_FRAMEBUFFER)
+        draw = target in (GL_FRAMEBUFFER, GL_DRAW_FRAMEBUFFER)
+        if (not read or self.read_framebuffer == framebuffer) and (not draw or self.draw_framebuffer == framebuffer):
+            self.skip('glBindFramebuffer')
+        else:
+            self.call_count += 1
+            if read:
+                self.read_framebuffer = framebuffer
+            if draw:
+                self.draw_framebuffer = framebuffer
+            glBindFramebuffer(target, framebuffer)
+
+    # Deleted objects
+    def delete_program(self, program):
+        if self.program == program:
+            self.program = None
+
+    def delete_vertex_array(self, vertex_array):
+        if self.vertex_array == vertex_array:
+            self.vertex_array = None
+            self.buffers.pop(GL_ELEMENT_ARRAY_BUFFER, None)
+
+    def delete_buffer(self, buffer):
+        for target in [target for target, value in self.buffers.items() if value == buffer]:
+            self.buffers.pop(target)
+        for key in [key for key, value in self.indexed_buffers.items() if value[0] == buffer]:
+            self.indexed_buffers.pop(key)
+
+    def delete_texture(self, texture):
+        for key in [key for key, value in self.textures.items() if value == texture]:
+            self.textures.pop(key)
+
+    def delete_framebuffer(self, framebuffer):
+        if self.read_framebuffer == framebuffer:
+            self.read_framebuffer = None
+        if self.draw_framebuffer == framebuffer:
+            self.draw_framebuffer = None
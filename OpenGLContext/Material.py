@@ -1,5 +1,4 @@
 import re
-import pickle
 import copy
 import traceback
 from collections import OrderedDict
@@ -13,44 +12,59 @@ import numpy as np
 
 from Common import logger
 from Utilities import GetClassName, Attributes, Logger
-from .UniformBuffer import CreateUniformBuffer, UniformTextureBase
+from .GLStateCache import GLStateCache
+from .MaterialCompileQueue import MaterialCompileQueue
+from .UniformBuffer import CreateUniformBuffer, UniformBlockMember, UniformTextureBase
 from App import CoreManager
 
 
 class Material:
-    def __init__(self, material_name, material_datas={}):
+    def __init__(self, material_name, material_datas={}, deferred=False):
+        """
+        :param deferred: If True, the program compiled from source is not checked until finalize is called.
+        """
         self.valid = False
         logger.info("Load %s material." % material_name)
 
         shader_codes = material_datas.get('shader_codes')
         binary_format = material_datas.get('binary_format')
         binary_data = material_datas.get('binary_data')
-        uniforms = material_datas.get('uniforms', [])
+        self.uniforms = material_datas.get('uniforms', [])
         self.material_component_names = [x[1] for x in material_datas.get('material_components', [])]
         self.macros = material_datas.get('macros', OrderedDict())
+        # { uniform name : (uniform type, offset) } of the material uniform block.
+        self.uniform_block_members = {uniform_name: (uniform_type, offset) for uniform_type, uniform_name, offset in
+                                      material_datas.get('material_uniform_block', [])}
+        self.uniform_block_size = material_datas.get('material_uniform_block_size', 0)
 
         self.is_translucent = True if 0 < self.macros.get('TRANSPARENT_MATERIAL', 0) else False
 
         self.name = material_name
         self.shader_name = material_datas.get('shader_name', '')
         self.program = -1
+        self.is_compiled_from_binary = False
+        self.is_finalized = False
+        self.shaders = []  # [(shader_type, shader, shader_code), ...] until finalized.
         self.uniform_buffers = dict()  # OrderedDict()  # Declaration order is important.
         self.Attributes = Attributes()
 
         if binary_format is not None and binary_data is not None:
             self.compile_from_binary(binary_format, binary_data)
             self.valid = self.check_validate() and self.check_linked()
-            if not self.valid:
+            if self.valid:
+                self.is_compiled_from_binary = True
+                self.is_finalized = True
+                self.create_uniform_buffers(self.uniforms)
+            else:
                 logger.error("%s material has been failed to compile from binary" % self.name)
-            
+                glDeleteProgram(self.program)
+                GLStateCache.instance().delete_program(self.program)
+                self.program = -1
+
         if not self.valid:
             self.compile_from_source(shader_codes)
-            self.valid = self.check_validate() and self.check_linked()
-            if not self.valid:
-                logger.error("%s material has been failed to compile from source" % self.name)
-
-        if self.valid:
-            self.create_uniform_buffers(uniforms)
+            if not deferred:
+                self.finalize()
 
     def getAttribute(self):
         self.Attributes.setAttribute('name', self.name)
@@ -67,14 +81,49 @@ class Material:
             CoreManager.instance().resource_manager.getMaterial(self.shader_name, new_macros)
 
     def delete(self):
-        glUseProgram(0)
+        GLStateCache.instance().use_program(0)
+        for shader_type, shader, shader_code in self.shaders:
+            glDeleteShader(shader)
+        self.shaders = []
         glDeleteProgram(self.program)
+        GLStateCache.instance().delete_program(self.program)
         logger.info("Deleted %s material." % self.name)
 
+    def is_completed(self):
+        """
+        :return: True if the result of the compile is ready without waiting for the driver.
+        """
+        return self.is_finalized or MaterialCompileQueue.instance().is_completed(self.program)
+
+    def finalize(self):
+        """
+        Check the result of the compile, and create the uniform buffers. This waits for the driver if not completed.
+        """
+        if not self.is_finalized:
+            self.is_finalized = True
+            compiled = True
+            for shader_type, shader, shader_code in self.shaders:
+                compiled = self.check_compile(shader_type, shader, shader_code) and compiled
+                glDetachShader(self.program, shader)
+                glDeleteShader(shader)
+            self.shaders = []
+
+            self.valid = compiled and self.check_validate() and self.check_linked()
+            if self.valid:
+                self.create_uniform_buffers(self.uniforms)
+            else:
+                logger.error("%s material has been failed to compile from source" % self.name)
+        return self.valid
+
     def use_program(self):
-        glUseProgram(self.program)
+        if not self.is_finalized:
+            self.finalize()
+        GLStateCache.instance().use_program(self.program)
 
     def save_to_binary(self):
+        """
+        :return: binary_format(int), binary_data(bytes)
+        """
         size = GLint()
         glGetProgramiv(self.program, GL_PROGRAM_BINARY_LENGTH, size)
         # very important - check data dtype np.ubyte
@@ -82,44 +131,46 @@ class Material:
         binary_size = GLint()
         binary_format = GLenum()
         glGetProgramBinary(self.program, size.value, binary_size, binary_format, binary_data)
-        binary_data = pickle.dumps(binary_data)
-        return binary_format, binary_data
+        if binary_size.value < 1:
+            return None, None
+        return binary_format.value, binary_data[:binary_size.value].tobytes()
 
     def compile_from_binary(self, binary_format, binary_data):
-        binary_data = pickle.loads(binary_data)
+        binary_data = np.frombuffer(binary_data, dtype=np.ubyte)
         self.program = glCreateProgram()
         glProgramParameteri(self.program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
-        glProgramBinary(self.program, binary_format.value, binary_data, len(binary_data))
+        glProgramBinary(self.program, binary_format, binary_data, len(binary_data))
 
     def compile_from_source(self, shader_codes: dict):
         """
+        Submit the compile and the link of the shaders. The result is checked in finalize.
         :param shader_codes: {GL_VERTEX_SHADER:code_string, GL_FRAGMENT_SHADER:code_string, }
         """
-        shaders = []
+        self.shaders = []
         for shader_type in shader_codes:
             shader = self.compile(shader_type, shader_codes[shader_type])
             if shader is not None:
                 logger.info("Compile %s %s." % (self.name, shader_type))
-                shaders.append(shader)
+                self.shaders.append((shader_type, shader, shader_codes[shader_type]))
 
         self.program = glCreateProgram()
 
         # glProgramParameteri(self.program, GL_PROGRAM_SEPARABLE, GL_TRUE)
         glProgramParameteri(self.program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
 
-        for shader in shaders:
+        for shader_type, shader, shader_code in self.shaders:
             glAttachShader(self.program, shader)
 
         glLinkProgram(self.program)
 
-        for shader in shaders:
-            glDetachShader(self.program, shader)
-            glDeleteShader(shader)
-
     def create_uniform_buffers(self, uniforms):
         # create uniform buffers from source code
         active_texture_index = 0
         for uniform_type, uniform_name in uniforms:
+            if uniform_name in self.uniform_block_members:
+                uniform_type, offset = self.uniform_block_members[uniform_name]
+                self.uniform_buffers[uniform_name] = UniformBlockMember(uniform_type, uniform_name, offset)
+                continue
             uniform_buffer = CreateUniformBuffer(self.program, uniform_type, uniform_name)
             if uniform_buffer is not None:
                 # Important : set texture binding index
@@ -145,34 +196,40 @@ class Material:
             shader = glCreateShader(shaderType)
             glShaderSource(shader, shader_code)
             glCompileShader(shader)
-            if glGetShaderiv(shader, GL_COMPILE_STATUS) != 1 or True:
-                infoLogs = glGetShaderInfoLog(shader)
-                if infoLogs:
-                    shader_code_lines = shader_code.split('\n')
-                    if type(infoLogs) == bytes:
-                        infoLogs = infoLogs.decode("utf-8")
-
-                    infoLogs = infoLogs.split('\n')
-                    for i, infoLog in enumerate(infoLogs):
-                        error_line = re.match('\d\((\d+)\) : error', infoLog)
-                        if error_line is not None:
-                            # show prev 3 lines
-                            error_line = int(error_line.groups()[0]) - 1
-                            for num in range(max(0, error_line - 3), error_line):
-                                infoLogs[i] += "\n\t    %s" % (shader_code_lines[num])
-                            # show last line
-                            infoLogs[i] += "\n\t--> %s" % (shader_code_lines[error_line])
-
-                    infoLogs = "\n".join(infoLogs)
-                    logger.error("%s %s shader compile error.\n%s" % (self.name, shaderType.name, infoLogs))
-                else:
-                    # complete
-                    logger.log(Logger.MINOR_INFO, "Complete %s %s compile." % (self.name, shaderType.name))
-                    return shader
+            return shader
         except:
             logger.error(traceback.format_exc())
         return None
 
+    def check_compile(self, shaderType, shader, shader_code):
+        try:
+            infoLogs = glGetShaderInfoLog(shader)
+            if infoLogs:
+                shader_code_lines = shader_code.split('\n')
+                if type(infoLogs) == bytes:
+                    infoLogs = infoLogs.decode("utf-8")
+
+                infoLogs = infoLogs.split('\n')
+                for i, infoLog in enumerate(infoLogs):
+                    error_line = re.match('\d\((\d+)\) : error', infoLog)
+                    if error_line is not None:
+                        # show prev 3 lines
+                        error_line = int(error_line.groups()[0]) - 1
+                        for num in range(max(0, error_line - 3), error_line):
+                            infoLogs[i] += "\n\t    %s" % (shader_code_lines[num])
+                        # show last line
+                        infoLogs[i] += "\n\t--> %s" % (shader_code_lines[error_line])
+
+                infoLogs = "\n".join(infoLogs)
+                logger.error("%s %s shader compile error.\n%s" % (self.name, shaderType.name, infoLogs))
+            else:
+                # complete
+                logger.log(Logger.MINOR_INFO, "Complete %s %s compile." % (self.name, shaderType.name))
+                return True
+        except:
+            logger.error(traceback.format_exc())
+        return False
+
     def check_validate(self):
         if self.program >= 0:
             glValidateProgram(self.program)
@@ -0,0 +1,98 @@
+import traceback
+
+from OpenGL.GL import *
+
+from Common import logger
+from Utilities import Singleton
+
+try:
+    from OpenGL.GL.KHR.parallel_shader_compile import glMaxShaderCompilerThreadsKHR, GL_COMPLETION_STATUS_KHR
+except:
+    glMaxShaderCompilerThreadsKHR = None
+    GL_COMPLETION_STATUS_KHR = 0x91B1
+
+try:
+    from OpenGL.GL.ARB.parallel_shader_compile import glMaxShaderCompilerThreadsARB
+except:
+    glMaxShaderCompilerThreadsARB = None
+
+
+def GetExtensions():
+    try:
+        return [glGetStringi(GL_EXTENSIONS, i) for i in range(glGetIntegerv(GL_NUM_EXTENSIONS))]
+    except:
+        return (glGetString(GL_EXTENSIONS) or b'').split()
+
+
+class MaterialCompileQueue(Singleton):
+    """
+    The materials are compiled and linked without waiting for the result, and the result is checked later.
+    With GL_KHR_parallel_shader_compile the driver compiles them on its own threads, and only the completed
+    materials are finalized in update. Without it, all pending materials are finalized in update after
+    all of them have been submitted.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.parallel_shader_compile = False
+        self.pending_materials = []  # [(material, callback), ...]
+
+    def initialize(self, enabled):
+        self.enabled = enabled
+        if not enabled:
+            return
+
+        extensions = GetExtensions()
+        parallel_shader_compile_extensions = ((b'GL_KHR_parallel_shader_compile', glMaxShaderCompilerThreadsKHR),
+                                              (b'GL_ARB_parallel_shader_compile', glMaxShaderCompilerThreadsARB))
+        for extension, glMaxShaderCompilerThreads in parallel_shader_compile_extensions:
+            if extension in extensions:
+                try:
+                    if glMaxShaderCompilerThreads is not None:
+                        # 0xFFFFFFFF : implementation-specific maximum
+                        glMaxShaderCompilerThreads(0xFFFFFFFF)
+                    self.parallel_shader_compile = True
+                    logger.info("Parallel shader compile : %s" % extension.decode('utf-8'))
+                    break
+                except:
+                    logger.error(traceback.format_exc())
+
+    def is_completed(self, program):
+        if self.parallel_shader_compile:
+            return glGetProgramiv(program, GL_COMPLETION_STATUS_KHR) == GL_TRUE
+        # The status query would wait for the driver.
+        return True
+
+    def push(self, material, callback=None):
+        """
+        :param callback: callback(material) is called after the material is finalized.
+        """
+        self.pending_materials.append((material, callback))
+
+    def finalize_material(self, material, callback):
+        try:
+            material.finalize()
+            if callback is not None:
+                callback(material)
+        except:
+            logger.error(traceback.format_exc())
+
+    def update(self):
+        if not self.pending_materials:
+            return
+
+        pending_materials = self.pending_materials
+        self.pending_materials = []
+        for material, callback in pending_materials:
+            if material.is_completed():
+                self.finalize_material(material, callback)
+            else:
+                self.pending_materials.append((material, callback))
+
+    def flush(self):
+        pending_materials = self.pending_materials
+        self.pending_materials = []
+        for material, callback in pending_materials:
+            self.finalize_material(material, callback)
+
+    def get_log(self):
+        return "Material compile : %d pending" % len(self.pending_materials)
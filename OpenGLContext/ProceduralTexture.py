@@ -0,0 +1,137 @@
+from collections import OrderedDict
+
+import numpy as np
+from OpenGL.GL import *
+
+from .Texture import Texture2D, Texture3D, TextureCube
+
+
+class ProceduralTexture:
+    def __init__(self, name, generator, version=1, cache_to_disk=False):
+        """
+        :param generator: generator() returns the texture datas. It uses only numpy, so it runs on any thread.
+        :param version: increase it when the generator is changed, then the cached texture file is generated again.
+        :param cache_to_disk: save the generated texture to the texture file, and load it next time.
+        """
+        self.name = name
+        self.generator = generator
+        self.version = version
+        self.cache_to_disk = cache_to_disk
+
+    def generate(self):
+        return self.generator()
+
+
+# { texture name : ProceduralTexture }
+procedural_textures = OrderedDict()
+
+
+def regist_procedural_texture(name, version=1, cache_to_disk=False):
+    """
+    The decorator which registers the generator of the built-in texture.
+    The texture is generated when it is used at first.
+    """
+    def decorator(generator):
+        procedural_textures[name] = ProceduralTexture(name, generator, version, cache_to_disk)
+        return generator
+    return decorator
+
+
+@regist_procedural_texture('empty', cache_to_disk=True)
+def generate_empty_texture():
+    # the gray checker board of 4x4 cells.
+    size = 512
+    y, x = np.mgrid[0:size, 0:size]
+    checker = ((x // 128 + y // 128) % 2 == 0)
+    data = np.where(checker, 223, 44).astype(np.uint8)
+    return dict(
+        texture_type=Texture2D,
+        image_mode='RGB',
+        width=size,
+        height=size,
+        data=np.repeat(data[:, :, None], 3, axis=2)
+    )
+
+
+@regist_procedural_texture('default_3d')
+def generate_default_3d_texture():
+    # the gradient of the texture coordinates.
+    size = 64
+    z, y, x = np.mgrid[0:size, 0:size, 0:size]
+    value = 255.0 / float(size)
+    data = np.empty((size, size, size, 4), dtype=np.uint8)
+    data[..., 0] = x * value
+    data[..., 1] = y * value
+    data[..., 2] = z * value
+    data[..., 3] = 255
+    return dict(
+        texture_type=Texture3D,
+        image_mode='RGBA',
+        width=size,
+        height=size,
+        depth=size,
+        internal_format=GL_RGBA8,
+        texture_format=GL_RGBA,
+        min_filter=GL_NEAREST,
+        mag_filter=GL_NEAREST,
+        data_type=GL_UNSIGNED_BYTE,
+        wrap=GL_CLAMP_TO_EDGE,
+        data=data
+    )
+
+
+@regist_procedural_texture('default_cube')
+def generate_default_cube_texture():
+    # the gradient of the sky, the horizon and the ground.
+    size = 64
+    t, s = (np.mgrid[0:size, 0:size] + 0.5) * (2.0 / size) - 1.0
+    one = np.ones_like(s)
+    # the directions of the texels of the faces in the order of the GL_TEXTURE_CUBE_MAP_POSITIVE_X + i
+    directions = dict(
+        texture_positive_x=(one, -t, -s),
+        texture_negative_x=(-one, -t, s),
+        texture_positive_y=(s, one, t),
+        texture_negative_y=(s, -one, -t),
+        texture_positive_z=(s, -t, one),
+        texture_negative_z=(-s, -t, -one),
+    )
+    sky_color = np.array([0.35, 0.55, 0.85], dtype=np.float32)
+    horizon_color = np.array([0.8, 0.8, 0.8], dtype=np.float32)
+    ground_color = np.array([0.2, 0.18, 0.16], dtype=np.float32)
+
+    face_datas = {}
+    for face, (x, y, z) in directions.items():
+        up = (y / np.sqrt(x * x + y * y + z * z))[:, :, None]
+        color = np.where(0.0 < up,
+                         horizon_color + (sky_color - horizon_color) * up,
+                         horizon_color + (ground_color - horizon_color) * np.minimum(1.0, -up * 4.0))
+        face_datas[face] = [(color * 255.0).astype(np.uint8), ]
+    return dict(
+        texture_type=TextureCube,
+        image_mode='RGB',
+        width=size,
+        height=size,
+        face_datas=face_datas
+    )
+
+
+@regist_procedural_texture('ssao_rotation_noise')
+def generate_ssao_rotation_noise_texture():
+    # the random unit vectors on the xz plane. The seed is fixed to be the same noise every time.
+    size = 256
+    angle = np.random.RandomState(0).uniform(0.0, np.pi * 2.0, (size, size))
+    data = np.zeros((size, size, 3), dtype=np.float16)
+    data[..., 0] = np.cos(angle)
+    data[..., 2] = np.sin(angle)
+    return dict(
+        texture_type=Texture2D,
+        width=size,
+        height=size,
+        internal_format=GL_RGB16F,
+        texture_format=GL_RGB,
+        data_type=GL_HALF_FLOAT,
+        min_filter=GL_LINEAR,
+        mag_filter=GL_LINEAR,
+        wrap=GL_REPEAT,
+        data=data
+    )
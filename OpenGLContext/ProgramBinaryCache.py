@@ -0,0 +1,131 @@
+import hashlib
+import os
+import struct
+import traceback
+
+import numpy as np
+from OpenGL.GL import *
+
+from Common import logger
+from Utilities import Singleton, check_directory_and_mkdir
+
+
+class ProgramBinaryCache(Singleton):
+    """
+    Process-wide cache of the linked program binaries, shared between projects.
+    The file name is the hash of the final shader codes and the driver ( GL_VENDOR, GL_RENDERER, GL_VERSION ),
+    and the file has a small header with the binary format followed by the raw program binary.
+    """
+    fileExt = '.bin'
+    file_magic = b'PYEPROG\x00'
+    file_header = struct.Struct('<8sI')
+
+    def __init__(self):
+        self.cache_path = ''
+        self.max_size = 0
+        self.driver_info = None
+        self.binary_formats = None
+        self.hit_count = 0
+        self.miss_count = 0
+        self.save_count = 0
+
+    def initialize(self, cache_path, max_size_mb):
+        self.cache_path = cache_path
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        check_directory_and_mkdir(self.cache_path)
+
+    def is_enabled(self):
+        return bool(self.cache_path) and 0 < self.max_size and self.get_binary_formats() is not None
+
+    def get_driver_info(self):
+        if self.driver_info is None:
+            driver_info = []
+            for name in (GL_VENDOR, GL_RENDERER, GL_VERSION):
+                value = glGetString(name) or b''
+                driver_info.append(value.decode('utf-8', 'ignore') if type(value) is bytes else str(value))
+            self.driver_info = "\n".join(driver_info)
+        return self.driver_info
+
+    def get_binary_formats(self):
+        """
+        :return: list of the supported binary formats, empty list if unknown, or None if not supported.
+        """
+        if self.binary_formats is None:
+            try:
+                if glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) < 1:
+                    logger.info("Program binary is not supported.")
+                    return None
+                self.binary_formats = np.array(glGetIntegerv(GL_PROGRAM_BINARY_FORMATS)).reshape(-1).tolist()
+            except:
+                self.binary_formats = []
+        return self.binary_formats
+
+    def get_filepath(self, shader_codes):
+        key = hashlib.sha1(self.get_driver_info().encode('utf-8'))
+        for shader_type_name, shader_code in sorted((getattr(shader_type, 'name', str(shader_type)), shader_code)
+                                                    for shader_type, shader_code in shader_codes.items()):
+            key.update(shader_type_name.encode('utf-8'))
+            key.update(shader_code.encode('utf-8'))
+        return os.path.join(self.cache_path, key.hexdigest() + self.fileExt)
+
+    def load(self, shader_codes):
+        """
+        :return: binary_format, binary_data
+        """
+        if shader_codes and self.is_enabled():
+            filepath = self.get_filepath(shader_codes)
+            if os.path.exists(filepath):
+                try:
+                    with open(filepath, 'rb') as f:
+                        magic, binary_format = self.file_header.unpack(f.read(self.file_header.size))
+                        binary_data = f.read()
+                    binary_formats = self.get_binary_formats()
+                    if magic == self.file_magic and (not binary_formats or binary_format in binary_formats):
+                        # mark as recently used for the garbage collection.
+                        os.utime(filepath)
+                        self.hit_count += 1
+                        return binary_format, binary_data
+                except:
+                    logger.error(traceback.format_exc())
+        self.miss_count += 1
+        return None, None
+
+    def save(self, shader_codes, binary_format, binary_data):
+        if not shader_codes or binary_format is None or not binary_data or not self.is_enabled():
+            return
+
+        filepath = self.get_filepath(shader_codes)
+        try:
+            with open(filepath, 'wb') as f:
+                f.write(self.file_header.pack(self.file_magic, binary_format))
+                f.write(binary_data)
+            self.save_count += 1
+        except:
+            logger.error(traceback.format_exc())
+        self.collect_garbage()
+
+    def collect_garbage(self):
+        """
+        Remove the least recently used files until the total size is under max_size.
+        """
+        cache_files = []
+        total_size = 0
+        for filename in os.listdir(self.cache_path):
+            if filename.endswith(self.fileExt):
+                filepath = os.path.join(self.cache_path, filename)
+                stat = os.stat(filepath)
+                cache_files.append((stat.st_mtime, stat.st_size, filepath))
+                total_size += stat.st_size
+
+        cache_files.sort()
+        for modify_time, size, filepath in cache_files:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(filepath)
+                total_size -= size
+            except:
+                logger.error(traceback.format_exc())
+
+    def get_log(self):
+        return "Program binary cache : hit %d, miss %d, save %d" % (self.hit_count, self.miss_count, self.save_count)
@@ -0,0 +1,132 @@
+import ctypes
+import traceback
+
+import numpy as np
+from OpenGL.GL import *
+
+from Common import logger
+from Utilities import Singleton
+from .GLStateCache import GLStateCache
+
+
+class FrameRingBuffer(Singleton):
+    """
+    The frame allocator of the per-frame data ( uniform blocks, instance data ).
+    The buffer is persistently mapped ( glBufferStorage with GL_MAP_PERSISTENT_BIT ) and exposed as numpy array,
+    and divided into the regions of frame_count frames. The region of a frame is reused after the fence of
+    the frame is signaled, so the data is written directly with numpy and bound by the offset.
+    If glBufferStorage is not supported, the written range is uploaded with glBufferSubData instead.
+    """
+    def __init__(self):
+        self.valid = False
+        self.persistent = False
+        self.buffer = None
+        self.data = None
+        self.size_per_frame = 0
+        self.frame_count = 0
+        self.frame_index = 0
+        self.offset = 0
+        self.fences = []
+        self.uniform_alignment = 256
+        self.overflow_count = 0
+
+    def initialize(self, size_per_frame, frame_count=3):
+        self.uniform_alignment = max(16, int(glGetIntegerv(GL_UNIFORM_BUFFER_OFFSET_ALIGNMENT)))
+        self.size_per_frame = (size_per_frame + self.uniform_alignment - 1) // self.uniform_alignment * \
+            self.uniform_alignment
+        self.frame_count = frame_count
+        self.fences = [None, ] * frame_count
+        size = self.size_per_frame * frame_count
+
+        self.buffer = glGenBuffers(1)
+        GLStateCache.instance().bind_buffer(GL_COPY_WRITE_BUFFER, self.buffer)
+        try:
+            flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+            glBufferStorage(GL_COPY_WRITE_BUFFER, size, None, flags)
+            address = ctypes.cast(glMapBufferRange(GL_COPY_WRITE_BUFFER, 0, size, flags), ctypes.c_void_p).value
+            self.data = np.ctypeslib.as_array((ctypes.c_ubyte * size).from_address(address))
+            self.persistent = True
+        except:
+            logger.warn("Persistent mapped buffer is not supported. Use glBufferSubData.")
+            logger.info(traceback.format_exc())
+            glDeleteBuffers(1, [self.buffer, ])
+            GLStateCache.instance().delete_buffer(self.buffer)
+            self.buffer = glGenBuffers(1)
+            GLStateCache.instance().bind_buffer(GL_COPY_WRITE_BUFFER, self.buffer)
+            glBufferData(GL_COPY_WRITE_BUFFER, size, None, GL_STREAM_DRAW)
+            self.data = np.zeros(size, dtype=np.ubyte)
+            self.persistent = False
+        GLStateCache.instance().bind_buffer(GL_COPY_WRITE_BUFFER, 0)
+        self.valid = True
+
+    def delete(self):
+        if self.valid:
+            for fence in self.fences:
+                if fence is not None:
+                    glDeleteSync(fence)
+            if self.persistent:
+                GLStateCache.instance().bind_buffer(GL_COPY_WRITE_BUFFER, self.buffer)
+                glUnmapBuffer(GL_COPY_WRITE_BUFFER)
+                GLStateCache.instance().bind_buffer(GL_COPY_WRITE_BUFFER, 0)
+            glDeleteBuffers(1, [self.buffer, ])
+            GLStateCache.instance().delete_buffer(self.buffer)
+            self.data = None
+            self.valid = False
+
+    def begin_frame(self):
+        """
+        Wait until the gpu has finished the frame which used the region of this frame.
+        """
+        if not self.valid:
+            return
+
+        self.frame_index = (self.frame_index + 1) % self.frame_count
+        self.offset = 0
+        fence = self.fences[self.frame_index]
+        if fence is not None:
+            # 1 second timeout in nanoseconds
+            while glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 1000000000) == GL_TIMEOUT_EXPIRED:
+                pass
+            glDeleteSync(fence)
+            self.fences[self.frame_index] = None
+
+    def end_frame(self):
+        if self.valid:
+            self.fences[self.frame_index] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+    def allocate(self, size, alignment=16):
+        """
+        :return: offset in the buffer, numpy ubyte array of the allocated range. or (None, None) if it's full.
+        """
+        if not self.valid:
+            return None, None
+
+        offset = (self.offset + alignment - 1) // alignment * alignment
+        if self.size_per_frame < offset + size:
+            if self.overflow_count == 0:
+                logger.warn("FrameRingBuffer is full. (%d bytes per frame)" % self.size_per_frame)
+            self.overflow_count += 1
+            return None, None
+        self.offset = offset + size
+        offset += self.frame_index * self.size_per_frame
+        return offset, self.data[offset:offset + size]
+
+    def commit(self, offset, size):
+        """
+        Upload the written range. The persistent mapped buffer doesn't need it.
+        """
+        if not self.persistent:
+            GLStateCache.instance().bind_buffer(GL_COPY_WRITE_BUFFER, self.buffer)
+            glBufferSubData(GL_COPY_WRITE_BUFFER, offset, size, self.data[offset:offset + size])
+            GLStateCache.instance().bind_buffer(GL_COPY_WRITE_BUFFER, 0)
+
+    def write(self, data, alignment=16):
+        """
+        :return: offset of the written data in the buffer, or None if it's full.
+        """
+        data = np.ascontiguousarray(data)
+        offset, buffer_data = self.allocate(data.nbytes, alignment)
+        if offset is not None:
+            buffer_data[...] = data.view(np.ubyte).reshape(-1)
+            self.commit(offset, data.nbytes)
+        return offset
@@ -13,6 +13,7 @@ from OpenGL.GL import *
 from Common import logger
 from Utilities import GetClassName, Attributes, Logger
 from App import CoreManager
+from .UniformBlock import MaterialUniformBlock
 
 reInclude = re.compile('\#include\s+[\"|\<](.+?)[\"|\>]')  # [include file name, ]
 reVersion = re.compile("(\#version\s+.+)")  # [version code, ]
@@ -123,6 +124,161 @@ def parsing_material_components(shader_code_list):
     return re.findall(reFindUniform, "\n".join(material_components))
 
 
+# std140 layout - { uniform type : (base alignment, size) }. The columns of the matrix are aligned to vec4.
+std140_layouts = dict(bool=(4, 4), int=(4, 4), float=(4, 4),
+                      vec2=(8, 8), vec3=(16, 12), vec4=(16, 16),
+                      mat2=(16, 32), mat3=(16, 48), mat4=(16, 64))
+
+
+def get_material_uniform_block_layout(material_components):
+    """
+    The std140 layout of the material components except the samplers and the arrays.
+    :param material_components: [(uniform type, uniform name), ] from parsing_material_components
+    :return: [(uniform type, uniform name, offset), ], block size
+    """
+    material_uniform_block = []
+    uniform_names = set()
+    offset = 0
+    for uniform_type, uniform_name in material_components:
+        if uniform_type in std140_layouts and '[' not in uniform_name and uniform_name not in uniform_names:
+            alignment, size = std140_layouts[uniform_type]
+            offset = (offset + alignment - 1) // alignment * alignment
+            material_uniform_block.append((uniform_type, uniform_name, offset))
+            uniform_names.add(uniform_name)
+            offset += size
+    return material_uniform_block, (offset + 15) // 16 * 16
+
+
+def generate_material_uniform_block(shader_code, material_uniform_block):
+    """
+    Move the declarations of the material components into the std140 uniform block.
+    The same block is declared in all stages which have the material components.
+    :param material_uniform_block: [(uniform type, uniform name, offset), ] from get_material_uniform_block_layout
+    """
+    block_uniform_names = set(uniform_name for uniform_type, uniform_name, offset in material_uniform_block)
+    block_code_lines = ["layout(std140, binding=%d) uniform %s" % (MaterialUniformBlock.binding,
+                                                                   MaterialUniformBlock.block_name), "{"]
+    block_code_lines.extend(["    %s %s;" % (uniform_type, uniform_name)
+                             for uniform_type, uniform_name, offset in material_uniform_block])
+    block_code_lines.append("};")
+
+    final_code_lines = []
+    depth = 0
+    is_in_material_block = False
+    is_declared = False
+    for code_line in shader_code.splitlines():
+        m = re.search(reMacro, code_line.split("//")[0])
+        if m is not None:
+            macro_type, macro_value = [group.strip() for group in m.groups()]
+            if macro_type in ('ifdef', 'ifndef', 'if'):
+                if is_in_material_block:
+                    depth += 1
+                elif macro_type == 'ifdef' and 'MATERIAL_COMPONENTS' == macro_value.split(" ")[0]:
+                    is_in_material_block = True
+                    depth = 1
+                    final_code_lines.append(code_line)
+                    if not is_declared:
+                        final_code_lines.extend(block_code_lines)
+                        is_declared = True
+                    continue
+            elif macro_type == 'endif' and is_in_material_block:
+                depth -= 1
+                if depth == 0:
+                    is_in_material_block = False
+        elif is_in_material_block:
+            uniform = re.search(reFindUniform, code_line.split("//")[0])
+            if uniform is not None and uniform.groups()[1] in block_uniform_names:
+                continue
+        final_code_lines.append(code_line)
+    return "\n".join(final_code_lines)
+
+
+LINE_CODE = 0
+LINE_MACRO = 1
+LINE_VERSION = 2
+LINE_INCLUDE = 3
+
+
+def parsing_shader_code(shader_code, remove_comment=True):
+    """
+    Parse the shader code into the lines for Shader.__parsing_final_code__, so that the regular expressions run once.
+    :return: [(line type, code, value), ]
+        LINE_CODE - value is None
+        LINE_MACRO - value is (macro type, expression, variables of the expression sorted by length)
+        LINE_VERSION - value is the version code
+        LINE_INCLUDE - value is the include file name
+    """
+    if remove_comment:
+        # remove comment block
+        shader_code = re.sub(reComment, "", shader_code)
+
+    parsed_code = []
+    for code in shader_code.splitlines():
+        # remove comment
+        if "//" in code:
+            code = code.split("//")[0]
+
+        m = re.search(reMacroStart, code)
+        if m is not None:
+            macro, expression = m.groups()
+            expression = expression.strip()
+            variables = None
+            if macro in ('if', 'elif'):
+                variables = re.findall(reVariable, expression)
+                variables.sort(key=lambda x: len(x), reverse=True)
+            parsed_code.append((LINE_MACRO, code, (macro, expression, variables)))
+            continue
+
+        m = re.search(reVersion, code)
+        if m is not None:
+            parsed_code.append((LINE_VERSION, code, m.groups()[0].strip()))
+            continue
+
+        m = re.search(reInclude, code)
+        if m is not None:
+            parsed_code.append((LINE_INCLUDE, code, m.groups()[0]))
+            continue
+
+        parsed_code.append((LINE_CODE, code, None))
+    return parsed_code
+
+
+class ShaderIncludeCache:
+    """
+    The parsed codes of the include files shared by all shaders. The file is parsed again when it is modified.
+    """
+    def __init__(self):
+        self.parsed_codes = {}  # { filepath : (modify_time, size, parsed_code) }
+
+    def clear(self):
+        self.parsed_codes = {}
+
+    def get_parsed_code(self, filepath):
+        """
+        :return: parsed code or None if the file can't be read.
+        """
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+
+        cache = self.parsed_codes.get(filepath)
+        if cache is not None and cache[0] == stat.st_mtime and cache[1] == stat.st_size:
+            return cache[2]
+
+        try:
+            f = codecs.open(filepath, mode='r', encoding='utf-8')
+            include_source = f.read()
+            f.close()
+        except:
+            logger.error(traceback.format_exc())
+            return None
+
+        parsed_code = parsing_shader_code(include_source)
+        self.parsed_codes[filepath] = (stat.st_mtime, stat.st_size, parsed_code)
+        return parsed_code
+
+
 class Shader:
     default_macros = dict(MATERIAL_COMPONENTS=1)
 
@@ -131,6 +287,10 @@ class Shader:
         self.name = shader_name
         self.shader_code = shader_code
         self.include_files = []
+        # The include files of the last generate_shader_codes.
+        self.generated_include_files = []
+        # The lines of the shader code parsed by parsing_shader_code.
+        self.parsed_code = None
         self.attribute = Attributes()
 
     def get_save_data(self):
@@ -142,6 +302,7 @@ class Shader:
 
     def generate_shader_codes(self, shader_version, external_macros={}):
         shader_codes = {}
+        self.generated_include_files = []
         for shader_type in shader_types:
             shader_code = self.__parsing_final_code__(shader_type.name, shader_version, external_macros)
             # If it is not a vertex shader or fragment shader, you must have a main function.
@@ -152,14 +313,15 @@ class Shader:
             return None
         return shader_codes
 
+    def get_parsed_code(self):
+        if self.parsed_code is None:
+            self.parsed_code = parsing_shader_code(self.shader_code)
+        return self.parsed_code
+
     def __parsing_final_code__(self, shader_type_name, shader_version, external_macros={}):
         if self.shader_code == "" or self.shader_code is None:
             return ""
 
-        # remove comment block
-        shader_code = re.sub(reComment, "", self.shader_code)
-        code_lines = shader_code.splitlines()
-
         # combine macro
         combined_macros = OrderedDict()
         # default macro
@@ -173,7 +335,7 @@ class Shader:
             external_macros = {}
 
         for macro in external_macros:
-            if external_macros[macro] is None or external_macros[macro] is '':
+            if external_macros[macro] is None or external_macros[macro] == '':
                 combined_macros[macro] = 0
             else:
                 combined_macros[macro] = external_macros[macro]
@@ -187,27 +349,26 @@ class Shader:
 
         # insert version as comment
         include_files = dict()  # { 'filename': uuid }
-        resource_manager = CoreManager.instance().resource_manager
-        shader_file_dir = resource_manager.shader_loader.resource_path
+        shader_loader = CoreManager.instance().resource_manager.shader_loader
+        shader_file_dir = shader_loader.resource_path
+        include_cache = shader_loader.include_cache
 
-        # do parsing
-        line_num = 0
+        # do parsing. The included codes are pushed to the stack instead of splicing the lines.
+        code_stack = [iter(self.get_parsed_code()), ]
         macro_depth = 0
         macro_result = [True, ]
         macro_code_remove = True
-        while line_num < len(code_lines):
-            code = code_lines[line_num]
-            line_num += 1
+        while code_stack:
+            line = next(code_stack[-1], None)
+            if line is None:
+                code_stack.pop()
+                continue
 
-            # remove comment
-            if "//" in code:
-                code = code.split("//")[0]
+            line_type, code, value = line
 
             # macro parsing
-            m = re.search(reMacroStart, code)
-            if m is not None:
-                macro, expression = m.groups()
-                expression = expression.strip()
+            if line_type == LINE_MACRO:
+                macro, expression, variables = value
                 if macro == 'define' or macro == 'undef':
                     define_expression = expression.split('(')[0].strip()
                     if ' ' in define_expression:
@@ -236,8 +397,6 @@ class Shader:
                     else:
                         macro_result.append(False)
                 elif macro == 'if' or macro == 'elif' and not macro_result[macro_depth]:
-                    variables = re.findall(reVariable, expression)
-                    variables.sort(key=lambda x: len(x), reverse=True)
                     for variable in variables:
                         if variable in combined_macros:
                             while True:
@@ -270,51 +429,42 @@ class Shader:
                 continue
 
             # is version code?
-            m = re.search(reVersion, code)
-            if m is not None:
-                version_code = m.groups()[0].strip()
+            if line_type == LINE_VERSION:
+                version_code = value
                 if final_code_lines[0] == "" or version_code > final_code_lines[0]:
                     final_code_lines[0] = version_code
                 continue
 
             # find include block
-            m = re.search(reInclude, code)
-            if m is not None:
-                valid = True
-                include_file = os.path.join(shader_file_dir, m.groups()[0])
+            if line_type == LINE_INCLUDE:
+                include_file = os.path.join(shader_file_dir, value)
+                include_code_lines = include_cache.get_parsed_code(include_file)
 
                 # insert include code
-                if os.path.exists(include_file):
-                    try:
-                        f = codecs.open(include_file, mode='r', encoding='utf-8')
-                        include_source = f.read()
-                        # remove comment block
-                        include_source = re.sub(reComment, "", include_source)
-                        include_code_lines = include_source.splitlines()
-                        f.close()
-                    except:
-                        logger.error(traceback.format_exc())
-                        valid = False
-
-                    if valid:
-                        if include_file in include_files:
-                            unique_id = include_files[include_file]
-                        else:
-                            unique_id = "UUID_" + str(uuid.uuid3(uuid.NAMESPACE_DNS, include_file)).replace("-", "_")
-                            include_files[include_file] = unique_id
-
-                            if include_file not in self.include_files:
-                                self.include_files.append(include_file)
-                        # insert included code
-                        final_code_lines.append("//------------ INCLUDE -------------//")
-                        final_code_lines.append("// " + code)  # include comment
-                        include_code_lines.insert(0, "#ifndef %s" % unique_id)
-                        include_code_lines.insert(1, "#define %s" % unique_id)
-                        include_code_lines.append("#endif /* %s */" % unique_id)
-                        code_lines = include_code_lines + code_lines[line_num:]
-                        line_num = 0
-                if not valid:
+                if include_code_lines is not None:
+                    if include_file in include_files:
+                        unique_id = include_files[include_file]
+                    else:
+                        unique_id = "UUID_" + str(uuid.uuid3(uuid.NAMESPACE_DNS, include_file)).replace("-", "_")
+                        include_files[include_file] = unique_id
+
+                        if include_file not in self.include_files:
+                            self.include_files.append(include_file)
+                        if include_file not in self.generated_include_files:
+                            self.generated_include_files.append(include_file)
+                    # insert included code
+                    final_code_lines.append("//------------ INCLUDE -------------//")
+                    final_code_lines.append("// " + code)  # include comment
+                    code_stack.append(iter(parsing_shader_code("#endif /* %s */" % unique_id, remove_comment=False)))
+                    code_stack.append(iter(include_code_lines))
+                    code_stack.append(iter(parsing_shader_code("#ifndef %s\n#define %s" % (unique_id, unique_id))))
+                else:
                     logger.error("Cannot open %s file." % include_file)
+                    # the missing file is a dependency too, the generated code is invalid when the file is created.
+                    if include_file not in self.include_files:
+                        self.include_files.append(include_file)
+                    if include_file not in self.generated_include_files:
+                        self.generated_include_files.append(include_file)
                 continue
             # append code block
             final_code_lines.append(code)
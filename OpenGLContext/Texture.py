@@ -2,10 +2,26 @@ import gc
 from ctypes import c_void_p
 import itertools
 
+import numpy as np
 from OpenGL.GL import *
+from OpenGL.GL.EXT.texture_compression_s3tc import *
 
 from Common import logger
 from Utilities import Singleton, GetClassName, Attributes
+from .GLStateCache import GLStateCache
+
+
+COMPRESSED_FORMATS = (GL_COMPRESSED_RGB_S3TC_DXT1_EXT, GL_COMPRESSED_RGBA_S3TC_DXT1_EXT,
+                      GL_COMPRESSED_RGBA_S3TC_DXT3_EXT, GL_COMPRESSED_RGBA_S3TC_DXT5_EXT,
+                      GL_COMPRESSED_RED_RGTC1, GL_COMPRESSED_RG_RGTC2)
+# the compressed formats of 8 bytes per 4x4 block. The others are 16 bytes.
+COMPRESSED_FORMATS_8_BYTES = (GL_COMPRESSED_RGB_S3TC_DXT1_EXT, GL_COMPRESSED_RGBA_S3TC_DXT1_EXT,
+                              GL_COMPRESSED_RED_RGTC1)
+
+
+def get_compressed_image_size(internal_format, width, height):
+    block_size = 8 if internal_format in COMPRESSED_FORMATS_8_BYTES else 16
+    return ((width + 3) // 4) * ((height + 3) // 4) * block_size
 
 
 def get_internal_format(str_image_mode):
@@ -62,6 +78,8 @@ class Texture:
         self.texture_format = texture_data.get('texture_format')
         self.sRGB = texture_data.get('sRGB', None)
         self.multisample_count = 0
+        # the data is the block compressed image of the internal format.
+        self.compressed = self.internal_format in COMPRESSED_FORMATS
 
         if self.internal_format is None and self.image_mode:
             self.internal_format = get_internal_format(self.image_mode)
@@ -105,6 +123,7 @@ class Texture:
     def delete(self):
         logger.info("Delete %s : %s" % (GetClassName(self), self.name))
         glDeleteTextures([self.buffer, ])
+        GLStateCache.instance().delete_texture(self.buffer)
         self.buffer = -1
 
     def get_save_data(self, get_image_data=True):
@@ -133,14 +152,14 @@ class Texture:
             return None
 
         if GL_TEXTURE_2D == self.target:
-            glBindTexture(self.target, self.buffer)
+            GLStateCache.instance().bind_texture(self.target, self.buffer)
             data = glGetTexImage(self.target, 0, self.texture_format, self.data_type)
-            glBindTexture(self.target, 0)
+            GLStateCache.instance().bind_texture(self.target, 0)
             return data
         elif GL_TEXTURE_3D == self.target:
-            glBindTexture(self.target, self.buffer)
+            GLStateCache.instance().bind_texture(self.target, self.buffer)
             fb = glGenFramebuffers(1)
-            glBindFramebuffer(GL_FRAMEBUFFER, fb)
+            GLStateCache.instance().bind_framebuffer(GL_FRAMEBUFFER, fb)
 
             data = []
             for layer in range(self.depth):
@@ -151,14 +170,15 @@ class Texture:
                 data.append(pixels.tolist())
             # list concatenate
             data = list(itertools.chain(*data))
-            glBindTexture(self.target, 0)
-            glBindFramebuffer(GL_FRAMEBUFFER, 0)
+            GLStateCache.instance().bind_texture(self.target, 0)
+            GLStateCache.instance().bind_framebuffer(GL_FRAMEBUFFER, 0)
             glDeleteFramebuffers(1, [fb, ])
+            GLStateCache.instance().delete_framebuffer(fb)
         return data
 
     def generate_mipmap(self):
         if self.enable_mipmap:
-            glBindTexture(self.target, self.buffer)
+            GLStateCache.instance().bind_texture(self.target, self.buffer)
             glGenerateMipmap(self.target)
         else:
             logger.warn('%s disable to generate mipmap.' % self.name)
@@ -167,7 +187,7 @@ class Texture:
         if self.buffer == -1:
             logger.warn("%s texture is invalid." % self.name)
             return
-        glBindTexture(self.target, self.buffer)
+        GLStateCache.instance().bind_texture(self.target, self.buffer)
         # if self.attachment:
         #     error_msg = "%s can not bind to a texture because it is attached to a frame buffer.." % self.name
         #     logger.error(error_msg)
@@ -203,20 +223,42 @@ class Texture2D(Texture):
         Texture.__init__(self, **texture_data)
 
         data = texture_data.get('data', c_void_p(0))
+        # the mip levels from the level 1, which are generated when the texture file is saved.
+        mipmap_datas = texture_data.get('mipmap_datas') if self.enable_mipmap else None
 
         self.buffer = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, self.buffer)
-        glTexImage2D(GL_TEXTURE_2D,
-                     0,
-                     self.internal_format,
-                     self.width,
-                     self.height,
-                     0,
-                     self.texture_format,
-                     self.data_type,
-                     data)
-
-        if self.enable_mipmap:
+        GLStateCache.instance().bind_texture(GL_TEXTURE_2D, self.buffer)
+        if mipmap_datas:
+            # the rows of the mip levels are tightly packed.
+            glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+
+        def tex_image_2d(level, level_data):
+            width = max(1, self.width >> level)
+            height = max(1, self.height >> level)
+            if self.compressed:
+                glCompressedTexImage2D(GL_TEXTURE_2D, level, self.internal_format, width, height, 0, level_data)
+            else:
+                glTexImage2D(GL_TEXTURE_2D,
+                             level,
+                             self.internal_format,
+                             width,
+                             height,
+                             0,
+                             self.texture_format,
+                             self.data_type,
+                             level_data)
+
+        tex_image_2d(0, data)
+
+        if mipmap_datas:
+            for level, mipmap_data in enumerate(mipmap_datas, 1):
+                tex_image_2d(level, mipmap_data)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, len(mipmap_datas))
+            glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+        elif self.compressed:
+            # the compressed texture can't generate the mipmap.
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, 0)
+        elif self.enable_mipmap:
             glGenerateMipmap(GL_TEXTURE_2D)
             # create indivisual mipmapThis creates a texture with a single mipmap level.
             # You will also need separate glTexSubImage2D calls to upload each mipmap
@@ -227,7 +269,7 @@ class Texture2D(Texture):
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, self.wrap)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, self.min_filter)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, self.mag_filter)
-        glBindTexture(GL_TEXTURE_2D, 0)
+        GLStateCache.instance().bind_texture(GL_TEXTURE_2D, 0)
 
 
 class Texture3D(Texture):
@@ -239,7 +281,7 @@ class Texture3D(Texture):
         data = texture_data.get('data', c_void_p(0))
 
         self.buffer = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_3D, self.buffer)
+        GLStateCache.instance().bind_texture(GL_TEXTURE_3D, self.buffer)
         glTexImage3D(GL_TEXTURE_3D,
                      0,
                      self.internal_format,
@@ -263,7 +305,7 @@ class Texture3D(Texture):
         glTexParameteri(GL_TEXTURE_3D, GL_TEXTURE_WRAP_R, self.wrap)
         glTexParameteri(GL_TEXTURE_3D, GL_TEXTURE_MIN_FILTER, self.min_filter)
         glTexParameteri(GL_TEXTURE_3D, GL_TEXTURE_MAG_FILTER, self.mag_filter)
-        glBindTexture(GL_TEXTURE_3D, 0)
+        GLStateCache.instance().bind_texture(GL_TEXTURE_3D, 0)
 
 
 class Texture2DMultiSample(Texture):
@@ -276,86 +318,114 @@ class Texture2DMultiSample(Texture):
         self.multisample_count = multisample_count - (multisample_count % 4)
 
         self.buffer = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D_MULTISAMPLE, self.buffer)
+        GLStateCache.instance().bind_texture(GL_TEXTURE_2D_MULTISAMPLE, self.buffer)
         glTexImage2DMultisample(GL_TEXTURE_2D_MULTISAMPLE,
                                 self.multisample_count,
                                 self.internal_format,
                                 self.width,
                                 self.height,
                                 GL_TRUE)
-        glBindTexture(GL_TEXTURE_2D_MULTISAMPLE, 0)
+        GLStateCache.instance().bind_texture(GL_TEXTURE_2D_MULTISAMPLE, 0)
 
 
 class TextureCube(Texture):
     target = GL_TEXTURE_CUBE_MAP
     default_wrap = GL_CLAMP_TO_EDGE
+    # in the order of GL_TEXTURE_CUBE_MAP_POSITIVE_X + index
+    faces = ('texture_positive_x', 'texture_negative_x', 'texture_positive_y',
+             'texture_negative_y', 'texture_positive_z', 'texture_negative_z')
 
     def __init__(self, **texture_data):
         Texture.__init__(self, **texture_data)
 
-        self.texture_positive_x = texture_data.get('texture_positive_x')
-        self.texture_negative_x = texture_data.get('texture_negative_x')
-        self.texture_positive_y = texture_data.get('texture_positive_y')
-        self.texture_negative_y = texture_data.get('texture_negative_y')
-        self.texture_positive_z = texture_data.get('texture_positive_z')
-        self.texture_negative_z = texture_data.get('texture_negative_z')
+        # the face is the face texture which is copied on the gpu, or the name of the face texture.
+        for face in self.faces:
+            setattr(self, face, texture_data.get(face))
+
+        # { face : [level 0 data, level 1 data, ...] } the image levels of the faces on the cpu.
+        face_datas = texture_data.get('face_datas') or {}
+        mip_count = min([len(face_datas[face]) for face in self.faces if face_datas.get(face)] or [1, ])
+        # the mip chain of the uploaded faces is used as it is.
+        self.generate_face_mipmap = self.enable_mipmap and not self.compressed and 1 == mip_count
 
         self.buffer = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_CUBE_MAP, self.buffer)
-
-        def createTexImage2D(cube_index, texture):
-            if texture:
-                return glTexImage2D(cube_index,
-                                    0,
-                                    texture.internal_format,
-                                    texture.width,
-                                    texture.height,
-                                    0,
-                                    texture.texture_format,
-                                    texture.data_type,
-                                    texture.get_image_data())
-            else:
-                return glTexImage2D(cube_index,
-                                    0,
-                                    self.internal_format,
-                                    self.width,
-                                    self.height,
-                                    0,
-                                    self.texture_format,
-                                    self.data_type,
-                                    c_void_p(0))
-
-        createTexImage2D(GL_TEXTURE_CUBE_MAP_POSITIVE_X, self.texture_positive_x)
-        createTexImage2D(GL_TEXTURE_CUBE_MAP_NEGATIVE_X, self.texture_negative_x)
-        createTexImage2D(GL_TEXTURE_CUBE_MAP_POSITIVE_Y, self.texture_positive_y)
-        createTexImage2D(GL_TEXTURE_CUBE_MAP_NEGATIVE_Y, self.texture_negative_y)
-        createTexImage2D(GL_TEXTURE_CUBE_MAP_POSITIVE_Z, self.texture_positive_z)
-        createTexImage2D(GL_TEXTURE_CUBE_MAP_NEGATIVE_Z, self.texture_negative_z)
-
-        glGenerateMipmap(GL_TEXTURE_CUBE_MAP)
+        GLStateCache.instance().bind_texture(GL_TEXTURE_CUBE_MAP, self.buffer)
+        # the rows of the face datas are tightly packed.
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        # allocate the whole mip chain to be the complete texture, before copying the face textures.
+        level_count = max(self.width, self.height, 1).bit_length() if self.generate_face_mipmap else mip_count
+        for index, face in enumerate(self.faces):
+            levels = face_datas.get(face) or []
+            for level in range(level_count):
+                self.tex_image_2d(GL_TEXTURE_CUBE_MAP_POSITIVE_X + index, level,
+                                  levels[level] if level < len(levels) else None)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+
+        if self.compressed or 1 < mip_count:
+            glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_MAX_LEVEL, mip_count - 1)
         glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_WRAP_S, self.wrap)
         glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_WRAP_T, self.wrap)
         glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_WRAP_R, self.wrap)
         glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_MIN_FILTER, self.min_filter)
         glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_MAG_FILTER, self.mag_filter)
-        glBindTexture(GL_TEXTURE_CUBE_MAP, 0)
+
+        self.copy_face_textures()
+        GLStateCache.instance().bind_texture(GL_TEXTURE_CUBE_MAP, 0)
+
+    def tex_image_2d(self, cube_index, level, level_data):
+        width = max(1, self.width >> level)
+        height = max(1, self.height >> level)
+        if self.compressed:
+            if level_data is None:
+                level_data = np.zeros(get_compressed_image_size(self.internal_format, width, height), dtype=np.uint8)
+            glCompressedTexImage2D(cube_index, level, self.internal_format, width, height, 0, level_data)
+        else:
+            glTexImage2D(cube_index,
+                         level,
+                         self.internal_format,
+                         width,
+                         height,
+                         0,
+                         self.texture_format,
+                         self.data_type,
+                         c_void_p(0) if level_data is None else level_data)
+
+    def copy_face_textures(self):
+        """
+        Copy the level 0 of the face textures to the faces on the gpu without reading back them,
+        then generate the mipmap. It is called again when the face textures are rendered. ex) LightProbe
+        """
+        GLStateCache.instance().bind_texture(GL_TEXTURE_CUBE_MAP, self.buffer)
+        for index, face in enumerate(self.faces):
+            texture = getattr(self, face)
+            if not isinstance(texture, Texture):
+                continue
+            elif (texture.width, texture.height, texture.internal_format) != \
+                    (self.width, self.height, self.internal_format):
+                logger.warn("%s : %s is not copied, because it has the different size or format." % (self.name,
+                                                                                                     texture.name))
+                continue
+            glCopyImageSubData(texture.buffer, GL_TEXTURE_2D, 0, 0, 0, 0,
+                               self.buffer, GL_TEXTURE_CUBE_MAP, 0, 0, 0, index,
+                               self.width, self.height, 1)
+
+        if self.generate_face_mipmap:
+            glGenerateMipmap(GL_TEXTURE_CUBE_MAP)
+
+    @staticmethod
+    def get_face_name(texture):
+        if isinstance(texture, Texture):
+            return texture.name
+        return texture if isinstance(texture, str) else ''
 
     def get_save_data(self, get_image_data=True):
-        save_data = Texture.get_save_data(self)
-        save_data['texture_positive_x'] = self.texture_positive_x.name
-        save_data['texture_negative_x'] = self.texture_negative_x.name
-        save_data['texture_positive_y'] = self.texture_positive_y.name
-        save_data['texture_negative_y'] = self.texture_negative_y.name
-        save_data['texture_positive_z'] = self.texture_positive_z.name
-        save_data['texture_negative_z'] = self.texture_negative_z.name
+        save_data = Texture.get_save_data(self, get_image_data=False)
+        for face in self.faces:
+            save_data[face] = self.get_face_name(getattr(self, face))
         return save_data
 
     def getAttribute(self):
         Texture.getAttribute(self)
-        self.attribute.setAttribute("texture_positive_x", self.texture_positive_x.name)
-        self.attribute.setAttribute("texture_negative_x", self.texture_negative_x.name)
-        self.attribute.setAttribute("texture_positive_y", self.texture_positive_y.name)
-        self.attribute.setAttribute("texture_negative_y", self.texture_negative_y.name)
-        self.attribute.setAttribute("texture_positive_z", self.texture_positive_z.name)
-        self.attribute.setAttribute("texture_negative_z", self.texture_negative_z.name)
+        for face in self.faces:
+            self.attribute.setAttribute(face, self.get_face_name(getattr(self, face)))
         return self.attribute
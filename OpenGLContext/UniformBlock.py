@@ -4,6 +4,8 @@ import numpy as np
 from OpenGL.GL import *
 
 from Common import logger
+from .GLStateCache import GLStateCache
+from .RingBuffer import FrameRingBuffer
 
 
 class UniformBlock:
@@ -24,9 +26,9 @@ class UniformBlock:
         glUniformBlockBinding(program, self.buffer_index, binding)
 
         self.buffer = glGenBuffers(1)
-        glBindBuffer(GL_UNIFORM_BUFFER, self.buffer)
+        GLStateCache.instance().bind_buffer(GL_UNIFORM_BUFFER, self.buffer)
         glBufferData(GL_UNIFORM_BUFFER, self.blockSize, c_void_p(0), GL_DYNAMIC_DRAW)
-        glBindBufferBase(GL_UNIFORM_BUFFER, self.buffer_bind, self.buffer)
+        GLStateCache.instance().bind_buffer_base(GL_UNIFORM_BUFFER, self.buffer_bind, self.buffer)
 
     def __del__(self):
         pass
@@ -34,11 +36,26 @@ class UniformBlock:
 
     def delete(self):
         glDeleteBuffers(1, self.buffer)
+        GLStateCache.instance().delete_buffer(self.buffer)
 
     def get_data(self):
         return self.serializedData
 
     def bind_uniform_block(self, *datas):
+        # serialize into the frame ring buffer directly, and bind the range.
+        ring_buffer = FrameRingBuffer.instance()
+        offset, ring_data = ring_buffer.allocate(self.blockSize, ring_buffer.uniform_alignment)
+        if offset is not None:
+            serializedData = ring_data.view(np.float32)
+            index = 0
+            for data in datas:
+                serializedData[index: index+data.size] = data.flat
+                index += data.size
+            ring_buffer.commit(offset, self.blockSize)
+            GLStateCache.instance().bind_buffer_range(GL_UNIFORM_BUFFER, self.buffer_bind, ring_buffer.buffer, offset,
+                                                      self.blockSize)
+            return
+
         # serialize
         index = 0
         for data in datas:
@@ -48,7 +65,57 @@ class UniformBlock:
         if self.serializedData.nbytes != self.blockSize:
             logger.error("Uniform buffer block must start on a 16-byte padding.")
 
-        glBindBuffer(GL_UNIFORM_BUFFER, self.buffer)
+        GLStateCache.instance().bind_buffer(GL_UNIFORM_BUFFER, self.buffer)
         glBufferSubData(GL_UNIFORM_BUFFER, 0, self.blockSize, self.serializedData)
-        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        GLStateCache.instance().bind_buffer(GL_UNIFORM_BUFFER, 0)
+        GLStateCache.instance().bind_buffer_base(GL_UNIFORM_BUFFER, self.buffer_bind, self.buffer)
+
+
+class MaterialUniformBlock:
+    """
+    The std140 uniform buffer of the material components of a material instance.
+    The data is uploaded only when it's changed, so binding the material instance is a glBindBufferRange.
+    """
+    block_name = 'materialConstants'
+    binding = 4
+
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self.data = np.zeros(block_size // 4, dtype=np.float32)
+        self.updated = True
+
+        self.buffer = glGenBuffers(1)
+        GLStateCache.instance().bind_buffer(GL_UNIFORM_BUFFER, self.buffer)
+        glBufferData(GL_UNIFORM_BUFFER, self.block_size, c_void_p(0), GL_DYNAMIC_DRAW)
+        GLStateCache.instance().bind_buffer(GL_UNIFORM_BUFFER, 0)
+
+    def delete(self):
+        glDeleteBuffers(1, [self.buffer, ])
+        GLStateCache.instance().delete_buffer(self.buffer)
+
+    def set_data(self, uniform_type, offset, value):
+        index = offset // 4
+        if uniform_type in ('bool', 'int'):
+            self.data[index:index + 1].view(np.int32)[0] = int(value)
+        elif uniform_type == 'float':
+            self.data[index] = value
+        elif uniform_type in ('vec2', 'vec3', 'vec4'):
+            component_count = int(uniform_type[-1])
+            self.data[index:index + component_count] = np.asarray(value, dtype=np.float32).flat[:component_count]
+        elif uniform_type in ('mat2', 'mat3', 'mat4'):
+            # each column is padded to vec4. The rows of numpy array are the columns like glUniformMatrix.
+            component_count = int(uniform_type[-1])
+            columns = self.data[index:index + 4 * component_count].reshape(component_count, 4)
+            columns[:, :component_count] = np.asarray(value, dtype=np.float32).reshape(component_count, component_count)
+        else:
+            logger.error("%s is not supported type of the material uniform block." % uniform_type)
+            return
+        self.updated = True
 
+    def bind(self):
+        if self.updated:
+            GLStateCache.instance().bind_buffer(GL_UNIFORM_BUFFER, self.buffer)
+            glBufferSubData(GL_UNIFORM_BUFFER, 0, self.block_size, self.data)
+            GLStateCache.instance().bind_buffer(GL_UNIFORM_BUFFER, 0)
+            self.updated = False
+        GLStateCache.instance().bind_buffer_range(GL_UNIFORM_BUFFER, self.binding, self.buffer, 0, self.block_size)
@@ -1,10 +1,12 @@
 import traceback
+from functools import partial
 
 import numpy as np
 from OpenGL.GL import *
 
 from Common import logger
 from App import CoreManager
+from .GLStateCache import GLStateCache
 
 
 def CreateUniformBuffer(program, uniform_type, uniform_name):
@@ -88,6 +90,28 @@ class UniformVariable:
     def bind_uniform(self, value, num=1, transpose=False):
         raise BaseException("You must implement bind function.")
 
+    def get_binder(self, value):
+        """
+        :return: the function without arguments which binds the value. The value is converted in advance.
+        """
+        return partial(self.bind_uniform, value)
+
+
+class UniformBlockMember(UniformVariable):
+    """
+    The material component in the material uniform block.
+    The data is uploaded by MaterialUniformBlock of the material instance, not by glUniform.
+    """
+    def __init__(self, uniform_type, variable_name, offset):
+        self.name = variable_name
+        self.uniform_type = uniform_type
+        self.location = -1
+        self.offset = offset
+        self.valid = True
+
+    def bind_uniform(self, value, num=1, transpose=False):
+        pass
+
 
 class UniformArray(UniformVariable):
     """future work : http://pyopengl.sourceforge.net/context/tutorials/shader_7.html"""
@@ -100,6 +124,9 @@ class UniformBool(UniformVariable):
     def bind_uniform(self, value, num=1, transpose=False):
         glUniform1i(self.location, value)
 
+    def get_binder(self, value):
+        return partial(glUniform1i, self.location, int(value))
+
 
 class UniformInt(UniformVariable):
     uniform_type = "int"
@@ -107,6 +134,9 @@ class UniformInt(UniformVariable):
     def bind_uniform(self, value, num=1, transpose=False):
         glUniform1i(self.location, value)
 
+    def get_binder(self, value):
+        return partial(glUniform1i, self.location, int(value))
+
 
 class UniformFloat(UniformVariable):
     uniform_type = "float"
@@ -114,6 +144,9 @@ class UniformFloat(UniformVariable):
     def bind_uniform(self, value, num=1, transpose=False):
         glUniform1f(self.location, value)
 
+    def get_binder(self, value):
+        return partial(glUniform1f, self.location, float(value))
+
 
 class UniformVector2(UniformVariable):
     uniform_type = "vec2"
@@ -121,6 +154,9 @@ class UniformVector2(UniformVariable):
     def bind_uniform(self, value, num=1, transpose=False):
         glUniform2fv(self.location, num, value)
 
+    def get_binder(self, value):
+        return partial(glUniform2fv, self.location, 1, np.ascontiguousarray(value, dtype=np.float32))
+
 
 class UniformVector3(UniformVariable):
     uniform_type = "vec3"
@@ -128,6 +164,9 @@ class UniformVector3(UniformVariable):
     def bind_uniform(self, value, num=1, transpose=False):
         glUniform3fv(self.location, num, value)
 
+    def get_binder(self, value):
+        return partial(glUniform3fv, self.location, 1, np.ascontiguousarray(value, dtype=np.float32))
+
 
 class UniformVector4(UniformVariable):
     uniform_type = "vec4"
@@ -135,6 +174,9 @@ class UniformVector4(UniformVariable):
     def bind_uniform(self, value, num=1, transpose=False):
         glUniform4fv(self.location, num, value)
 
+    def get_binder(self, value):
+        return partial(glUniform4fv, self.location, 1, np.ascontiguousarray(value, dtype=np.float32))
+
 
 class UniformMatrix2(UniformVariable):
     uniform_type = "mat2"
@@ -142,6 +184,9 @@ class UniformMatrix2(UniformVariable):
     def bind_uniform(self, value, num=1, transpose=False):
         glUniformMatrix2fv(self.location, num, GL_TRUE if transpose else GL_FALSE, value)
 
+    def get_binder(self, value):
+        return partial(glUniformMatrix2fv, self.location, 1, GL_FALSE, np.ascontiguousarray(value, dtype=np.float32))
+
 
 class UniformMatrix3(UniformVariable):
     uniform_type = "mat3"
@@ -149,6 +194,9 @@ class UniformMatrix3(UniformVariable):
     def bind_uniform(self, value, num=1, transpose=False):
         glUniformMatrix3fv(self.location, num, GL_TRUE if transpose else GL_FALSE, value)
 
+    def get_binder(self, value):
+        return partial(glUniformMatrix3fv, self.location, 1, GL_FALSE, np.ascontiguousarray(value, dtype=np.float32))
+
 
 class UniformMatrix4(UniformVariable):
     uniform_type = "mat4"
@@ -156,6 +204,9 @@ class UniformMatrix4(UniformVariable):
     def bind_uniform(self, value, num=1, transpose=False):
         glUniformMatrix4fv(self.location, num, GL_TRUE if transpose else GL_FALSE, value)
 
+    def get_binder(self, value):
+        return partial(glUniformMatrix4fv, self.location, 1, GL_FALSE, np.ascontiguousarray(value, dtype=np.float32))
+
 
 class UniformTextureBase(UniformVariable):
     uniform_type = "UniformTextureBase"
@@ -169,7 +220,7 @@ class UniformTextureBase(UniformVariable):
 
     def bind_uniform(self, texture, num=1, transpose=False):
         if texture:
-            glActiveTexture(GL_TEXTURE0 + self.textureIndex)
+            GLStateCache.instance().active_texture(GL_TEXTURE0 + self.textureIndex)
             # glEnable(GL_TEXTURE_CUBE_MAP)
             texture.bind_texture()  # glBindTexture(texture.target, texture.texture_bind
             glUniform1i(self.location, self.textureIndex)
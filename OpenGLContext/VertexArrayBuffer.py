@@ -7,6 +7,8 @@ from OpenGL.GL import *
 
 from Common import logger
 from Utilities import compute_tangent
+from .GLStateCache import GLStateCache
+from .RingBuffer import FrameRingBuffer
 
 
 class InstanceBuffer:
@@ -15,10 +17,10 @@ class InstanceBuffer:
         self.layout_location = layout_location
 
         self.instance_array = glGenVertexArrays(1)
-        glBindVertexArray(self.instance_array)
+        GLStateCache.instance().bind_vertex_array(self.instance_array)
 
         self.instance_buffer = glGenBuffers(1)
-        glBindBuffer(GL_ARRAY_BUFFER, self.instance_buffer)
+        GLStateCache.instance().bind_buffer(GL_ARRAY_BUFFER, self.instance_buffer)
 
         # One of the elements of the instance data list
         self.component_count = len(element_data)
@@ -26,18 +28,46 @@ class InstanceBuffer:
         # you need to divide it into 4 by 16 bytes.
         self.divide_count = math.ceil(element_data.nbytes / 16)
         self.size_of_data = element_data.nbytes
+        self.buffer_size = 0
 
-    def bind_instance_buffer(self, instance_data, divisor=1):
-        glBindVertexArray(self.instance_array)
-        glBindBuffer(GL_ARRAY_BUFFER, self.instance_buffer)
-        glBufferData(GL_ARRAY_BUFFER, instance_data, GL_DYNAMIC_DRAW)
-
-        component_count = len(instance_data[0])
-        size_of_data = instance_data[0].nbytes
+    def delete(self):
+        glDeleteVertexArrays(1, [self.instance_array, ])
+        glDeleteBuffers(1, [self.instance_buffer, ])
+        GLStateCache.instance().delete_vertex_array(self.instance_array)
+        GLStateCache.instance().delete_buffer(self.instance_buffer)
+
+    def bind_instance_buffer(self, instance_data=None, divisor=1, per_frame=False):
+        """
+        :param instance_data: upload instance_data if it is not None, otherwise use the previously uploaded data.
+        :param per_frame: write instance_data to the frame ring buffer. It's valid only in this frame.
+        """
+        GLStateCache.instance().bind_vertex_array(self.instance_array)
+
+        offset = None
+        if per_frame and instance_data is not None:
+            ring_buffer = FrameRingBuffer.instance()
+            offset = ring_buffer.write(instance_data)
+            if offset is not None:
+                GLStateCache.instance().bind_buffer(GL_ARRAY_BUFFER, ring_buffer.buffer)
+
+        if offset is None:
+            offset = 0
+            GLStateCache.instance().bind_buffer(GL_ARRAY_BUFFER, self.instance_buffer)
+            if instance_data is not None:
+                # reallocate the storage only if it grows.
+                if self.buffer_size < instance_data.nbytes:
+                    glBufferData(GL_ARRAY_BUFFER, instance_data, GL_DYNAMIC_DRAW)
+                    self.buffer_size = instance_data.nbytes
+                else:
+                    glBufferSubData(GL_ARRAY_BUFFER, 0, instance_data.nbytes, instance_data)
+
+        component_count = self.component_count
+        size_of_data = self.size_of_data
 
         if self.divide_count == 1:
             glEnableVertexAttribArray(self.layout_location)
-            glVertexAttribPointer(self.layout_location, component_count, GL_FLOAT, GL_FALSE, size_of_data, c_void_p(0))
+            glVertexAttribPointer(self.layout_location, component_count, GL_FLOAT, GL_FALSE, size_of_data,
+                                  c_void_p(offset))
             # divisor == 0, not instancing.
             # divisor > 0, the attribute advances once per divisor instances of the set(s) of vertices being rendered.
             glVertexAttribDivisor(self.layout_location, divisor)
@@ -45,14 +75,20 @@ class InstanceBuffer:
             for i in range(self.divide_count):
                 glEnableVertexAttribArray(self.layout_location + i)
                 glVertexAttribPointer(self.layout_location + i, component_count, GL_FLOAT, GL_FALSE, size_of_data,
-                                      c_void_p(self.divide_count * component_count * i))
+                                      c_void_p(offset + self.divide_count * component_count * i))
                 glVertexAttribDivisor(self.layout_location + i, divisor)
 
+    def unbind_instance_buffer(self):
+        for i in range(self.divide_count):
+            glVertexAttribDivisor(self.layout_location + i, 0)
+            glDisableVertexAttribArray(self.layout_location + i)
 
-def CreateVertexArrayBuffer(geometry_data):
-    geometry_name = geometry_data.get('name', '')
-    logger.info("Load %s geometry." % geometry_name)
 
+def GetVertexDatas(geometry_data):
+    """
+    :return: the vertex data list in the layout order of VertexArrayBuffer and the index data, or None.
+    """
+    geometry_name = geometry_data.get('name', '')
     vertex_count = len(geometry_data.get('positions', []))
     if vertex_count == 0:
         logger.error("%s geometry has no position data." % geometry_name)
@@ -88,24 +124,43 @@ def CreateVertexArrayBuffer(geometry_data):
         geometry_data['tangents'] = tangents.tolist()
 
     if 0 < len(bone_indicies) and 0 < len(bone_weights):
-        vertex_array_buffer = VertexArrayBuffer(geometry_name,
-                                                [positions, colors, normals, tangents, texcoords, bone_indicies,
-                                                 bone_weights], indices)
-    else:
-        vertex_array_buffer = VertexArrayBuffer(geometry_name, [positions, colors, normals, tangents, texcoords],
-                                                indices)
-    return vertex_array_buffer
+        return [positions, colors, normals, tangents, texcoords, bone_indicies, bone_weights], indices
+    return [positions, colors, normals, tangents, texcoords], indices
+
+
+def CreateVertexArrayBuffer(geometry_data):
+    geometry_name = geometry_data.get('name', '')
+    logger.info("Load %s geometry." % geometry_name)
+
+    # The vertex data is already interleaved. ex) memory mapped binary mesh file.
+    if 'vertex_data' in geometry_data:
+        return VertexArrayBuffer(geometry_name,
+                                 geometry_data['vertex_data'],
+                                 geometry_data['indices'],
+                                 vertex_component_count=geometry_data['vertex_component_count'])
+
+    vertex_datas = GetVertexDatas(geometry_data)
+    if vertex_datas is None:
+        return None
+    datas, indices = vertex_datas
+    return VertexArrayBuffer(geometry_name, datas, indices)
 
 
 class VertexArrayBuffer:
-    def __init__(self, name, datas, index_data, dtype=np.float32):
+    def __init__(self, name, datas, index_data, dtype=np.float32, vertex_component_count=None):
+        """
+        :param datas: list of vertex data, or the interleaved vertex data if vertex_component_count is given.
+        :param vertex_component_count: component count of each vertex attribute of the interleaved data.
+        """
         self.name = name
         self.vertex_component_count = []
         self.vertex_buffer_offset = []
         self.vertex_buffer_size = 0
 
-        for data in datas:
-            stride = len(data[0]) if len(data) > 0 else 0
+        if vertex_component_count is None:
+            vertex_component_count = [len(data[0]) if len(data) > 0 else 0 for data in datas]
+
+        for stride in vertex_component_count:
             if stride == 0:
                 continue
             self.vertex_component_count.append(stride)
@@ -114,17 +169,21 @@ class VertexArrayBuffer:
         self.layout_location_count = range(len(self.vertex_component_count))
 
         self.vertex_array = glGenVertexArrays(1)
-        glBindVertexArray(self.vertex_array)
+        GLStateCache.instance().bind_vertex_array(self.vertex_array)
 
-        # The important thing is np.hstack. It is to serialize the data.
-        vertex_datas = np.hstack(datas).astype(dtype)
+        if isinstance(datas, np.ndarray) and datas.dtype == dtype:
+            # already interleaved, upload as it is. ( memory mapped data is not copied. )
+            vertex_datas = datas
+        else:
+            # The important thing is np.hstack. It is to serialize the data.
+            vertex_datas = np.hstack(datas).astype(dtype)
         self.vertex_buffer = glGenBuffers(1)
-        glBindBuffer(GL_ARRAY_BUFFER, self.vertex_buffer)
+        GLStateCache.instance().bind_buffer(GL_ARRAY_BUFFER, self.vertex_buffer)
         glBufferData(GL_ARRAY_BUFFER, vertex_datas, GL_STATIC_DRAW)
 
         self.index_buffer_size = index_data.nbytes
         self.index_buffer = glGenBuffers(1)
-        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
+        GLStateCache.instance().bind_buffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
         glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer_size, index_data, GL_STATIC_DRAW)
 
         self.instance_buffer_map = {}  # { layout_location : (instance_array, instance_buffer) }
@@ -133,29 +192,32 @@ class VertexArrayBuffer:
         glDeleteVertexArrays(1, self.vertex_array)
         glDeleteBuffers(1, self.vertex_buffer)
         glDeleteBuffers(1, self.index_buffer)
+        gl_state_cache = GLStateCache.instance()
+        gl_state_cache.delete_vertex_array(self.vertex_array)
+        gl_state_cache.delete_buffer(self.vertex_buffer)
+        gl_state_cache.delete_buffer(self.index_buffer)
 
-        for instance_array, instance_buffer in self.instance_buffer_map.values():
-            glDeleteVertexArrays(1, instance_array)
-            glDeleteBuffers(1, instance_buffer)
+        for instance_buffer in self.instance_buffer_map.values():
+            instance_buffer.delete()
 
     def create_instance_buffer(self, instance_name, layout_location, element_data):
         self.instance_buffer_map[instance_name] = InstanceBuffer(name=instance_name,
                                                                  layout_location=layout_location,
                                                                  element_data=element_data)
 
-    def bind_instance_buffer(self, instance_name, instance_data, divisor=1):
+    def bind_instance_buffer(self, instance_name, instance_data, divisor=1, per_frame=False):
         instance_buffer = self.instance_buffer_map[instance_name]
-        instance_buffer.bind_instance_buffer(instance_data, divisor)
+        instance_buffer.bind_instance_buffer(instance_data, divisor, per_frame)
 
     def bind_vertex_buffer(self):
-        glBindBuffer(GL_ARRAY_BUFFER, self.vertex_buffer)
+        GLStateCache.instance().bind_buffer(GL_ARRAY_BUFFER, self.vertex_buffer)
 
         for layout_location in self.layout_location_count:
             glEnableVertexAttribArray(layout_location)
             glVertexAttribPointer(layout_location, self.vertex_component_count[layout_location], GL_FLOAT, GL_FALSE,
                                   self.vertex_buffer_size, self.vertex_buffer_offset[layout_location])
 
-        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
+        GLStateCache.instance().bind_buffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
 
     def draw_elements(self):
         glDrawElements(GL_TRIANGLES, self.index_buffer_size, GL_UNSIGNED_INT, c_void_p(0))
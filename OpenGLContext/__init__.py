@@ -1,14 +1,20 @@
 from .FrameBuffer import FrameBuffer, FrameBufferManager
+from .GLStateCache import GLStateCache
 from .GLUtil import IsExtensionSupported
 from .RenderBuffer import RenderBuffer
-from .Shader import Shader, parsing_macros, parsing_uniforms, parsing_material_components
+from .RingBuffer import FrameRingBuffer
+from .Shader import Shader, ShaderIncludeCache, parsing_macros, parsing_uniforms, parsing_material_components, \
+    get_material_uniform_block_layout, generate_material_uniform_block, shader_types
 from .Material import Material
+from .MaterialCompileQueue import MaterialCompileQueue
+from .ProgramBinaryCache import ProgramBinaryCache
+from .ProceduralTexture import ProceduralTexture, procedural_textures, regist_procedural_texture
 from .Texture import CreateTexture, Texture2D, Texture3D, Texture2DMultiSample, TextureCube
-from .UniformBlock import UniformBlock
+from .UniformBlock import UniformBlock, MaterialUniformBlock
 from .UniformBuffer import CreateUniformBuffer, CreateUniformDataFromString, \
-                            UniformArray, UniformInt, UniformFloat, \
+                            UniformBlockMember, UniformArray, UniformInt, UniformFloat, \
                             UniformVector2, UniformVector3, UniformVector4, \
                             UniformMatrix2, UniformMatrix3, UniformMatrix4, \
                             UniformTextureBase, UniformTexture2D, UniformTexture3D, UniformTexture2DMultiSample, \
                             UniformTextureCube
-from .VertexArrayBuffer import VertexArrayBuffer, CreateVertexArrayBuffer
+from .VertexArrayBuffer import InstanceBuffer, VertexArrayBuffer, CreateVertexArrayBuffer, GetVertexDatas
@@ -53,8 +53,9 @@ float get_sss_scale()
 
 vec3 get_normal(vec2 tex_coord)
 {
-    // Y-Up
-    vec3 normal = texture(texture_normal, tex_coord).xzy * 2.0 - 1.0;
+    // Y-Up. The blue channel is reconstructed, because the compressed normal map ( BC5 ) has only two channels.
+    vec2 normal_xz = texture(texture_normal, tex_coord).xy * 2.0 - 1.0;
+    vec3 normal = vec3(normal_xz.x, sqrt(clamp(1.0 - dot(normal_xz, normal_xz), 0.0, 1.0)), normal_xz.y);
     return normalize(normal);
 }
 
@@ -1,6 +1,7 @@
 
 
 #define SKELETAL 0
+#define INSTANCING 0
 
 #include "scene_constants.glsl"
 #include "default_material.glsl"
@@ -10,7 +11,9 @@ uniform mat4 bone_matrices[MAX_BONES];
 uniform mat4 prev_bone_matrices[MAX_BONES];
 #endif
 
+#if 0 == INSTANCING
 uniform mat4 model;
+#endif
 
 struct VERTEX_OUTPUT
 {
@@ -35,10 +38,20 @@ layout (location = 4) in vec2 vs_in_tex_coord;
 layout (location = 5) in vec4 vs_in_bone_indicies;
 layout (location = 6) in vec4 vs_in_bone_weights;
 #endif
+#if 1 == INSTANCING
+#if 1 == SKELETAL
+layout (location = 7) in mat4 vs_in_model;
+#else
+layout (location = 5) in mat4 vs_in_model;
+#endif
+#endif
 
 layout (location = 0) out VERTEX_OUTPUT vs_output;
 
 void main() {
+#if 1 == INSTANCING
+    mat4 model = vs_in_model;
+#endif
     vec4 position = vec4(0.0, 0.0, 0.0, 0.0);
     vec4 prev_position = vec4(0.0, 0.0, 0.0, 0.0);
     vec3 vertex_normal = vec3(0.0, 1.0, 0.0);
@@ -0,0 +1,74 @@
+import queue
+import threading
+import time
+import traceback
+
+from Common import logger
+
+
+class AsyncResourceLoader:
+    """
+    Read and decompress the resource files on the worker thread,
+    and finalize the resources ( ex. OpenGL upload ) on the main thread in the time budget of a frame.
+    """
+    def __init__(self):
+        self.request_queue = queue.Queue()
+        self.complete_queue = queue.Queue()
+        self.thread = None
+        self.running = False
+        self.finalize_budget = 0.002  # seconds
+        self.pending_count = 0
+
+    def initialize(self, finalize_budget_ms):
+        self.finalize_budget = max(0.0, finalize_budget_ms) * 0.001
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="AsyncResourceLoader", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        if self.running:
+            self.running = False
+            self.request_queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def request(self, resource_loader, resource):
+        self.pending_count += 1
+        self.request_queue.put((resource_loader, resource))
+
+    def run(self):
+        while True:
+            job = self.request_queue.get()
+            if job is None:
+                break
+
+            resource_loader, resource = job
+            try:
+                load_data = resource_loader.load_resource_data(resource)
+            except:
+                logger.error(traceback.format_exc())
+                load_data = None
+            self.complete_queue.put((resource_loader, resource, load_data))
+
+    def update(self):
+        """
+        Finalize the loaded resources until the time budget is over. At least one resource is finalized per frame.
+        """
+        start_time = time.perf_counter()
+        while True:
+            try:
+                resource_loader, resource, load_data = self.complete_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            self.pending_count -= 1
+            try:
+                resource_loader.finalize_async_resource(resource, load_data)
+            except:
+                logger.error(traceback.format_exc())
+
+            if self.finalize_budget < (time.perf_counter() - start_time):
+                break
+
+    def get_log(self):
+        return "Async Load : %d pending" % self.pending_count
@@ -5,11 +5,9 @@ import struct
 import numpy as np
 from OpenGL.GL import *
 from OpenGL.GLU import *
-from OpenGL.GL.shaders import *
-from OpenGL.arrays.arraydatatype import *
-from OpenGL.raw.GL.EXT.texture_compression_s3tc import *
 
 from Common import logger
+from .TextureCompression import COMPRESSED_FORMATS, get_compressed_size, flip_compressed_blocks
 
 
 dxgi_pixel_or_block_size = [
@@ -47,7 +45,23 @@ dxgi_compressed_formats = [
 ]
 
 
+# { fourCC : compression }
+dds_four_cc_compressions = dict(DXT1='BC1', DXT3='BC2', DXT5='BC3', ATI1='BC4', BC4U='BC4', ATI2='BC5', BC5U='BC5')
+
+# { dxgi format : compression }
+dxgi_compressions = {71: 'BC1', 72: 'BC1', 74: 'BC2', 75: 'BC2', 77: 'BC3', 78: 'BC3', 80: 'BC4', 83: 'BC5'}
+
+# { compression : (image mode, texture format) }
+compression_image_modes = dict(BC1=('RGB', GL_RGB), BC2=('RGBA', GL_RGBA), BC3=('RGBA', GL_RGBA),
+                               BC4=('R', GL_RED), BC5=('RG', GL_RG))
+
+
 def loadDDS(imagepath):
+    """
+    Load the compressed levels of the dds file without OpenGL context. The levels are flipped to the bottom-up order
+    as the images loaded by PIL.
+    :return: texture datas which have the compressed data and mipmap_datas, or None.
+    """
     if not os.path.exists(imagepath):
         logger.error("Cannot open %s file" % imagepath)
         return None
@@ -55,7 +69,7 @@ def loadDDS(imagepath):
     with open(imagepath, "rb") as fp:
         filecode = struct.unpack("4s", fp.read(4))[0]
 
-        if filecode.decode('ascii') != "DDS ":
+        if filecode != b"DDS ":
             logger.error("%s is not dds file." % imagepath)
             return None
 
@@ -63,51 +77,48 @@ def loadDDS(imagepath):
         header = struct.unpack("124s", fp.read(124))[0]
         height = struct.unpack("I", header[8:12])[0]
         width = struct.unpack("I", header[12:16])[0]
-        linearSize = struct.unpack("I", header[16:20])[0]
-        mipMapCount = struct.unpack("I", header[24:28])[0]
-        fourCC = struct.unpack("4s", header[80:84])[0]
-        fourCC = fourCC.decode('ascii')
+        mipMapCount = max(1, struct.unpack("I", header[24:28])[0])
+        fourCC = struct.unpack("4s", header[80:84])[0].decode('ascii', 'ignore')
 
-        # read buffer
-        bufsize = (linearSize * 2) if mipMapCount > 1 else linearSize
-        buffer = fp.read(bufsize)
-        # buffer = np.asarray(buffer)
-        buffer = np.fromstring(buffer, dtype=np.ubyte)
-
-        # texture desc
-        components = 4
-        blockSize = 16
-        format = GL_COMPRESSED_RGBA_S3TC_DXT1_EXT
-        if fourCC == "DXT1":
-            format = GL_COMPRESSED_RGBA_S3TC_DXT1_EXT
-            components = 3
-            blockSize = 8
-        elif fourCC == "DXT3":
-            format = GL_COMPRESSED_RGBA_S3TC_DXT3_EXT
-        elif fourCC == "DXT5":
-            format = GL_COMPRESSED_RGBA_S3TC_DXT5_EXT
+        if fourCC == "DX10":
+            dxgi_format = struct.unpack("I", fp.read(20)[:4])[0]
+            compression = dxgi_compressions.get(dxgi_format)
         else:
+            compression = dds_four_cc_compressions.get(fourCC)
+
+        if compression is None:
             logger.error("not support %s format" % fourCC)
             return None
 
-        # Create one OpenGL texture
-        offset = 0
-        textureID = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, textureID)
-        for level in range(mipMapCount):
-            if width > 0 and height > 0:
-                size = int((width + 3)/4) * int((height + 3)/4) * blockSize
-
-                # TODO : implement glCompressedTexImage2D
-                # glCompressedTexImage2D(GL_TEXTURE_2D, level, format, width, height, 0, size, buffer.ctypes.data)
-                glCompressedTexImage2D(GL_TEXTURE_2D, level, format, width, height, 0, buffer)
-                offset += size
-                width /= 2
-                height /= 2
-            else:
-                break
-        return textureID
-    return None
+        # read buffer
+        buffer = np.frombuffer(fp.read(), dtype=np.ubyte)
+
+    levels = []
+    offset = 0
+    for level in range(mipMapCount):
+        level_width = max(1, width >> level)
+        level_height = max(1, height >> level)
+        size = get_compressed_size(level_width, level_height, compression)
+        if len(buffer) < offset + size:
+            logger.warn("%s has only %d mip levels." % (imagepath, level))
+            break
+        levels.append(flip_compressed_blocks(buffer[offset:offset + size], level_width, level_height, compression))
+        offset += size
+
+    if not levels:
+        logger.error("%s has no image data." % imagepath)
+        return None
+
+    image_mode, texture_format = compression_image_modes[compression]
+    return dict(
+        image_mode=image_mode,
+        width=width,
+        height=height,
+        internal_format=COMPRESSED_FORMATS[compression],
+        texture_format=texture_format,
+        data=levels[0],
+        mipmap_datas=levels[1:]
+    )
 
 
 """
@@ -137,12 +148,12 @@ OTHER DEALINGS IN THE SOFTWARE.
 
 # Win32 following : https://msdn.microsoft.com/en-us/library/windows/desktop/aa383751(v=vs.85).aspx
 class Win32Types:
-    DWORD = ctypes.c_ulong
+    DWORD = ctypes.c_uint32
     UINT = ctypes.c_uint
 
 
 # DDS types
-DDSEnumType = ctypes.c_ulong
+DDSEnumType = ctypes.c_uint32
 DDSMagicNumber = Win32Types.DWORD
 DDSFormatCC = Win32Types.DWORD
 
@@ -337,10 +348,10 @@ class DDSTexture:
         self.dxgi_format = self.ext_header.dxgiFormat
 
         # If the texture is compressed
-        self.bpp_or_block_size = dxgi_values.dxgi_pixel_or_block_size[self.dxgi_format]
+        self.bpp_or_block_size = dxgi_pixel_or_block_size[self.dxgi_format]
 
         # Checking if the texture is compressed or not ( we need it to calculate pitch )
-        self.is_compressed = self.dxgi_format in dxgi_values.dxgi_compressed_formats
+        self.is_compressed = self.dxgi_format in dxgi_compressed_formats
 
         # Checking if there are mipmaps
         self.mipmap_count = self.header.dwMipMapCount
@@ -393,9 +404,6 @@ class DDSTexture:
             if bytes_read < ctypes.sizeof(self.header):
                 raise FormatNotValid("Failed to read header")
 
-            # TODO : Add support for non-squared textures
-            assert self.header.dwWidth == self.header.dwHeight
-
             # Reading extended header
             if self.header.ddspf.dwFlags & DDSEnums.DDPF_FOURCC and self.header.ddspf.dwFourCC == DDSEnums.DX10_CC:
                 bytes_read = file_stream.readinto(self.ext_header)
@@ -424,23 +432,19 @@ class DDSTexture:
             for i in range(elements):
                 next_width = self.header.dwWidth
                 next_height = self.header.dwHeight
-                if self.is_compressed:
-                    next_size = self.header.dwPitchOrLinearSize
-                else:
-                    next_size = next_height * self.header.dwPitchOrLinearSize
 
-                for mipmap in range(self.header.dwMipMapCount):
-                    total_data_size += next_size
+                for mipmap in range(max(1, self.header.dwMipMapCount)):
                     if self.is_compressed:
-                        pitch = max(1, int(((next_width + 3) / 4))) * self.bpp_or_block_size
+                        pitch = max(1, (next_width + 3) // 4) * self.bpp_or_block_size
+                        next_size = pitch * max(1, (next_height + 3) // 4)
                     else:
-                        pitch = (next_width * self.bpp_or_block_size + 7) / 8
+                        pitch = next_width * self.bpp_or_block_size
+                        next_size = pitch * next_height
+                    total_data_size += next_size
 
                     self.surfaces.append(DDSSurface(next_width, next_height, pitch, next_size))
-                    # TODO When working with non-squared non-power of two textures check this divisions
-                    next_width = int(next_width / 2)
-                    next_height = int(next_height / 2)
-                    next_size = max(8, int(next_size / 4))
+                    next_width = max(1, next_width // 2)
+                    next_height = max(1, next_height // 2)
 
             self.data = (ctypes.c_byte * total_data_size)()
             bytes_read = file_stream.readinto(self.data)
@@ -449,7 +453,7 @@ class DDSTexture:
 
 if __name__ == "__main__":
     # 1
-    loadDDS("Externals/Textures/dds_test.dds")
+    texture_datas = loadDDS("Externals/Textures/dds_test.dds")
 
     # 2
     dds_texture = DDSTexture()
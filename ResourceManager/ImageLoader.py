@@ -0,0 +1,65 @@
+"""
+Decode the image files with PIL into the numpy arrays.
+
+The image is decoded once and packed in the bottom-up row order of OpenGL by the raw encoder of PIL,
+and the packed bytes are viewed as the numpy array through the buffer protocol without a copy.
+The grayscale images are expanded to RGBA by a vectorized assignment instead of the PIL paste.
+PIL releases the GIL while decoding, so loadImage can run on the worker threads.
+"""
+
+import numpy as np
+from PIL import Image
+
+from Common import logger
+
+
+# { image mode : the image mode of the texture }
+GRAYSCALE_MODES = dict(L='RGBA', LA='RGBA')
+
+
+def get_texture_image_mode(image):
+    if image.mode in ('RGB', 'RGBA') or image.mode in GRAYSCALE_MODES:
+        return image.mode
+    elif 'A' in image.mode or 'transparency' in image.info:
+        return 'RGBA'
+    return 'RGB'
+
+
+def expand_grayscale(data, width, height, image_mode):
+    """
+    :param data: flat uint8 array of the L or LA image.
+    :return: flat uint8 array of the RGBA image. The alpha is 255 for the L image.
+    """
+    channels = len(image_mode)
+    gray = data.reshape(width * height, channels)
+    rgba = np.empty((width * height, 4), dtype=np.uint8)
+    rgba[:, 0:3] = gray[:, 0:1]
+    rgba[:, 3] = gray[:, 1] if 2 == channels else 255
+    return rgba.reshape(-1)
+
+
+def loadImage(imagepath):
+    """
+    :return: texture datas. The data is the flat uint8 array in the bottom-up row order.
+    """
+    with Image.open(imagepath) as image:
+        image_mode = get_texture_image_mode(image)
+        if image_mode != image.mode:
+            logger.info('Convert %s image to %s : %s' % (image.mode, image_mode, imagepath))
+            image = image.convert(image_mode)
+
+        width, height = image.size
+        # decode, flip and pack at once. np.frombuffer doesn't copy the bytes.
+        data = np.frombuffer(image.tobytes("raw", image.mode, 0, -1), dtype=np.uint8)
+
+    if image_mode in GRAYSCALE_MODES:
+        logger.info('Convert Grayscale image to RGBA : %s' % imagepath)
+        data = expand_grayscale(data, width, height, image_mode)
+        image_mode = GRAYSCALE_MODES[image_mode]
+
+    return dict(
+        image_mode=image_mode,
+        width=width,
+        height=height,
+        data=data
+    )
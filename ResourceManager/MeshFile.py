@@ -0,0 +1,130 @@
+"""
+Binary mesh file.
+
+    header : magic(8 bytes), version(uint32), header_data_size(uint32)
+    header_data : pickled dict of the skeleton, animation datas and the geometry descriptions.
+    blocks : the interleaved vertex data(little-endian float32) and the index data(little-endian uint32)
+             of each geometry, aligned 16 bytes.
+
+The vertex data is saved in the layout of VertexArrayBuffer, so the memory mapped blocks are uploaded as they are.
+"""
+
+import os
+import pickle
+import struct
+
+import numpy as np
+
+from OpenGLContext import GetVertexDatas
+
+MESH_FILE_MAGIC = b'PYEMESH\x00'
+MESH_FILE_VERSION = 1
+MESH_FILE_HEADER = struct.Struct('<8sII')
+MESH_FILE_ALIGNMENT = 16
+
+VERTEX_DTYPE = np.dtype('<f4')
+INDEX_DTYPE = np.dtype('<u4')
+
+
+def is_mesh_file(filepath):
+    with open(filepath, 'rb') as f:
+        return f.read(len(MESH_FILE_MAGIC)) == MESH_FILE_MAGIC
+
+
+def align_offset(offset):
+    return (offset + MESH_FILE_ALIGNMENT - 1) // MESH_FILE_ALIGNMENT * MESH_FILE_ALIGNMENT
+
+
+def save_mesh_file(filepath, mesh_data):
+    geometry_descs = []
+    blocks = []
+    for geometry_data in mesh_data.get('geometry_datas', []):
+        vertex_datas = GetVertexDatas(geometry_data)
+        if vertex_datas is None:
+            continue
+        datas, indices = vertex_datas
+        vertex_data = np.ascontiguousarray(np.hstack(datas), dtype=VERTEX_DTYPE)
+        index_data = np.ascontiguousarray(indices, dtype=INDEX_DTYPE)
+        positions = datas[0]
+        bound_min = geometry_data.get('bound_min', np.min(positions, axis=0))
+        bound_max = geometry_data.get('bound_max', np.max(positions, axis=0))
+        geometry_descs.append(dict(
+            name=geometry_data.get('name', ''),
+            skeleton_name=geometry_data.get('skeleton_name', ''),
+            bound_min=np.array(bound_min, dtype=np.float32).tolist(),
+            bound_max=np.array(bound_max, dtype=np.float32).tolist(),
+            radius=float(geometry_data.get('radius', np.linalg.norm(np.subtract(bound_max, bound_min)))),
+            vertex_component_count=[len(data[0]) for data in datas],
+            vertex_count=len(vertex_data),
+            index_count=len(index_data),
+            vertex_offset=0,
+            index_offset=0,
+        ))
+        blocks.append((vertex_data, index_data))
+
+    header_data = dict(
+        skeleton_datas=mesh_data.get('skeleton_datas', []),
+        animation_datas=mesh_data.get('animation_datas', []),
+        geometry_descs=geometry_descs,
+    )
+
+    # The offsets are in the header data, so compute them with the size of the header data until it is fixed.
+    header_size = 0
+    while True:
+        offset = align_offset(MESH_FILE_HEADER.size + header_size)
+        for geometry_desc, (vertex_data, index_data) in zip(geometry_descs, blocks):
+            geometry_desc['vertex_offset'] = offset
+            offset = align_offset(offset + vertex_data.nbytes)
+            geometry_desc['index_offset'] = offset
+            offset = align_offset(offset + index_data.nbytes)
+        header_bytes = pickle.dumps(header_data, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(header_bytes) <= header_size:
+            break
+        header_size = len(header_bytes)
+
+    # The loaded mesh may still memory map the file, so the file is written to the temp file and replaced.
+    temp_filepath = filepath + '.tmp'
+    try:
+        with open(temp_filepath, 'wb') as f:
+            f.write(MESH_FILE_HEADER.pack(MESH_FILE_MAGIC, MESH_FILE_VERSION, header_size))
+            f.write(header_bytes.ljust(header_size, b'\x00'))
+            for geometry_desc, (vertex_data, index_data) in zip(geometry_descs, blocks):
+                f.seek(geometry_desc['vertex_offset'])
+                f.write(vertex_data.tobytes())
+                f.seek(geometry_desc['index_offset'])
+                f.write(index_data.tobytes())
+        os.replace(temp_filepath, filepath)
+    except BaseException:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+        raise
+
+
+def load_mesh_file(filepath):
+    """
+    :return: mesh_data. The vertex_data and the indices of the geometry datas are read-only memory mapped arrays.
+    """
+    with open(filepath, 'rb') as f:
+        magic, version, header_size = MESH_FILE_HEADER.unpack(f.read(MESH_FILE_HEADER.size))
+        if magic != MESH_FILE_MAGIC or version != MESH_FILE_VERSION:
+            raise BaseException("Not supported mesh file version. %s : %d" % (filepath, version))
+        header_data = pickle.loads(f.read(header_size))
+
+    geometry_datas = []
+    geometry_descs = header_data.pop('geometry_descs')
+    if geometry_descs:
+        file_data = np.memmap(filepath, dtype=np.uint8, mode='r')
+        for geometry_desc in geometry_descs:
+            vertex_component_count = geometry_desc.pop('vertex_component_count')
+            vertex_count = geometry_desc.pop('vertex_count')
+            index_count = geometry_desc.pop('index_count')
+            vertex_offset = geometry_desc.pop('vertex_offset')
+            index_offset = geometry_desc.pop('index_offset')
+            vertex_size = vertex_count * sum(vertex_component_count) * VERTEX_DTYPE.itemsize
+            index_size = index_count * INDEX_DTYPE.itemsize
+            geometry_desc['vertex_component_count'] = vertex_component_count
+            geometry_desc['vertex_data'] = file_data[vertex_offset:vertex_offset + vertex_size].view(VERTEX_DTYPE)
+            geometry_desc['indices'] = file_data[index_offset:index_offset + index_size].view(INDEX_DTYPE)
+            geometry_datas.append(geometry_desc)
+    header_data['geometry_datas'] = geometry_datas
+    return header_data
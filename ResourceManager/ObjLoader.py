@@ -1,4 +1,3 @@
-import copy
 import os, traceback
 from collections import OrderedDict
 
@@ -11,19 +10,88 @@ from Utilities import *
 defaultTexCoord = [0.0, 0.0]
 defaultNormal = [0.0, 1.0, 0.0]
 
+# The file is read in the chunk of lines by this size.
+READ_CHUNK_SIZE = 64 * 1024 * 1024
+
 
 class MeshObject:
     def __init__(self, default_name):
         self.name = default_name
         self.group_name = ''
         self.mtl_name = ''
-        self.indices = []
+        # The vertex tokens of the faces. ex) '1/2/3'
+        self.face_tokens = []
+        # The vertex count of each face.
+        self.face_vertex_counts = []
+
+
+def parse_float_lines(lines, component_count, default_value):
+    """
+    Parse the lines of the float values at once. ex) 'v 1.0 2.0 3.0' -> lines are ['1.0 2.0 3.0', ...]
+    :return: (len(lines), component_count) float32 array
+    """
+    if len(lines) == 0:
+        return np.zeros((0, component_count), dtype=np.float32)
+
+    values = np.fromstring(' '.join(lines), dtype=np.float32, sep=' ')
+    value_count = len(lines[0].split())
+    if component_count <= value_count and len(values) == len(lines) * value_count:
+        return values.reshape(len(lines), value_count)[:, :component_count]
+
+    # The lines have a different count of values.
+    datas = np.array([default_value, ] * len(lines), dtype=np.float32)
+    for i, line in enumerate(lines):
+        line_values = line.split()[:component_count]
+        datas[i, :len(line_values)] = line_values
+    return datas
+
+
+def parse_face_tokens(face_tokens):
+    """
+    :param face_tokens: the vertex tokens of faces. ex) ['1/2/3', '1//3', '1/2', '1']
+    :return: (N, 3) int64 array of (position index, texcoord index, normal index). The empty index is 0.
+    """
+    if len(face_tokens) == 0:
+        return np.zeros((0, 3), dtype=np.int64)
+
+    text = ' '.join(face_tokens).replace('//', '/0/').replace('/', ' ')
+    values = np.fromstring(text, dtype=np.int64, sep=' ')
+    component_count = face_tokens[0].count('/') + 1
+    if len(values) == len(face_tokens) * component_count:
+        values = values.reshape(len(face_tokens), component_count)
+    else:
+        # The faces have a different format.
+        values = np.array([(token.replace('//', '/0/').split('/') + ['0', '0'])[:3] for token in face_tokens],
+                          dtype=np.int64)
+
+    indices = np.zeros((len(face_tokens), 3), dtype=np.int64)
+    indices[:, :values.shape[1]] = values[:, :3]
+    return np.where(indices != 0, indices - 1, 0)
+
+
+def triangulate(face_vertex_counts):
+    """
+    Triangulate the polygons as triangle fans.
+    :return: (triangles, 3) array of the index into the face vertices.
+    """
+    face_vertex_counts = np.array(face_vertex_counts, dtype=np.int64)
+    face_offsets = np.cumsum(face_vertex_counts) - face_vertex_counts
+    triangle_counts = np.maximum(face_vertex_counts - 2, 0)
+    face_starts = np.repeat(face_offsets, triangle_counts)
+    # the index of the triangle in the polygon
+    triangle_index = np.arange(triangle_counts.sum()) - np.repeat(np.cumsum(triangle_counts) - triangle_counts,
+                                                                  triangle_counts)
+    triangles = np.stack([face_starts, face_starts + triangle_index + 1, face_starts + triangle_index + 2], axis=1)
+    # The quad is split to (0, 1, 2), (2, 3, 0).
+    triangles[0 < triangle_index] = np.roll(triangles[0 < triangle_index], -1, axis=1)
+    return triangles
 
 
 class OBJ:
     def __init__(self, filename, scale, swapyz):
         """
         Loads a wavefront OBJ file.
+        The lines are collected by the type in chunks, and the values are parsed by numpy at once.
         """
         self.meshes = []
         self.positions = []
@@ -36,128 +104,133 @@ class OBJ:
         if os.path.exists(filename):
             # load OBJ file
             default_name = os.path.splitext(os.path.split(filename)[-1])[0]
+            position_lines = []
+            normal_lines = []
+            texcoord_lines = []
+            # If texcoord or normal is empty at the first face, add the default one.
+            use_default_texcoord = None
+            use_default_normal = None
             preFix = None
             mesh_object = None
-            for line in open(filename, "r"):
-                # is comment?
-                line = line.strip()
-                if line == '' or line.startswith('#'):
-                    continue
-
-                values = [value.strip() for value in line.split()]
-                if len(values) < 2:
-                    continue
-
-                # start to paring a new mesh.
-                if mesh_object is None or (preFix == 'f' and values[0] not in ('f', 's')):
-                    mesh_object = MeshObject(default_name)
-                    self.meshes.append(mesh_object)
-
-                # first strings
-                preFix = values[0]
-                values = values[1:]
-
-                if preFix == 'o':
-                    mesh_object.name = ' '.join(values)
-                elif preFix == 'g':
-                    mesh_object.group_name = ' '.join(values)
-                    if mesh_object.name == '':
-                        mesh_object.name = mesh_object.group_name
-                elif preFix == 'mtllib':
-                    # TODO : Parsing mtllib
-                    pass
-                # vertex position
-                elif preFix == 'v' and len(values) >= 3:
-                    # apply scale
-                    self.positions.append(list(map(lambda x: float(x) * scale, values[:3])))
-                # vertex normal
-                elif preFix == 'vn' and len(values) >= 3:
-                    self.normals.append(list(map(float, values[:3])))
-                # texture coordinate
-                elif preFix == 'vt' and len(values) >= 2:
-                    self.texcoords.append(list(map(float, values[:2])))
-                # material name
-                elif preFix in ('usemtl', 'usemat'):
-                    mesh_object.material = ' '.join(values)
-                    if mesh_object.name == '':
-                        mesh_object.name = mesh_object.material
-                # faces
-                elif preFix == 'f':
-                    pos_indices = []
-                    normal_indices = []
-                    tex_indices = []
-
-                    # If texcoord is empty, add the default texcoord.
-                    if len(self.texcoords) < 1:
-                        self.texcoords.append(copy.copy(defaultTexCoord))
-                    # If normal is empty, add the default normal.
-                    if len(self.normals) < 1:
-                        self.normals.append(copy.copy(defaultNormal))
-
-                    # parsing index data
-                    for indices in values:
-                        pos_index, tex_index, normal_index = list(
-                            map(lambda x: int(x) - 1 if x else 0, indices.split('/')))
-                        # insert vertex, texcoord, normal index
-                        pos_indices.append(pos_index)
-                        tex_indices.append(tex_index)
-                        normal_indices.append(normal_index)
-
-                    # append face list
-                    if len(pos_indices) == 3:
-                        mesh_object.indices.append((pos_indices, normal_indices, tex_indices))
-                    # Quad to Two Triangles.
-                    elif len(pos_indices) == 4:
-                        mesh_object.indices.append((pos_indices[:3], normal_indices[:3], tex_indices[:3]))
-                        mesh_object.indices.append(([pos_indices[2], pos_indices[3], pos_indices[0]],
-                                                    [normal_indices[2], normal_indices[3], normal_indices[0]],
-                                                    [tex_indices[2], tex_indices[3], tex_indices[0]]))
+            with open(filename, "r") as f:
+                for lines in iter(lambda: f.readlines(READ_CHUNK_SIZE), []):
+                    for line in lines:
+                        # fast path of the vertex data and the faces
+                        if mesh_object is not None:
+                            head = line[:3]
+                            if head[:2] == 'f ':
+                                if use_default_texcoord is not None:
+                                    tokens = line[2:].split()
+                                    mesh_object.face_tokens.extend(tokens)
+                                    mesh_object.face_vertex_counts.append(len(tokens))
+                                    preFix = 'f'
+                                    continue
+                            elif preFix != 'f':
+                                if head[:2] == 'v ':
+                                    position_lines.append(line[2:])
+                                    preFix = 'v'
+                                    continue
+                                elif head == 'vt ':
+                                    texcoord_lines.append(line[3:])
+                                    preFix = 'vt'
+                                    continue
+                                elif head == 'vn ':
+                                    normal_lines.append(line[3:])
+                                    preFix = 'vn'
+                                    continue
+
+                        values = line.split(None, 1)
+                        # is comment?
+                        if len(values) < 2 or values[0].startswith('#'):
+                            continue
+
+                        # first strings
+                        currentPreFix, value = values
+
+                        # start to paring a new mesh.
+                        if mesh_object is None or (preFix == 'f' and currentPreFix not in ('f', 's')):
+                            mesh_object = MeshObject(default_name)
+                            self.meshes.append(mesh_object)
+                        preFix = currentPreFix
+
+                        # vertex position
+                        if preFix == 'v':
+                            position_lines.append(value)
+                        # vertex normal
+                        elif preFix == 'vn':
+                            normal_lines.append(value)
+                        # texture coordinate
+                        elif preFix == 'vt':
+                            texcoord_lines.append(value)
+                        # faces
+                        elif preFix == 'f':
+                            if use_default_texcoord is None:
+                                use_default_texcoord = len(texcoord_lines) < 1
+                                use_default_normal = len(normal_lines) < 1
+                            tokens = value.split()
+                            mesh_object.face_tokens.extend(tokens)
+                            mesh_object.face_vertex_counts.append(len(tokens))
+                        elif preFix == 'o':
+                            mesh_object.name = value.strip()
+                        elif preFix == 'g':
+                            mesh_object.group_name = value.strip()
+                            if mesh_object.name == '':
+                                mesh_object.name = mesh_object.group_name
+                        elif preFix == 'mtllib':
+                            # TODO : Parsing mtllib
+                            pass
+                        # material name
+                        elif preFix in ('usemtl', 'usemat'):
+                            mesh_object.material = value.strip()
+                            if mesh_object.name == '':
+                                mesh_object.name = mesh_object.material
+
+            # apply scale
+            self.positions = parse_float_lines(position_lines, 3, [0.0, 0.0, 0.0]) * scale
+            self.normals = parse_float_lines(normal_lines, 3, defaultNormal)
+            self.texcoords = parse_float_lines(texcoord_lines, 2, defaultTexCoord)
+            if use_default_texcoord:
+                self.texcoords = np.vstack([[defaultTexCoord, ], self.texcoords]).astype(np.float32)
+            if use_default_normal:
+                self.normals = np.vstack([[defaultNormal, ], self.normals]).astype(np.float32)
 
     def get_geometry_data(self):
         geometry_datas = []
         for mesh in self.meshes:
-            positions = []
-            normals = []
-            texcoords = []
-            indices = []
-
-            indexMap = {}
-
-            boundMin = Float3(FLOAT32_MAX, FLOAT32_MAX, FLOAT32_MAX)
-            boundMax = Float3(FLOAT32_MIN, FLOAT32_MIN, FLOAT32_MIN)
-            for n, mesh_indices in enumerate(mesh.indices):
-                # exclude material
-                postionIndicies, normalIndicies, texcoordIndicies = mesh_indices
-                for i in range(len(postionIndicies)):
-                    index_key = (postionIndicies[i], normalIndicies[i], texcoordIndicies[i])
-                    if index_key in indexMap:
-                        indices.append(indexMap[index_key])
-                    else:
-                        indices.append(len(indexMap))
-                        indexMap[index_key] = len(indexMap)
-                        positions.append(self.positions[postionIndicies[i]])
-                        normals.append(self.normals[normalIndicies[i]])
-                        texcoords.append(self.texcoords[texcoordIndicies[i]])
-                        # bounding box
-                        position = positions[-1]
-                        for j in range(3):
-                            if boundMin[j] > position[j]:
-                                boundMin[j] = position[j]
-                            if boundMax[j] < position[j]:
-                                boundMax[j] = position[j]
-
-            if len(positions) == 0:
+            # (position index, texcoord index, normal index) of the triangle vertices
+            vertex_keys = parse_face_tokens(mesh.face_tokens)[triangulate(mesh.face_vertex_counts).reshape(-1)]
+
+            if len(vertex_keys) == 0:
                 logger.info('%s has a empty mesh. %s' % (self.filename, mesh.name))
                 continue
 
+            # remove the duplicated vertices, and keep the order of the first appearance.
+            key_ranges = vertex_keys.max(axis=0) + 1
+            if np.prod(key_ranges.astype(np.float64)) < np.iinfo(np.int64).max:
+                # pack the index triplet into a single key, that is faster than np.unique of axis=0.
+                packed_keys = (vertex_keys[:, 0] * key_ranges[1] + vertex_keys[:, 1]) * key_ranges[2] + vertex_keys[:, 2]
+                _, first_indices, inverse = np.unique(packed_keys, return_index=True, return_inverse=True)
+                unique_keys = vertex_keys[first_indices]
+            else:
+                unique_keys, first_indices, inverse = np.unique(vertex_keys, axis=0, return_index=True,
+                                                                return_inverse=True)
+            order = np.argsort(first_indices)
+            new_indices = np.empty(len(order), dtype=np.uint32)
+            new_indices[order] = np.arange(len(order), dtype=np.uint32)
+            unique_keys = unique_keys[order]
+
+            positions = self.positions[unique_keys[:, 0]]
+            bound_min = np.min(positions, axis=0)
+            bound_max = np.max(positions, axis=0)
+
             geometry_data = dict(name=mesh.name,
-                                 positions=copy.deepcopy(positions),
-                                 normals=copy.deepcopy(normals),
-                                 texcoords=copy.deepcopy(texcoords),
-                                 indices=copy.deepcopy(indices),
-                                 bound_min=copy.deepcopy(boundMin),
-                                 bound_max=copy.deepcopy(boundMax),
-                                 radius=magnitude(boundMax - boundMin))
+                                 positions=positions,
+                                 normals=self.normals[unique_keys[:, 2]],
+                                 texcoords=self.texcoords[unique_keys[:, 1]],
+                                 indices=new_indices[inverse.reshape(-1)],
+                                 bound_min=bound_min,
+                                 bound_max=bound_max,
+                                 radius=magnitude(bound_max - bound_min))
             geometry_datas.append(geometry_data)
         return geometry_datas
 
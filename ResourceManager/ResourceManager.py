@@ -1,5 +1,4 @@
 import codecs
-import math
 import copy
 import os
 import glob
@@ -16,19 +15,27 @@ from collections import OrderedDict
 from distutils.dir_util import copy_tree
 import shutil
 import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import multiprocessing
 
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
+from PIL import ImageDraw, ImageFont, ImageFilter
 import numpy as np
-from numpy import array, float32, uint8
 from OpenGL.GL import *
 
 from Common import logger, log_level
 from Object import MaterialInstance, Triangle, Quad, Cube, Mesh, Model, Font
-from OpenGLContext import CreateTexture, Material, Texture2D, Texture3D, TextureCube
-from OpenGLContext import Shader, parsing_macros, parsing_uniforms, parsing_material_components
+from OpenGLContext import CreateTexture, Material, MaterialCompileQueue, ProgramBinaryCache, Texture2D, Texture3D, \
+    TextureCube, procedural_textures
+from OpenGLContext import Shader, ShaderIncludeCache, parsing_macros, parsing_uniforms, parsing_material_components, \
+    get_material_uniform_block_layout, generate_material_uniform_block, shader_types
 from Utilities import Attributes, Singleton, Config, Logger
 from Utilities import GetClassName, is_gz_compressed_file, check_directory_and_mkdir, get_modify_time_of_file
-from . import Collada, OBJ, loadDDS, generate_font_data
+from . import Collada, OBJ, loadDDS, loadImage, generate_font_data
+from .MeshFile import is_mesh_file, save_mesh_file, load_mesh_file
+from .TextureFile import is_texture_file, save_texture_file, load_texture_file, load_texture_file_header
+from .TextureCompression import get_compression, select_compression, compress_texture_datas
+from .AsyncResourceLoader import AsyncResourceLoader
+from .ShaderCache import ShaderCodeCache
 
 
 # -----------------------#
@@ -145,6 +152,8 @@ class Resource:
         self.type_name = resource_type_name
         self.data = None
         self.meta_data = None
+        # The data is a placeholder until the async loading is finished.
+        self.is_loading = False
 
     def get_resource_info(self):
         return self.name, self.type_name, self.data is not None
@@ -160,6 +169,8 @@ class Resource:
             if type(data) is dict:
                 self.data = data
             else:
+                # the class too, the placeholder could be the other class.
+                self.data.__class__ = data.__class__
                 self.data.__dict__ = data.__dict__
 
         # Notify that data has been loaded.
@@ -168,9 +179,12 @@ class Resource:
     def clear_data(self):
         self.data = None
 
-    def get_data(self):
-        if self.is_need_to_load():
-            ResourceManager.instance().load_resource(self.name, self.type_name)
+    def get_data(self, wait=False):
+        """
+        :param wait: load synchronously, if the resource is not loaded or the data is a placeholder.
+        """
+        if (wait and self.is_loading) or (not self.is_loading and self.is_need_to_load()):
+            ResourceManager.instance().request_load_resource(self, wait)
         return self.data
 
     def getAttribute(self):
@@ -195,6 +209,13 @@ class ResourceLoader(object):
     external_dir_names = []  # example : Externals/Fonts, Externals/Meshes
     externalFileExt = {}  # example, { 'WaveFront': '.obj' }
     USE_FILE_COMPRESS_TO_SAVE = True
+    # load_source_data runs in the worker processes of ResourceManager.executor.
+    USE_CONVERT_PROCESS = False
+    # load_source_data runs on the worker threads of ResourceManager.thread_executor. It is for the loader which
+    # releases the GIL, and the source data is not pickled.
+    USE_CONVERT_THREAD = False
+    # load_resource_data runs on the thread of AsyncResourceLoader, and the placeholder is used until finished.
+    USE_ASYNC_LOAD = False
 
     def __init__(self, core_manager, root_path):
         self.core_manager = core_manager
@@ -251,6 +272,7 @@ class ResourceLoader(object):
                         self.add_convert_source_file(source_filepath)
 
                 # convert external file to rsource file.
+                convert_list = []
                 for source_filepath in self.externalFileList:
                     resource_name = self.getResourceName(external_path, source_filepath)
                     resource = self.getResource(resource_name, noWarn=True)
@@ -259,10 +281,11 @@ class ResourceLoader(object):
                     if resource is None:
                         logger.info("Create the new resource from %s." % source_filepath)
                         resource = self.create_resource(resource_name)
-                        self.convert_resource(resource, source_filepath)
+                        convert_list.append((resource, source_filepath))
                     elif meta_data and self.is_new_external_data(meta_data, source_filepath):
-                        self.convert_resource(resource, source_filepath)
+                        convert_list.append((resource, source_filepath))
                         logger.info("Refresh the new resource from %s." % source_filepath)
+                self.convert_resources(convert_list)
             # clear list
             self.externalFileList = []
 
@@ -300,9 +323,48 @@ class ResourceLoader(object):
             num += 1
         return ''
 
-    def convert_resource(self, resource, source_filepath):
+    @staticmethod
+    def load_source_data(resource_name, source_filepath, resource_path):
+        """
+        Load the data from the external file without OpenGL.
+        It runs in the worker process if USE_CONVERT_PROCESS, or on the worker thread if USE_CONVERT_THREAD.
+        :return: picklable source data for convert_resource.
+        """
+        return None
+
+    def convert_resource(self, resource, source_filepath, source_data=None):
         logger.warn("convert_resource is not implemented in %s." % self.name)
 
+    def convert_resources(self, convert_list):
+        """
+        Load the source datas in parallel, then create the resources and save them on the main thread.
+        :param convert_list: [(resource, source_filepath), ]
+        """
+        executor = None
+        if self.USE_CONVERT_THREAD:
+            executor = self.resource_manager.thread_executor
+        elif self.USE_CONVERT_PROCESS:
+            executor = self.resource_manager.executor
+        if executor is None or len(convert_list) < 2:
+            for resource, source_filepath in convert_list:
+                self.convert_resource(resource, source_filepath)
+            return
+
+        futures = {}
+        for resource, source_filepath in convert_list:
+            future = executor.submit(self.load_source_data, resource.name, source_filepath, self.resource_path)
+            futures[future] = (resource, source_filepath)
+
+        for future in as_completed(futures):
+            resource, source_filepath = futures[future]
+            try:
+                source_data = future.result()
+            except:
+                logger.error(traceback.format_exc())
+                logger.error("Failed to load the source data : %s" % source_filepath)
+                continue
+            self.convert_resource(resource, source_filepath, source_data)
+
     def getResource(self, resourceName, noWarn=False):
         if resourceName in self.resources:
             return self.resources[resourceName]
@@ -310,9 +372,9 @@ class ResourceLoader(object):
             logger.error("%s cannot found %s resource." % (self.name, resourceName))
         return None
 
-    def getResourceData(self, resourceName, noWarn=False):
+    def getResourceData(self, resourceName, noWarn=False, wait=False):
         resource = self.getResource(resourceName, noWarn)
-        return resource.get_data() if resource else None
+        return resource.get_data(wait) if resource else None
 
     def getResourceList(self):
         return list(self.resources.values())
@@ -376,7 +438,7 @@ class ResourceLoader(object):
 
     def rename_resource(self, resource_name, new_name):
         if new_name and resource_name != new_name:
-            resource_data = self.getResourceData(resource_name)
+            resource_data = self.getResourceData(resource_name, wait=True)
             resource = self.create_resource(new_name, resource_data)
             if resource:
                 if resource_data and hasattr(resource_data, 'name'):
@@ -389,6 +451,39 @@ class ResourceLoader(object):
     def load_resource(self, resource_name):
         logger.warn("load_resource is not implemented in %s." % self.name)
 
+    def get_placeholder_data(self, resource):
+        """
+        :return: the data used until the async loading is finished. None is to load synchronously.
+        """
+        return None
+
+    def finalize_resource(self, resource, load_data):
+        """
+        Create the resource data from the result of load_resource_data on the main thread.
+        """
+        logger.warn("finalize_resource is not implemented in %s." % self.name)
+        return False
+
+    def load_resource_async(self, resource):
+        placeholder_data = self.get_placeholder_data(resource)
+        if placeholder_data is None:
+            self.load_resource(resource.name)
+            return
+
+        resource.is_loading = True
+        if resource.data is None:
+            # The placeholder is copied, because the data is replaced in place by Resource.set_data when loaded.
+            resource.data = copy.copy(placeholder_data)
+        self.resource_manager.async_loader.request(self, resource)
+
+    def finalize_async_resource(self, resource, load_data):
+        # skip, if it was loaded synchronously or unregisted in the meantime.
+        if not resource.is_loading or self.getResource(resource.name, noWarn=True) is not resource:
+            return
+        resource.is_loading = False
+        if not load_data or not self.finalize_resource(resource, load_data):
+            logger.error('%s failed to load %s' % (self.name, resource.name))
+
     def open_resource(self, resource_name):
         logger.warn("open_resource is not implemented in %s." % self.name)
 
@@ -405,7 +500,7 @@ class ResourceLoader(object):
 
     def save_resource(self, resource_name):
         resource = self.getResource(resource_name)
-        resource_data = self.getResourceData(resource_name)
+        resource_data = self.getResourceData(resource_name, wait=True)
         if resource and resource_data:
             if hasattr(resource_data, 'get_save_data'):
                 save_data = resource_data.get_save_data()
@@ -489,9 +584,39 @@ class ShaderLoader(ResourceLoader):
     fileExt = '.glsl'
     shader_version = "#version 430 core"
 
+    def __init__(self, core_manager, root_path):
+        ResourceLoader.__init__(self, core_manager, root_path)
+        self.shader_code_cache = ShaderCodeCache(os.path.join(root_path, 'Caches', 'ShaderCodes'))
+        # The parsed include files shared by all shaders.
+        self.include_cache = ShaderIncludeCache()
+
     def get_shader_version(self):
         return self.shader_version
 
+    def generate_shader_codes(self, shader, shader_version, macros={}):
+        """
+        Shader.generate_shader_codes through the shader code cache.
+        """
+        key = self.shader_code_cache.get_key(shader.shader_code, shader_version, macros)
+        entry = self.shader_code_cache.get(key)
+        if entry is not None:
+            shader.generated_include_files = list(entry['include_hashes'].keys())
+            for include_file in shader.generated_include_files:
+                if include_file not in shader.include_files:
+                    shader.include_files.append(include_file)
+            if entry['shader_codes'] is None:
+                return None
+            return {shader_type: entry['shader_codes'][shader_type.name] for shader_type in shader_types
+                    if shader_type.name in entry['shader_codes']}
+
+        shader_codes = shader.generate_shader_codes(shader_version, macros)
+        if shader_codes is not None:
+            cache_codes = {shader_type.name: shader_code for shader_type, shader_code in shader_codes.items()}
+        else:
+            cache_codes = None
+        self.shader_code_cache.set(key, cache_codes, shader.generated_include_files)
+        return shader_codes
+
     def load_resource(self, resource_name):
         resource = self.getResource(resource_name)
         if resource:
@@ -508,6 +633,7 @@ class ShaderLoader(ResourceLoader):
                         resource.set_data(shader)
                         resource.meta_data.set_resource_meta_data(resource.meta_data.resource_filepath)
                         self.resource_manager.materialLoader.reload_materials(resource.meta_data.resource_filepath)
+                        logger.info(self.shader_code_cache.get_log())
                         return True
                     except:
                         logger.error(traceback.format_exc())
@@ -545,7 +671,7 @@ class MaterialLoader(ResourceLoader):
     resource_dir_name = 'Materials'
     resource_type_name = 'Material'
     fileExt = '.mat'
-    resource_version = 0.6
+    resource_version = 0.7
     USE_FILE_COMPRESS_TO_SAVE = False
 
     def __init__(self, core_manager, root_path):
@@ -604,12 +730,44 @@ class MaterialLoader(ResourceLoader):
                     macros = material_datas.get('macros', {})
                     self.generate_new_material(resource.name, shader_name, macros)
                 else:
-                    material = Material(resource.name, material_datas)
+                    material = self.create_material(resource.name, material_datas)
                     resource.set_data(material)
                 return True
         logger.error('%s failed to load %s' % (self.name, resource_name))
         return False
 
+    def create_material(self, material_name, material_datas, callback=None):
+        """
+        Create the material with the program binary from the program binary cache if it's valid for this driver.
+        The program binary is not kept in the material file anymore.
+        The material compiled from source is finalized by the material compile queue.
+        :param callback: callback(material) is called after the material is finalized.
+        """
+        program_binary_cache = ProgramBinaryCache.instance()
+        compile_queue = MaterialCompileQueue.instance()
+        shader_codes = material_datas.get('shader_codes')
+        material_datas['binary_format'], material_datas['binary_data'] = program_binary_cache.load(shader_codes)
+        material = Material(material_name, material_datas, deferred=compile_queue.enabled)
+        material_datas['binary_format'] = None
+        material_datas['binary_data'] = None
+
+        def on_compiled(material):
+            if not material.valid:
+                # the failed material is not used, and it is generated again when it is requested next time.
+                logger.error("Unregist %s material, because it has been failed to compile." % material_name)
+                self.unregist_resource(self.getResource(material_name, noWarn=True))
+            elif not material.is_compiled_from_binary:
+                binary_format, binary_data = material.save_to_binary()
+                program_binary_cache.save(shader_codes, binary_format, binary_data)
+            if callback is not None:
+                callback(material)
+
+        if material.is_finalized:
+            on_compiled(material)
+        else:
+            compile_queue.push(material, on_compiled)
+        return material
+
     def generate_material_name(self, shader_name, macros=None):
         if macros:
             keys = sorted(macros.keys())
@@ -622,7 +780,7 @@ class MaterialLoader(ResourceLoader):
         shader = self.resource_manager.getShader(shader_name)
         shader_version = self.resource_manager.get_shader_version()
         if shader:
-            shader_codes = shader.generate_shader_codes(shader_version, macros)
+            shader_codes = self.resource_manager.shader_loader.generate_shader_codes(shader, shader_version, macros)
             if shader_codes is not None:
                 shader_code_list = shader_codes.values()
                 final_macros = parsing_macros(shader_code_list)
@@ -641,42 +799,53 @@ class MaterialLoader(ResourceLoader):
                 for include_file in shader.include_files:
                     include_files[include_file] = get_modify_time_of_file(include_file)
 
+                # the material components except the samplers are moved into the std140 uniform block.
+                material_uniform_block, material_uniform_block_size = \
+                    get_material_uniform_block_layout(material_components)
+                if material_uniform_block:
+                    shader_codes = {shader_type: generate_material_uniform_block(shader_code, material_uniform_block)
+                                    for shader_type, shader_code in shader_codes.items()}
+
                 material_datas = dict(
                     shader_name=shader_name,
                     shader_codes=shader_codes,
                     include_files=include_files,
                     uniforms=uniforms,
                     material_components=material_components,
+                    material_uniform_block=material_uniform_block,
+                    material_uniform_block_size=material_uniform_block_size,
                     binary_data=None,
                     binary_format=None,
                     macros=final_macros
                 )
-                # create material
-                material = Material(final_material_name, material_datas)
+                # write material to file, and regist to resource manager
+                shader_meta_data = self.resource_manager.shader_loader.getMetaData(shader_name)
+                if shader_meta_data:
+                    source_filepath = shader_meta_data.resource_filepath
+                else:
+                    source_filepath = ""
 
-                if material and material.valid:
-                    resource = self.getResource(final_material_name, noWarn=True)
-                    if resource is None:
-                        resource = self.create_resource(final_material_name)
+                def save_material(material):
+                    if material.valid:
+                        resource = self.getResource(final_material_name, noWarn=True)
+                        if resource is None:
+                            resource = self.create_resource(final_material_name)
 
-                    # set include files meta datas
-                    resource.meta_data.include_files = material_datas.get('include_files', {})
+                        # set include files meta datas
+                        resource.meta_data.include_files = include_files
 
-                    # write material to file, and regist to resource manager
-                    shader_meta_data = self.resource_manager.shader_loader.getMetaData(shader_name)
-                    if shader_meta_data:
-                        source_filepath = shader_meta_data.resource_filepath
-                    else:
-                        source_filepath = ""
+                        # Done : save material data
+                        self.save_resource_data(resource, material_datas, source_filepath)
 
-                    # save binary data of shader.
-                    binary_format, binary_data = material.save_to_binary()
-                    if binary_format is not None and binary_data is not None:
-                        material_datas['binary_format'] = binary_format
-                        material_datas['binary_data'] = binary_data
+                # create material
+                material = self.create_material(final_material_name, material_datas, callback=save_material)
 
-                    # Done : save material data
-                    self.save_resource_data(resource, material_datas, source_filepath)
+                # the material which is still compiling is registered too, and used after finalized.
+                if material.valid or not material.is_finalized:
+                    resource = self.getResource(final_material_name, noWarn=True)
+                    if resource is None:
+                        resource = self.create_resource(final_material_name)
+                    resource.meta_data.include_files = include_files
                     resource.set_data(material)
                     return material
         logger.error("Failed to generate_new_material %s." % material_name)
@@ -782,12 +951,20 @@ class TextureLoader(ResourceLoader):
     name = "TextureLoader"
     resource_dir_name = 'Textures'
     resource_type_name = 'Texture'
-    resource_version = 2
+    resource_version = 3
     USE_FILE_COMPRESS_TO_SAVE = True
+    # compress the imported images to BC1, BC3 or BC5.
+    USE_TEXTURE_COMPRESSION = True
     external_dir_names = [os.path.join('Externals', 'Textures'), ]
     fileExt = '.texture'
     externalFileExt = dict(GIF=".gif", JPG=".jpg", JPEG=".jpeg", PNG=".png", BMP=".bmp", TGA=".tga", TIF=".tif",
                            TIFF=".tiff", DXT=".dds", KTX=".ktx")
+    # PIL and numpy release the GIL while decoding and compressing.
+    USE_CONVERT_THREAD = True
+    USE_ASYNC_LOAD = True
+
+    # the texture type is saved as the class name in the texture file.
+    texture_types = dict(Texture2D=Texture2D, Texture3D=Texture3D, TextureCube=TextureCube)
 
     def __init__(self, core_manager, root_path):
         ResourceLoader.__init__(self, core_manager, root_path)
@@ -797,70 +974,208 @@ class TextureLoader(ResourceLoader):
         ResourceLoader.initialize(self)
         self.generate_cube_textures()
 
-        # gradient 3d texture
-        size = 64
-        value = 255.0 / float(size)
-        data = array([0, 0, 0, 255] * size * size * size, dtype=uint8)
-        for z in range(size):
-            for y in range(size):
-                for x in range(size):
-                    index = (x + y * size + z * size * size) * 4
-                    data[index] = x * value
-                    data[index+1] = y * value
-                    data[index+2] = z * value
-
-        default_3d = CreateTexture(
-            name='default_3d',
-            texture_type=Texture3D,
-            image_mode='RGBA',
-            width=size,
-            height=size,
-            depth=size,
-            internal_format=GL_RGBA8,
-            texture_format=GL_RGBA,
-            min_filter=GL_NEAREST,
-            mag_filter=GL_NEAREST,
-            data_type=GL_UNSIGNED_BYTE,
-            wrap=GL_CLAMP_TO_EDGE,
-            data=data,
-        )
-        self.create_resource("default_3d", default_3d)
+        # The built-in textures are generated when they are used at first.
+        for texture_name in procedural_textures:
+            if self.getResource(texture_name, noWarn=True) is None:
+                self.create_resource(texture_name)
 
     def open_resource(self, resource_name):
         texture = self.getResourceData(resource_name)
         if texture:
             self.core_manager.renderer.set_debug_texture(texture)
 
+    def save_resource(self, resource_name):
+        """
+        Save the attributes of the texture with the image levels of the texture file instead of reading back
+        the texture. The read back is used only if the image format is changed.
+        """
+        resource = self.getResource(resource_name)
+        texture = self.getResourceData(resource_name, wait=True)
+        if resource and texture and resource_name not in procedural_textures:
+            filePath = resource.meta_data.resource_filepath
+            if os.path.exists(filePath) and is_texture_file(filePath):
+                save_data = texture.get_save_data(get_image_data=False)
+                file_datas = load_texture_file(filePath)
+                if all(file_datas.get(key) == save_data[key] for key in ('width', 'height', 'depth', 'internal_format',
+                                                                         'texture_format', 'data_type')):
+                    # copy the memory mapped levels, because the file is overwritten.
+                    if file_datas.get('data') is not None:
+                        save_data['data'] = np.array(file_datas['data'])
+                    mipmap_datas = file_datas.get('mipmap_datas')
+                    if mipmap_datas is not None:
+                        save_data['mipmap_datas'] = [np.array(mipmap_data) for mipmap_data in mipmap_datas]
+                    mipmap_datas = None
+                    file_datas = None
+                    self.save_resource_data(resource, save_data, resource.meta_data.source_filepath)
+                    return True
+        return ResourceLoader.save_resource(self, resource_name)
+
     def load_resource(self, resource_name):
         resource = self.getResource(resource_name)
         if resource:
+            resource.is_loading = False
             meta_data = resource.meta_data
             if self.is_new_external_data(meta_data, meta_data.source_filepath):
                 self.convert_resource(resource, meta_data.source_filepath)
 
             texture_datas = self.load_resource_data(resource)
-            if texture_datas:
-                if texture_datas.get('texture_type') == TextureCube:
-                    empty_texture = self.getResourceData('empty')
-                    texture_datas['texture_positive_x'] = self.getResourceData(
-                        texture_datas['texture_positive_x']) or empty_texture
-                    texture_datas['texture_negative_x'] = self.getResourceData(
-                        texture_datas['texture_negative_x']) or empty_texture
-                    texture_datas['texture_positive_y'] = self.getResourceData(
-                        texture_datas['texture_positive_y']) or empty_texture
-                    texture_datas['texture_negative_y'] = self.getResourceData(
-                        texture_datas['texture_negative_y']) or empty_texture
-                    texture_datas['texture_positive_z'] = self.getResourceData(
-                        texture_datas['texture_positive_z']) or empty_texture
-                    texture_datas['texture_negative_z'] = self.getResourceData(
-                        texture_datas['texture_negative_z']) or empty_texture
-
-                texture = CreateTexture(name=resource.name, **texture_datas)
-                resource.set_data(texture)
+            if texture_datas and self.finalize_resource(resource, texture_datas):
                 return True
         logger.error('%s failed to load %s' % (self.name, resource_name))
         return False
 
+    def load_resource_async(self, resource):
+        meta_data = resource.meta_data
+        if self.is_new_external_data(meta_data, meta_data.source_filepath):
+            # The conversion needs OpenGL.
+            self.load_resource(resource.name)
+        else:
+            ResourceLoader.load_resource_async(self, resource)
+
+    def load_procedural_texture_datas(self, resource, procedural_texture):
+        filePath = resource.meta_data.resource_filepath
+        if procedural_texture.cache_to_disk and os.path.exists(filePath) and is_texture_file(filePath):
+            texture_datas = load_texture_file(filePath)
+            if texture_datas.get('procedural_version') == procedural_texture.version:
+                texture_datas['texture_type'] = self.texture_types[texture_datas['texture_type']]
+                return texture_datas
+
+        logger.info("Generate the procedural texture : %s" % resource.name)
+        texture_datas = procedural_texture.generate()
+        if procedural_texture.cache_to_disk:
+            save_data = dict(texture_datas)
+            save_data['procedural_version'] = procedural_texture.version
+            self.save_resource_data(resource, save_data)
+        return texture_datas
+
+    def load_resource_data(self, resource):
+        filePath = ''
+        if resource:
+            procedural_texture = procedural_textures.get(resource.name)
+            if procedural_texture is not None:
+                try:
+                    return self.load_procedural_texture_datas(resource, procedural_texture)
+                except:
+                    logger.error(traceback.format_exc())
+                    return None
+
+            filePath = resource.meta_data.resource_filepath
+            try:
+                if os.path.exists(filePath):
+                    if is_texture_file(filePath):
+                        texture_datas = load_texture_file(filePath)
+                        texture_datas['texture_type'] = self.texture_types[texture_datas['texture_type']]
+                    else:
+                        # convert the old pickled texture file to the binary texture file.
+                        texture_datas = ResourceLoader.load_resource_data(self, resource)
+                        if texture_datas:
+                            logger.info("Convert the old texture file : %s" % filePath)
+                            self.save_resource_data(resource, texture_datas, resource.meta_data.source_filepath)
+
+                    if texture_datas and texture_datas.get('texture_type') == TextureCube:
+                        self.load_cube_face_datas(texture_datas)
+                    return texture_datas
+            except:
+                logger.error(traceback.format_exc())
+        logger.error("file open error : %s" % filePath)
+        return None
+
+    def save_data_to_file(self, save_filepath, save_data):
+        logger.info("Save : %s" % save_filepath)
+        try:
+            min_filter = save_data.get('min_filter', GL_LINEAR_MIPMAP_LINEAR)
+            generate_mipmap = min_filter in (GL_LINEAR_MIPMAP_LINEAR, GL_LINEAR_MIPMAP_NEAREST,
+                                             GL_NEAREST_MIPMAP_LINEAR, GL_NEAREST_MIPMAP_NEAREST)
+            compression = get_compression(save_data.get('internal_format'))
+            if compression and save_data.get('data') is not None and save_data.get('mipmap_datas') is None:
+                # the image data is read back from the compressed texture, so compress it again.
+                save_data = compress_texture_datas(save_data, compression, generate_mipmap)
+            save_texture_file(save_filepath, save_data, generate_mipmap)
+            return True
+        except:
+            logger.error(traceback.format_exc())
+        return False
+
+    def get_texture_type(self, resource):
+        """
+        :return: the texture type in the header of the texture file without loading the image data, or None.
+        """
+        filePath = resource.meta_data.resource_filepath
+        try:
+            if os.path.exists(filePath) and is_texture_file(filePath):
+                return self.texture_types.get(load_texture_file_header(filePath).get('texture_type'))
+        except:
+            # it is reported by the synchronous loading.
+            pass
+        return None
+
+    def get_placeholder_data(self, resource):
+        # The placeholder is the 2d texture, so the other texture types are loaded synchronously.
+        # Otherwise the target of the texture and the sampler type of the shader mismatch until loaded.
+        # The procedural textures are the default textures of the samplers, ex) default_cube, default_3d,
+        # and they are generated synchronously regardless of the texture type of the cached file.
+        if resource.name in procedural_textures:
+            return None
+        elif resource.name != 'empty' and self.get_texture_type(resource) is Texture2D:
+            return self.getResourceData('empty', wait=True)
+        return None
+
+    def load_cube_face_datas(self, texture_datas):
+        """
+        Load the image levels of the faces from the texture files of the face textures into the face_datas,
+        so the cube texture is created without waiting and reading back the face textures.
+        It doesn't use OpenGL, so it runs on the thread of AsyncResourceLoader.
+        """
+        face_datas = texture_datas.setdefault('face_datas', {})
+        face_format = None
+        for face in TextureCube.faces:
+            face_resource = self.getResource(texture_datas.get(face) or '', noWarn=True)
+            if face_resource is None or face in face_datas:
+                continue
+
+            filePath = face_resource.meta_data.resource_filepath
+            if not os.path.exists(filePath) or not is_texture_file(filePath):
+                continue
+
+            face_texture_datas = load_texture_file(filePath)
+            if face_texture_datas.get('data') is None:
+                continue
+
+            # the format of the cube texture follows the face textures, they could be converted again.
+            format_datas = {key: face_texture_datas.get(key) for key in ('image_mode', 'width', 'height',
+                                                                         'internal_format', 'texture_format',
+                                                                         'data_type')}
+            if face_format is None:
+                face_format = format_datas
+                texture_datas.update(face_format)
+            elif format_datas != face_format:
+                logger.warn("%s has the different size or format from the other faces." % face_resource.name)
+                continue
+            face_datas[face] = [face_texture_datas['data'], ] + list(face_texture_datas.get('mipmap_datas', []))
+
+    def finalize_resource(self, resource, texture_datas):
+        if texture_datas.get('texture_type') == TextureCube:
+            face_datas = texture_datas.get('face_datas') or {}
+            for face in TextureCube.faces:
+                face_name = texture_datas.get(face)
+                if face not in face_datas and isinstance(face_name, str):
+                    # the face is copied from the face texture on the gpu.
+                    texture_datas[face] = self.getResourceData(face_name, wait=True) or \
+                                          self.getResourceData('empty', wait=True)
+                    if not texture_datas.get('width'):
+                        # no face is loaded from the texture files.
+                        face_texture = texture_datas[face]
+                        texture_datas.update(image_mode=face_texture.image_mode,
+                                             width=face_texture.width,
+                                             height=face_texture.height,
+                                             internal_format=face_texture.internal_format,
+                                             texture_format=face_texture.texture_format,
+                                             data_type=face_texture.data_type)
+
+        texture = CreateTexture(name=resource.name, **texture_datas)
+        resource.set_data(texture)
+        return True
+
     def generate_cube_textures(self):
         cube_faces = ('right', 'left', 'top', 'bottom', 'back', 'front')
         cube_texutre_map = dict()  # { cube_name : { face : source_filepath } }
@@ -878,7 +1193,7 @@ class TextureLoader(ResourceLoader):
 
         for cube_texture_name in cube_texutre_map:
             cube_faces = cube_texutre_map[cube_texture_name]
-            if len(cube_faces) == 6:
+            if len(cube_faces) == 6 and cube_texture_name not in procedural_textures:
                 isCreateCube = any([cube_face in self.new_texture_list for cube_face in cube_faces])
                 cube_resource = self.getResource(cube_texture_name, noWarn=True)
                 if cube_resource is None:
@@ -886,75 +1201,71 @@ class TextureLoader(ResourceLoader):
                     isCreateCube = True
 
                 if isCreateCube:
-                    empty_texture = self.getResourceData('empty')
-                    texture_right = cube_faces['right'].get_data() or empty_texture
-                    texture_left = cube_faces['left'].get_data() or empty_texture
-                    texture_top = cube_faces['top'].get_data() or empty_texture
-                    texture_bottom = cube_faces['bottom'].get_data() or empty_texture
-                    texture_back = cube_faces['back'].get_data() or empty_texture
-                    texture_front = cube_faces['front'].get_data() or empty_texture
-
-                    cube_texture_datas = copy.copy(texture_front.__dict__)
-                    cube_texture_datas['name'] = cube_texture_name
-                    cube_texture_datas['texture_type'] = TextureCube
-                    cube_texture_datas['texture_positive_x'] = texture_right
-                    cube_texture_datas['texture_negative_x'] = texture_left
-                    cube_texture_datas['texture_positive_y'] = texture_top
-                    cube_texture_datas['texture_negative_y'] = texture_bottom
-                    cube_texture_datas['texture_positive_z'] = texture_front
-                    cube_texture_datas['texture_negative_z'] = texture_back
-
-                    cube_texture = CreateTexture(**cube_texture_datas)
-                    cube_resource.set_data(cube_texture)
-                    cube_texture_datas = cube_texture.get_save_data()
+                    # the cube texture is created from the texture files of the faces.
+                    cube_texture_datas = dict(
+                        texture_type=TextureCube,
+                        texture_positive_x=cube_faces['right'].name,
+                        texture_negative_x=cube_faces['left'].name,
+                        texture_positive_y=cube_faces['top'].name,
+                        texture_negative_y=cube_faces['bottom'].name,
+                        texture_positive_z=cube_faces['front'].name,
+                        texture_negative_z=cube_faces['back'].name
+                    )
+                    self.load_cube_face_datas(cube_texture_datas)
+                    self.finalize_resource(cube_resource, cube_texture_datas)
+                    cube_texture_datas = cube_resource.data.get_save_data(get_image_data=False)
                     self.save_resource_data(cube_resource, cube_texture_datas, '')
         self.new_texture_list = []
 
     @staticmethod
     def create_texture_from_file(texture_name, source_filepath):
-        if os.path.exists(source_filepath):
-            image = Image.open(source_filepath)
-            width, height = image.size
-
-            # check size is power of two.
-            use_power_of_2 = False
-            if use_power_of_2:
-                width2 = (2 ** math.ceil(math.log2(width))) if 4 < width else 4
-                height2 = (2 ** math.ceil(math.log2(height))) if 4 < width else 4
-                if width != width2 or height != height2:
-                    logger.info('Image Resized (%s) -> (%s) : %s' % ((width, height), (width2, height2), source_filepath))
-                    image = image.resize((width2, height2), Image.ANTIALIAS)
-                    width, height = width2, height2
-
-            if image.mode == 'L' or image.mode == 'LA':
-                rgbimg = Image.new("RGBA", image.size)
-                rgbimg.paste(image)
-                image = rgbimg
-                logger.info('Convert Grayscale image to RGB : %s' % source_filepath)
-
-            data = image.tobytes("raw", image.mode, 0, -1)
-
-            texture_datas = dict(
-                texture_type=Texture2D,
-                image_mode=image.mode,
-                width=width,
-                height=height,
-                data=data
-            )
+        texture_datas = TextureLoader.load_texture_datas_from_file(source_filepath)
+        if texture_datas:
             return CreateTexture(name=texture_name, **texture_datas)
         return None
 
-    def convert_resource(self, resource, source_filepath):
+    @staticmethod
+    def load_texture_datas_from_file(source_filepath):
+        if os.path.exists(source_filepath):
+            if os.path.splitext(source_filepath)[1].lower() == TextureLoader.externalFileExt['DXT']:
+                texture_datas = loadDDS(source_filepath)
+                if texture_datas:
+                    texture_datas['texture_type'] = Texture2D
+                return texture_datas
+
+            texture_datas = loadImage(source_filepath)
+            texture_datas['texture_type'] = Texture2D
+            return texture_datas
+        return None
+
+    @staticmethod
+    def load_source_data(resource_name, source_filepath, resource_path):
+        texture_datas = TextureLoader.load_texture_datas_from_file(source_filepath)
+        if TextureLoader.USE_TEXTURE_COMPRESSION and texture_datas and 'mipmap_datas' not in texture_datas and \
+                texture_datas['image_mode'] in ('RGB', 'RGBA'):
+            compression = select_compression(resource_name, texture_datas['image_mode'], texture_datas['data'])
+            texture_datas = compress_texture_datas(texture_datas, compression)
+        return texture_datas
+
+    def convert_resource(self, resource, source_filepath, source_data=None):
         try:
             logger.info("Convert Resource : %s" % source_filepath)
             if resource not in self.new_texture_list:
                 self.new_texture_list.append(resource)
 
-            texture = self.create_texture_from_file(resource.name, source_filepath)
-            if texture:
+            if source_data is None:
+                source_data = self.load_source_data(resource.name, source_filepath, self.resource_path)
+
+            if source_data:
+                texture = CreateTexture(name=resource.name, **source_data)
                 resource.set_data(texture)
-                texture_datas = texture.get_save_data()
+                # save the source image instead of reading back the texture.
+                texture_datas = texture.get_save_data(get_image_data=False)
+                texture_datas['data'] = source_data['data']
+                if 'mipmap_datas' in source_data:
+                    texture_datas['mipmap_datas'] = source_data['mipmap_datas']
                 self.save_resource_data(resource, texture_datas, source_filepath)
+                return
         except:
             logger.error(traceback.format_exc())
         logger.info("Failed to convert resource : %s" % source_filepath)
@@ -965,13 +1276,14 @@ class TextureLoader(ResourceLoader):
 # -----------------------#
 class MeshLoader(ResourceLoader):
     name = "MeshLoader"
-    resource_version = 0
+    resource_version = 1
     resource_dir_name = 'Meshes'
     resource_type_name = 'Mesh'
     fileExt = '.mesh'
     externalFileExt = dict(WaveFront='.obj', Collada='.dae')
     external_dir_names = [os.path.join('Externals', 'Meshes'), ]
     USE_FILE_COMPRESS_TO_SAVE = True
+    USE_CONVERT_PROCESS = True
 
     def initialize(self):
         # load and regist resource
@@ -982,6 +1294,35 @@ class MeshLoader(ResourceLoader):
         self.create_resource("Quad", Quad())
         self.create_resource("Cube", Cube())
 
+    def load_resource_data(self, resource):
+        filePath = ''
+        if resource:
+            filePath = resource.meta_data.resource_filepath
+            try:
+                if os.path.exists(filePath):
+                    if is_mesh_file(filePath):
+                        return load_mesh_file(filePath)
+
+                    # convert the old pickled mesh file to the binary mesh file.
+                    load_data = ResourceLoader.load_resource_data(self, resource)
+                    if load_data:
+                        logger.info("Convert the old mesh file : %s" % filePath)
+                        self.save_resource_data(resource, load_data, resource.meta_data.source_filepath)
+                    return load_data
+            except:
+                logger.error(traceback.format_exc())
+        logger.error("file open error : %s" % filePath)
+        return None
+
+    def save_data_to_file(self, save_filepath, save_data):
+        logger.info("Save : %s" % save_filepath)
+        try:
+            save_mesh_file(save_filepath, save_data)
+            return True
+        except:
+            logger.error(traceback.format_exc())
+        return False
+
     def load_resource(self, resource_name):
         resource = self.getResource(resource_name)
         if resource:
@@ -993,17 +1334,22 @@ class MeshLoader(ResourceLoader):
         logger.error('%s failed to load %s' % (self.name, resource_name))
         return False
 
-    def convert_resource(self, resoure, source_filepath):
-        logger.info("Convert Resource : %s" % source_filepath)
+    @staticmethod
+    def load_source_data(resource_name, source_filepath, resource_path):
         file_ext = os.path.splitext(source_filepath)[1]
-        if file_ext == self.externalFileExt.get('WaveFront'):
+        if file_ext == MeshLoader.externalFileExt.get('WaveFront'):
             mesh = OBJ(source_filepath, 1, True)
-            mesh_data = mesh.get_mesh_data()
-        elif file_ext == self.externalFileExt.get('Collada'):
+            return mesh.get_mesh_data()
+        elif file_ext == MeshLoader.externalFileExt.get('Collada'):
             mesh = Collada(source_filepath)
-            mesh_data = mesh.get_mesh_data()
-        else:
-            return
+            return mesh.get_mesh_data()
+        return None
+
+    def convert_resource(self, resoure, source_filepath, source_data=None):
+        logger.info("Convert Resource : %s" % source_filepath)
+        if source_data is None:
+            source_data = self.load_source_data(resoure.name, source_filepath, self.resource_path)
+        mesh_data = source_data
 
         if mesh_data:
             # create mesh
@@ -1118,18 +1464,24 @@ class FontLoader(ResourceLoader):
     fileExt = '.font'
     external_dir_names = [os.path.join('Externals', 'Fonts'), ]
     externalFileExt = dict(TTF='.ttf', OTF='.otf')
+    USE_CONVERT_PROCESS = True
 
     language_infos = dict(
         ascii=('Basic Latin', 0x20, 0x7F),  # 32 ~ 127
         korean=('Hangul Syllables', 0xAC00, 0xD7AF),  # 44032 ~ 55215
     )
 
-    def check_font_data(self, font_datas, resoure, source_filepath):
-        for language in self.language_infos:
+    @staticmethod
+    def generate_font_datas(font_datas, resource_name, source_filepath, resource_path):
+        """
+        :return: whether the font datas of the new languages are generated.
+        """
+        generated = False
+        for language in FontLoader.language_infos:
             if language not in font_datas:
-                unicode_name, range_min, range_max = self.language_infos[language]
+                unicode_name, range_min, range_max = FontLoader.language_infos[language]
                 font_data = generate_font_data(
-                    resource_name=resoure.name,
+                    resource_name=resource_name,
                     distance_field_font=False,
                     anti_aliasing=True,
                     font_size=20,
@@ -1138,17 +1490,28 @@ class FontLoader(ResourceLoader):
                     range_min=range_min,
                     range_max=range_max,
                     source_filepath=source_filepath,
-                    preview_path=self.resource_path
+                    preview_path=resource_path
                 )
                 font_datas[language] = font_data
+                generated = True
+        return generated
+
+    @staticmethod
+    def load_source_data(resource_name, source_filepath, resource_path):
+        font_datas = {}
+        FontLoader.generate_font_datas(font_datas, resource_name, source_filepath, resource_path)
+        return font_datas
+
+    def check_font_data(self, font_datas, resoure, source_filepath):
+        self.generate_font_datas(font_datas, resoure.name, source_filepath, self.resource_path)
 
         if font_datas:
             self.save_resource_data(resoure, font_datas, source_filepath)
         return font_datas
 
-    def convert_resource(self, resoure, source_filepath):
+    def convert_resource(self, resoure, source_filepath, source_data=None):
         logger.info("Convert Resource : %s" % source_filepath)
-        font_datas = {}
+        font_datas = source_data or {}
         self.check_font_data(font_datas, resoure, source_filepath)
 
     def load_resource(self, resource_name):
@@ -1213,6 +1576,11 @@ class ResourceManager(Singleton):
         self.sceneLoader = None
         self.scriptLoader = None
         self.modelLoader = None
+        # The worker processes and threads to load the external source files while initializing.
+        self.executor = None
+        self.thread_executor = None
+        self.async_loader = AsyncResourceLoader()
+        self.material_compile_queue = MaterialCompileQueue.instance()
 
     def regist_loader(self, resource_loader_class):
         resource_loader = resource_loader_class(self.core_manager, self.root_path)
@@ -1226,6 +1594,12 @@ class ResourceManager(Singleton):
         self.root_path = root_path or self.PathResources
         check_directory_and_mkdir(self.root_path)
 
+        # shared by all projects, the program binaries depend on the driver not on the project.
+        ProgramBinaryCache.instance().initialize(
+            os.path.join(self.PathResources, 'Caches', 'ProgramBinaries'),
+            core_manager.config.getValue('Resource', 'program_binary_cache_size_mb', 256))
+        self.material_compile_queue.initialize(core_manager.config.getValue('Resource', 'parallel_shader_compile', 1))
+
         # Be careful with the initialization order.
         self.fontLoader = self.regist_loader(FontLoader)
         self.textureLoader = self.regist_loader(TextureLoader)
@@ -1237,14 +1611,40 @@ class ResourceManager(Singleton):
         self.scriptLoader = self.regist_loader(ScriptLoader)
         self.modelLoader = self.regist_loader(ModelLoader)
 
+        # 0 is the count of cpu. 1 is to convert on the main thread.
+        jobs = core_manager.config.getValue('Resource', 'jobs', 0)
+        jobs = jobs or os.cpu_count() or 1
+        if 1 < jobs:
+            # spawn, because the forked process would share the opengl context.
+            self.executor = ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn'))
+            self.thread_executor = ThreadPoolExecutor(max_workers=jobs)
+
         # initialize
         for resource_loader in self.resource_loaders:
             resource_loader.initialize()
 
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+        if self.thread_executor is not None:
+            self.thread_executor.shutdown()
+            self.thread_executor = None
+
+        logger.info(self.shader_loader.shader_code_cache.get_log())
+        logger.info(ProgramBinaryCache.instance().get_log())
+
+        if core_manager.config.getValue('Resource', 'async_load', 1):
+            self.async_loader.initialize(core_manager.config.getValue('Resource', 'async_finalize_budget_ms', 2.0))
+
         logger.info("Resource register done.")
 
     def close(self):
-        pass
+        self.async_loader.close()
+
+    def update(self):
+        self.async_loader.update()
+        self.material_compile_queue.update()
 
     def prepare_project_directory(self, new_project_dir):
         check_directory_and_mkdir(new_project_dir)
@@ -1314,6 +1714,15 @@ class ResourceManager(Singleton):
         if resource_loader:
             resource_loader.delete_resource(resource_name)
 
+    def request_load_resource(self, resource, wait=False):
+        resource_loader = self.find_resource_loader(resource.type_name)
+        if resource_loader:
+            if wait or not resource_loader.USE_ASYNC_LOAD or not self.async_loader.running:
+                resource.is_loading = False
+                resource_loader.load_resource(resource.name)
+            else:
+                resource_loader.load_resource_async(resource)
+
     def find_resource_loader(self, resource_type_name):
         for resource_loader in self.resource_loaders:
             if resource_loader.resource_type_name == resource_type_name:
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import pickle
+import traceback
+from collections import OrderedDict
+
+from Common import logger
+from Utilities import check_directory_and_mkdir
+
+
+class ShaderCodeCache:
+    """
+    Cache of the preprocessed shader codes keyed by the shader code, the macros and the shader version.
+    The entries are validated with the hashes of the included files, and kept in memory(LRU) and on disk.
+    The hash of the missing include file is None, so the entry is invalid when the file is created.
+    """
+    fileExt = '.shadercode'
+
+    def __init__(self, cache_path, max_count=256):
+        self.cache_path = cache_path
+        self.max_count = max_count
+        self.entries = OrderedDict()
+        self.file_hashes = {}  # { filepath : (modify_time, size, hash) }
+        self.hit_count = 0
+        self.disk_hit_count = 0
+        self.miss_count = 0
+
+    def get_file_hash(self, filepath):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+
+        file_hash = self.file_hashes.get(filepath)
+        if file_hash is not None and file_hash[0] == stat.st_mtime and file_hash[1] == stat.st_size:
+            return file_hash[2]
+
+        with open(filepath, 'rb') as f:
+            file_hash = hashlib.sha1(f.read()).hexdigest()
+        self.file_hashes[filepath] = (stat.st_mtime, stat.st_size, file_hash)
+        return file_hash
+
+    @staticmethod
+    def get_key(shader_code, shader_version, macros):
+        macros = sorted((str(macro), str(value)) for macro, value in (macros or {}).items())
+        text = "\n".join([shader_version, repr(macros), shader_code or ""])
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def get_filepath(self, key):
+        return os.path.join(self.cache_path, key + self.fileExt)
+
+    def is_valid_entry(self, entry):
+        for include_file, include_hash in entry['include_hashes'].items():
+            if self.get_file_hash(include_file) != include_hash:
+                return False
+        return True
+
+    def get(self, key):
+        """
+        :return: dict(shader_codes={ shader type name : code }, include_hashes={ include file : hash }) or None
+        """
+        entry = self.entries.get(key)
+        if entry is not None and self.is_valid_entry(entry):
+            self.entries.move_to_end(key)
+            self.hit_count += 1
+            return entry
+
+        filepath = self.get_filepath(key)
+        if os.path.exists(filepath):
+            try:
+                with open(filepath, 'rb') as f:
+                    entry = pickle.load(f)
+                if self.is_valid_entry(entry):
+                    self.add_entry(key, entry)
+                    self.disk_hit_count += 1
+                    return entry
+            except:
+                logger.error(traceback.format_exc())
+
+        self.miss_count += 1
+        return None
+
+    def set(self, key, shader_codes, include_files):
+        include_hashes = {include_file: self.get_file_hash(include_file) for include_file in include_files}
+        entry = dict(shader_codes=shader_codes, include_hashes=include_hashes)
+        self.add_entry(key, entry)
+
+        try:
+            check_directory_and_mkdir(self.cache_path)
+            with open(self.get_filepath(key), 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except:
+            logger.error(traceback.format_exc())
+
+    def add_entry(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while self.max_count < len(self.entries):
+            self.entries.popitem(last=False)
+
+    def get_log(self):
+        return "Shader code cache : hit %d, disk hit %d, miss %d" % (self.hit_count, self.disk_hit_count,
+                                                                     self.miss_count)
@@ -0,0 +1,251 @@
+"""
+Block compression of the textures with numpy.
+
+    BC1 ( DXT1 ) : opaque color, 8 bytes per 4x4 block.
+    BC3 ( DXT5 ) : color with alpha, 16 bytes per 4x4 block.
+    BC5 ( RGTC2 ) : two channels ( normal map ), 16 bytes per 4x4 block.
+
+BC2 ( DXT3 ) and BC4 ( RGTC1 ) are not encoded, but they are loaded from the dds files.
+
+All blocks of an image are encoded at once. The color endpoints are the extremes of the pixels projected on
+the principal axis of the block, and the one channel endpoints are the min and max of the block.
+This module doesn't use OpenGL, so the gl enums are the plain integers.
+"""
+
+import numpy as np
+
+from .TextureFile import IMAGE_CHANNELS, generate_mipmaps
+
+# { compression : gl internal format }
+COMPRESSED_FORMATS = dict(
+    BC1=0x83F0,  # GL_COMPRESSED_RGB_S3TC_DXT1_EXT
+    BC2=0x83F2,  # GL_COMPRESSED_RGBA_S3TC_DXT3_EXT
+    BC3=0x83F3,  # GL_COMPRESSED_RGBA_S3TC_DXT5_EXT
+    BC4=0x8DBB,  # GL_COMPRESSED_RED_RGTC1
+    BC5=0x8DBD,  # GL_COMPRESSED_RG_RGTC2
+)
+
+BLOCK_SIZES = dict(BC1=8, BC2=16, BC3=16, BC4=8, BC5=16)
+
+
+def get_compression(internal_format):
+    """
+    :return: the compression name of the gl internal format, or None.
+    """
+    for compression, compressed_format in COMPRESSED_FORMATS.items():
+        if compressed_format == internal_format:
+            return compression
+    return None
+
+
+def get_compressed_size(width, height, compression):
+    return ((width + 3) // 4) * ((height + 3) // 4) * BLOCK_SIZES[compression]
+
+
+def select_compression(resource_name, image_mode, data):
+    """
+    BC5 for the normal map, BC3 for the image which has the alpha, otherwise BC1.
+    """
+    if 'normal' in resource_name.split('.')[-1].lower():
+        return 'BC5'
+    elif image_mode == 'RGBA' and np.any(data.reshape(-1, 4)[:, 3] < 255):
+        return 'BC3'
+    return 'BC1'
+
+
+def get_blocks(image):
+    """
+    :param image: array of the shape (height, width, channels). The edge pixels are repeated to fill the blocks.
+    :return: float32 array of the shape (block count, 16, channels) in the row major order of the blocks.
+    """
+    height, width, channels = image.shape
+    block_height = (height + 3) // 4
+    block_width = (width + 3) // 4
+    rows = np.minimum(np.arange(block_height * 4), height - 1)
+    cols = np.minimum(np.arange(block_width * 4), width - 1)
+    image = image[rows][:, cols].astype(np.float32)
+    blocks = image.reshape(block_height, 4, block_width, 4, channels).transpose(0, 2, 1, 3, 4)
+    return blocks.reshape(-1, 16, channels)
+
+
+def pack_indices(indices, bits):
+    """
+    :param indices: integer array of the shape (block count, 16).
+    :return: uint8 array of the shape (block count, 2 * bits). The first pixel is in the lowest bits.
+    """
+    packed = np.zeros(len(indices), dtype=np.uint64)
+    for i in range(16):
+        packed |= indices[:, i].astype(np.uint64) << np.uint64(i * bits)
+    return packed.astype('<u8').view(np.uint8).reshape(-1, 8)[:, :2 * bits]
+
+
+def encode_rgb565(colors):
+    colors = np.clip(np.rint(colors), 0.0, 255.0)
+    r = np.rint(colors[:, 0] * 31.0 / 255.0).astype(np.uint16)
+    g = np.rint(colors[:, 1] * 63.0 / 255.0).astype(np.uint16)
+    b = np.rint(colors[:, 2] * 31.0 / 255.0).astype(np.uint16)
+    return (r << 11) | (g << 5) | b
+
+
+def decode_rgb565(values):
+    values = values.astype(np.uint32)
+    r = (values >> 11) & 31
+    g = (values >> 5) & 63
+    b = values & 31
+    return np.stack([(r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)], axis=-1).astype(np.float32)
+
+
+def compress_color_blocks(blocks):
+    """
+    :param blocks: float32 array of the shape (block count, 16, 3)
+    :return: uint8 array of the shape (block count, 8). The blocks are always in the 4 colors mode.
+    """
+    # principal axis by the power iteration.
+    mean = np.mean(blocks, axis=1, keepdims=True)
+    centered = blocks - mean
+    covariance = np.einsum('nki,nkj->nij', centered, centered)
+    axis = np.ones((len(blocks), 3), dtype=np.float32)
+    for i in range(8):
+        axis = np.einsum('nij,nj->ni', covariance, axis)
+        axis /= np.maximum(np.max(np.abs(axis), axis=1, keepdims=True), 1e-8)
+
+    projection = np.einsum('nki,ni->nk', centered, axis)
+    pixel_min = np.take_along_axis(blocks, np.argmin(projection, axis=1)[:, None, None], axis=1)[:, 0]
+    pixel_max = np.take_along_axis(blocks, np.argmax(projection, axis=1)[:, None, None], axis=1)[:, 0]
+
+    color0 = encode_rgb565(pixel_max)
+    color1 = encode_rgb565(pixel_min)
+    # color0 > color1 selects the 4 colors mode.
+    swap = color0 < color1
+    color0, color1 = np.where(swap, color1, color0), np.where(swap, color0, color1)
+
+    endpoint0 = decode_rgb565(color0)
+    endpoint1 = decode_rgb565(color1)
+    palette = np.stack([endpoint0,
+                        endpoint1,
+                        (endpoint0 * 2.0 + endpoint1) / 3.0,
+                        (endpoint0 + endpoint1 * 2.0) / 3.0], axis=1)
+    distances = np.sum((blocks[:, :, None, :] - palette[:, None, :, :]) ** 2, axis=-1)
+    indices = np.argmin(distances, axis=2)
+    # color0 == color1 is the 3 colors mode, and all pixels are the color0.
+    indices[color0 == color1] = 0
+
+    compressed = np.empty((len(blocks), 8), dtype=np.uint8)
+    compressed[:, 0:2] = color0.astype('<u2').view(np.uint8).reshape(-1, 2)
+    compressed[:, 2:4] = color1.astype('<u2').view(np.uint8).reshape(-1, 2)
+    compressed[:, 4:8] = pack_indices(indices, 2)
+    return compressed
+
+
+def compress_channel_blocks(blocks):
+    """
+    :param blocks: float32 array of the shape (block count, 16) of a channel.
+    :return: uint8 array of the shape (block count, 8). The blocks are in the 8 values mode.
+    """
+    value0 = np.clip(np.rint(np.max(blocks, axis=1)), 0, 255).astype(np.uint8)
+    value1 = np.clip(np.rint(np.min(blocks, axis=1)), 0, 255).astype(np.uint8)
+
+    endpoint0 = value0.astype(np.float32)[:, None]
+    endpoint1 = value1.astype(np.float32)[:, None]
+    # the codes 0, 1 are the endpoints, and the codes 2 ~ 7 are the interpolated values.
+    weights = np.array([0.0, 7.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0], dtype=np.float32) / 7.0
+    palette = endpoint0 * (1.0 - weights) + endpoint1 * weights
+    indices = np.argmin(np.abs(blocks[:, :, None] - palette[:, None, :]), axis=2)
+    # value0 == value1 is the 6 values mode, and all pixels are the value0.
+    indices[value0 == value1] = 0
+
+    compressed = np.empty((len(blocks), 8), dtype=np.uint8)
+    compressed[:, 0] = value0
+    compressed[:, 1] = value1
+    compressed[:, 2:8] = pack_indices(indices, 3)
+    return compressed
+
+
+def compress_image(data, width, height, channels, compression):
+    """
+    :param data: flat uint8 array of the image.
+    :return: flat uint8 array of the compressed blocks.
+    """
+    blocks = get_blocks(np.asarray(data, dtype=np.uint8).reshape(height, width, channels))
+    if compression == 'BC1':
+        compressed = compress_color_blocks(blocks[:, :, :3])
+    elif compression == 'BC3':
+        alpha = blocks[:, :, 3] if channels == 4 else np.full(blocks.shape[:2], 255.0, dtype=np.float32)
+        compressed = np.hstack([compress_channel_blocks(alpha), compress_color_blocks(blocks[:, :, :3])])
+    elif compression == 'BC5':
+        green = blocks[:, :, 1] if 1 < channels else blocks[:, :, 0]
+        compressed = np.hstack([compress_channel_blocks(blocks[:, :, 0]), compress_channel_blocks(green)])
+    else:
+        raise ValueError("Not supported compression : %s" % compression)
+    return compressed.reshape(-1)
+
+
+def compress_texture_datas(texture_datas, compression, generate_mipmap=True):
+    """
+    Generate the mip chain of the uncompressed image, and compress each level.
+    :param texture_datas: the texture datas which have the uncompressed data of the 2d image.
+    :return: the new texture datas. The data and mipmap_datas are the compressed levels.
+    """
+    width = texture_datas['width']
+    height = texture_datas['height']
+    channels = IMAGE_CHANNELS[texture_datas['image_mode']]
+    data = texture_datas['data']
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = np.frombuffer(data, dtype=np.uint8)
+    data = np.ascontiguousarray(data, dtype=np.uint8).reshape(-1)
+
+    levels = [data, ]
+    if generate_mipmap:
+        levels += generate_mipmaps(data, width, height, channels)
+
+    compressed_datas = []
+    for level, level_data in enumerate(levels):
+        compressed_datas.append(compress_image(level_data, max(1, width >> level), max(1, height >> level),
+                                               channels, compression))
+
+    texture_datas = dict(texture_datas)
+    texture_datas['internal_format'] = COMPRESSED_FORMATS[compression]
+    texture_datas['data'] = compressed_datas[0]
+    texture_datas['mipmap_datas'] = compressed_datas[1:]
+    return texture_datas
+
+
+def flip_compressed_blocks(data, width, height, compression):
+    """
+    Flip the compressed image vertically. It's exact when the height is a multiple of 4 or less than 4.
+    :param data: flat uint8 array of the compressed level.
+    """
+    block_width = (width + 3) // 4
+    block_height = (height + 3) // 4
+    block_size = BLOCK_SIZES[compression]
+    blocks = np.asarray(data, dtype=np.uint8).reshape(block_height, block_width, block_size)[::-1].copy()
+    blocks = blocks.reshape(-1, block_size)
+    row_count = min(4, height)
+    # the row order in a block, the valid rows are flipped.
+    rows = np.concatenate([np.arange(row_count)[::-1], np.arange(row_count, 4)])
+
+    def flip_indices(indices, bits):
+        packed = np.zeros(len(indices), dtype=np.uint64)
+        for i in range(2 * bits):
+            packed |= indices[:, i].astype(np.uint64) << np.uint64(i * 8)
+        row_bits = np.uint64(4 * bits)
+        row_mask = np.uint64((1 << (4 * bits)) - 1)
+        flipped = np.zeros(len(indices), dtype=np.uint64)
+        for row in range(4):
+            flipped |= ((packed >> (np.uint64(rows[row]) * row_bits)) & row_mask) << (np.uint64(row) * row_bits)
+        return flipped.astype('<u8').view(np.uint8).reshape(-1, 8)[:, :2 * bits]
+
+    if compression == 'BC1':
+        blocks[:, 4:8] = flip_indices(blocks[:, 4:8], 2)
+    elif compression == 'BC2':
+        blocks[:, 0:8] = flip_indices(blocks[:, 0:8], 4)
+        blocks[:, 12:16] = flip_indices(blocks[:, 12:16], 2)
+    elif compression == 'BC3':
+        blocks[:, 2:8] = flip_indices(blocks[:, 2:8], 3)
+        blocks[:, 12:16] = flip_indices(blocks[:, 12:16], 2)
+    elif compression == 'BC4':
+        blocks[:, 2:8] = flip_indices(blocks[:, 2:8], 3)
+    elif compression == 'BC5':
+        blocks[:, 2:8] = flip_indices(blocks[:, 2:8], 3)
+        blocks[:, 10:16] = flip_indices(blocks[:, 10:16], 3)
+    return blocks.reshape(-1)
@@ -0,0 +1,195 @@
+"""
+Binary texture file.
+
+    header : magic(8 bytes), version(uint32), width(uint32), height(uint32), depth(uint32), mip_count(uint32),
+             header_data_size(uint32)
+    header_data : pickled dict of the texture description and the mip descriptions (width, height, offset, size).
+    blocks : the image data of each mip level from the level 0, aligned 16 bytes.
+
+The mip chain is generated on the cpu when the file is saved, so the memory mapped levels are uploaded as they are
+and the texture doesn't need glGenerateMipmap at load time. This module doesn't use OpenGL,
+so the gl enums are saved as the plain integers.
+"""
+
+import os
+import pickle
+import struct
+
+import numpy as np
+
+TEXTURE_FILE_MAGIC = b'PYETEX\x00\x00'
+TEXTURE_FILE_VERSION = 1
+TEXTURE_FILE_HEADER = struct.Struct('<8sIIIIII')
+TEXTURE_FILE_ALIGNMENT = 16
+
+# { gl data type : numpy dtype }
+DATA_TYPES = {
+    0x1400: np.int8,  # GL_BYTE
+    0x1401: np.uint8,  # GL_UNSIGNED_BYTE
+    0x1402: np.int16,  # GL_SHORT
+    0x1403: np.uint16,  # GL_UNSIGNED_SHORT
+    0x1404: np.int32,  # GL_INT
+    0x1405: np.uint32,  # GL_UNSIGNED_INT
+    0x1406: np.float32,  # GL_FLOAT
+    0x140B: np.float16,  # GL_HALF_FLOAT
+}
+
+# { image mode : channel count }
+IMAGE_CHANNELS = dict(R=1, RG=2, RGB=3, RGBA=4)
+
+
+def is_texture_file(filepath):
+    with open(filepath, 'rb') as f:
+        return f.read(len(TEXTURE_FILE_MAGIC)) == TEXTURE_FILE_MAGIC
+
+
+def align_offset(offset):
+    return (offset + TEXTURE_FILE_ALIGNMENT - 1) // TEXTURE_FILE_ALIGNMENT * TEXTURE_FILE_ALIGNMENT
+
+
+def get_mip_count(width, height):
+    return max(width, height, 1).bit_length()
+
+
+def get_image_array(texture_data):
+    """
+    :return: the image data as a flat numpy array of the data type of the texture, or None.
+    """
+    data = texture_data.get('data')
+    if data is None:
+        return None
+    dtype = np.dtype(DATA_TYPES.get(int(texture_data.get('data_type', 0x1401)), np.uint8))
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return np.frombuffer(data, dtype=dtype)
+    return np.ascontiguousarray(data, dtype=dtype).reshape(-1)
+
+
+def downsample(image):
+    """
+    2x2 box filter. The odd row and column of the image are dropped, as the size of the next mip level is floor(n/2).
+    :param image: float32 array of the shape (height, width, channels)
+    """
+    height, width = image.shape[:2]
+    rows = np.arange(max(1, height // 2)) * 2
+    cols = np.arange(max(1, width // 2)) * 2
+    rows_next = np.minimum(rows + 1, height - 1)
+    cols_next = np.minimum(cols + 1, width - 1)
+    return (image[rows][:, cols] + image[rows][:, cols_next] +
+            image[rows_next][:, cols] + image[rows_next][:, cols_next]) * 0.25
+
+
+def generate_mipmaps(data, width, height, channels):
+    """
+    :param data: flat numpy array of the level 0.
+    :return: the flat numpy arrays of the mip levels from the level 1 to the 1x1 level.
+    """
+    dtype = data.dtype
+    image = data.reshape(height, width, channels).astype(np.float32)
+    mipmaps = []
+    for level in range(1, get_mip_count(width, height)):
+        # filter from the unquantized previous level.
+        image = downsample(image)
+        if np.issubdtype(dtype, np.integer):
+            type_info = np.iinfo(dtype)
+            mipmap = np.clip(np.rint(image), type_info.min, type_info.max).astype(dtype)
+        else:
+            mipmap = image.astype(dtype)
+        mipmaps.append(mipmap.reshape(-1))
+    return mipmaps
+
+
+def save_texture_file(filepath, texture_data, generate_mipmap=True):
+    """
+    :param texture_data: the save data of the texture. The texture_type is saved as the class name.
+    :param generate_mipmap: generate the mip chain of the 2d texture, if the texture_data has no mipmap_datas.
+    """
+    header_data = {}
+    for key, value in texture_data.items():
+        if key in ('data', 'mipmap_datas'):
+            continue
+        elif key == 'texture_type' and not isinstance(value, str):
+            value = value.__name__
+        elif isinstance(value, int) and type(value) is not bool:
+            value = int(value)
+        header_data[key] = value
+
+    width = int(texture_data.get('width', 0))
+    height = int(texture_data.get('height', 0))
+    depth = max(1, int(texture_data.get('depth', 1)))
+
+    levels = []
+    data = get_image_array(texture_data)
+    if data is not None:
+        levels.append(data)
+        channels = IMAGE_CHANNELS.get(texture_data.get('image_mode'), 4)
+        if texture_data.get('mipmap_datas') is not None:
+            # the mip chain is already generated. ex) the compressed texture
+            for mipmap_data in texture_data['mipmap_datas']:
+                levels.append(np.ascontiguousarray(mipmap_data).reshape(-1))
+        elif generate_mipmap and depth == 1 and data.size == width * height * channels:
+            levels += generate_mipmaps(data, width, height, channels)
+
+    mip_descs = []
+    for level, level_data in enumerate(levels):
+        mip_descs.append(dict(width=max(1, width >> level), height=max(1, height >> level), offset=0,
+                              size=level_data.nbytes))
+    header_data['mip_descs'] = mip_descs
+
+    # The offsets are in the header data, so compute them with the size of the header data until it is fixed.
+    header_size = 0
+    while True:
+        offset = align_offset(TEXTURE_FILE_HEADER.size + header_size)
+        for mip_desc in mip_descs:
+            mip_desc['offset'] = offset
+            offset = align_offset(offset + mip_desc['size'])
+        header_bytes = pickle.dumps(header_data, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(header_bytes) <= header_size:
+            break
+        header_size = len(header_bytes)
+
+    # The loaded texture may still memory map the file, so the file is written to the temp file and replaced.
+    # The mapped data of the old file stays valid and the file is never seen half written.
+    temp_filepath = filepath + '.tmp'
+    try:
+        with open(temp_filepath, 'wb') as f:
+            f.write(TEXTURE_FILE_HEADER.pack(TEXTURE_FILE_MAGIC, TEXTURE_FILE_VERSION, width, height, depth,
+                                             len(levels), header_size))
+            f.write(header_bytes.ljust(header_size, b'\x00'))
+            for mip_desc, level_data in zip(mip_descs, levels):
+                f.seek(mip_desc['offset'])
+                f.write(level_data.tobytes())
+        os.replace(temp_filepath, filepath)
+    except BaseException:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+        raise
+
+
+def load_texture_file_header(filepath):
+    """
+    :return: texture_data without the image data. The mip_descs are the offsets and the sizes of the levels.
+    """
+    with open(filepath, 'rb') as f:
+        magic, version, width, height, depth, mip_count, header_size = \
+            TEXTURE_FILE_HEADER.unpack(f.read(TEXTURE_FILE_HEADER.size))
+        if magic != TEXTURE_FILE_MAGIC or version != TEXTURE_FILE_VERSION:
+            raise BaseException("Not supported texture file version. %s : %d" % (filepath, version))
+        return pickle.loads(f.read(header_size))
+
+
+def load_texture_file(filepath):
+    """
+    :return: texture_data. The data is the level 0 and the mipmap_datas are the next levels,
+        they are read-only memory mapped arrays. The texture_type is the class name.
+    """
+    texture_data = load_texture_file_header(filepath)
+    mip_descs = texture_data.pop('mip_descs')
+    if mip_descs:
+        dtype = DATA_TYPES.get(texture_data.get('data_type', 0x1401), np.uint8)
+        file_data = np.memmap(filepath, dtype=np.uint8, mode='r')
+        levels = [file_data[mip_desc['offset']:mip_desc['offset'] + mip_desc['size']].view(dtype)
+                  for mip_desc in mip_descs]
+        texture_data['data'] = levels[0]
+        if 1 < len(levels):
+            texture_data['mipmap_datas'] = levels[1:]
+    return texture_data
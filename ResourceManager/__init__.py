@@ -2,6 +2,7 @@ import os
 
 from .ColladaLoader import Collada
 from .DDSLoader import loadDDS
+from .ImageLoader import loadImage
 from .ObjLoader import OBJ
 from .FontLoader import generate_font_data
 from .ResourceManager import ResourceManager
@@ -0,0 +1,248 @@
+import numpy as np
+
+
+def get_frustum_planes(view_projection):
+    """
+    Extract 6 planes from the row major view projection matrix. ( clip_pos = world_pos * view_projection )
+    :return: (6, 4) array of plane. The normals of the planes are directed to the inside of the frustum.
+    """
+    m = view_projection
+    planes = np.array([
+        m[:, 3] + m[:, 0],  # left
+        m[:, 3] - m[:, 0],  # right
+        m[:, 3] + m[:, 1],  # bottom
+        m[:, 3] - m[:, 1],  # top
+        m[:, 3] + m[:, 2],  # near
+        m[:, 3] - m[:, 2],  # far
+    ], dtype=np.float32)
+    planes /= np.linalg.norm(planes[:, 0:3], axis=1)[:, np.newaxis]
+    return planes
+
+
+def transform_aabb(bound_min, bound_max, matrices):
+    """
+    Transform the local bounding boxes to the world space bounding boxes.
+    :param bound_min, bound_max: (N, 3) array
+    :param matrices: (N, 4, 4) array of the row major world matrix.
+    :return: world_bound_min, world_bound_max
+    """
+    center = (bound_min + bound_max) * 0.5
+    extent = (bound_max - bound_min) * 0.5
+    world_center = np.einsum('ni,nij->nj', center, matrices[:, 0:3, 0:3]) + matrices[:, 3, 0:3]
+    world_extent = np.einsum('ni,nij->nj', extent, np.abs(matrices[:, 0:3, 0:3]))
+    return world_center - world_extent, world_center + world_extent
+
+
+def frustum_test(bound_min, bound_max, planes):
+    """
+    :param bound_min, bound_max: (N, 3) array of bounding boxes.
+    :param planes: (6, 4) array of frustum planes.
+    :return: intersect - whether the boxes are touching the frustum, inside - whether the boxes are inside of the frustum.
+    """
+    normals = planes[:, 0:3]
+    positive = normals >= 0.0
+    # the most inner vertex and the most outer vertex of the box for each plane.
+    inner_vertex = np.where(positive, bound_max[:, np.newaxis, :], bound_min[:, np.newaxis, :])
+    outer_vertex = np.where(positive, bound_min[:, np.newaxis, :], bound_max[:, np.newaxis, :])
+    inner_distance = np.einsum('npi,pi->np', inner_vertex, normals) + planes[:, 3]
+    outer_distance = np.einsum('npi,pi->np', outer_vertex, normals) + planes[:, 3]
+    intersect = np.all(inner_distance >= 0.0, axis=1)
+    inside = np.all(outer_distance >= 0.0, axis=1)
+    return intersect, inside
+
+
+class BoundingVolumeHierarchy:
+    """
+    The bounding boxes of the items are built into a binary tree of nodes stored in flat arrays.
+    The tree is built once when the items are changed, and refitted when the bounding boxes are moved.
+    """
+    leaf_size = 4
+
+    def __init__(self):
+        self.item_count = 0
+        self.item_bound_min = np.zeros((0, 3), dtype=np.float32)
+        self.item_bound_max = np.zeros((0, 3), dtype=np.float32)
+        # items are sorted by leaf nodes.
+        self.item_order = np.zeros(0, dtype=np.int32)
+        self.item_leaf = np.zeros(0, dtype=np.int32)
+
+        self.node_bound_min = np.zeros((0, 3), dtype=np.float32)
+        self.node_bound_max = np.zeros((0, 3), dtype=np.float32)
+        self.node_left = np.zeros(0, dtype=np.int32)
+        self.node_right = np.zeros(0, dtype=np.int32)
+        self.node_parent = np.zeros(0, dtype=np.int32)
+        self.node_start = np.zeros(0, dtype=np.int32)
+        self.node_count = np.zeros(0, dtype=np.int32)
+        self.node_dirty = np.zeros(0, dtype=np.bool_)
+        # node indices of each depth
+        self.levels = []
+
+    def build(self, bound_min, bound_max):
+        self.item_count = len(bound_min)
+        self.item_bound_min = np.array(bound_min, dtype=np.float32).reshape(-1, 3)
+        self.item_bound_max = np.array(bound_max, dtype=np.float32).reshape(-1, 3)
+        self.item_order = np.arange(self.item_count, dtype=np.int32)
+        self.item_leaf = np.zeros(self.item_count, dtype=np.int32)
+
+        left = []
+        right = []
+        parent = []
+        start = []
+        count = []
+        depths = []
+        centers = (self.item_bound_min + self.item_bound_max) * 0.5
+
+        # split by the median of the longest axis.
+        stack = [(0, self.item_count, -1, 0)] if 0 < self.item_count else []
+        while stack:
+            node_start, node_count, node_parent, depth = stack.pop()
+            node_index = len(left)
+            left.append(-1)
+            right.append(-1)
+            parent.append(node_parent)
+            start.append(node_start)
+            count.append(node_count)
+            depths.append(depth)
+            if 0 <= node_parent:
+                if left[node_parent] < 0:
+                    left[node_parent] = node_index
+                else:
+                    right[node_parent] = node_index
+
+            if self.leaf_size < node_count:
+                items = self.item_order[node_start:node_start + node_count]
+                item_centers = centers[items]
+                axis = np.argmax(item_centers.max(axis=0) - item_centers.min(axis=0))
+                self.item_order[node_start:node_start + node_count] = items[np.argsort(item_centers[:, axis],
+                                                                                       kind='stable')]
+                half = node_count // 2
+                # push right first, so that the left child is created first.
+                stack.append((node_start + half, node_count - half, node_index, depth + 1))
+                stack.append((node_start, half, node_index, depth + 1))
+
+        node_count = len(left)
+        self.node_left = np.array(left, dtype=np.int32)
+        self.node_right = np.array(right, dtype=np.int32)
+        self.node_parent = np.array(parent, dtype=np.int32)
+        self.node_start = np.array(start, dtype=np.int32)
+        self.node_count = np.array(count, dtype=np.int32)
+        self.node_bound_min = np.zeros((node_count, 3), dtype=np.float32)
+        self.node_bound_max = np.zeros((node_count, 3), dtype=np.float32)
+        self.node_dirty = np.ones(node_count, dtype=np.bool_)
+
+        depths = np.array(depths, dtype=np.int32)
+        self.levels = [np.flatnonzero(depths == depth) for depth in range(depths.max() + 1)] if node_count else []
+
+        leaves = np.flatnonzero(self.node_left < 0)
+        for leaf in leaves:
+            self.item_leaf[self.item_order[self.node_start[leaf]:self.node_start[leaf] + self.node_count[leaf]]] = leaf
+
+        self.refit()
+
+    def update_items(self, item_indices, bound_min, bound_max):
+        """
+        Update the bounding boxes of the items and mark the leaf nodes to refit.
+        """
+        if len(item_indices) == 0:
+            return
+        self.item_bound_min[item_indices] = bound_min
+        self.item_bound_max[item_indices] = bound_max
+        self.node_dirty[self.item_leaf[item_indices]] = True
+
+    def refit(self):
+        """
+        Refit only the dirty nodes from the bottom level to the root.
+        """
+        for level in reversed(self.levels):
+            nodes = level[self.node_dirty[level]]
+            if len(nodes) == 0:
+                continue
+
+            is_leaf = self.node_left[nodes] < 0
+            leaves = nodes[is_leaf]
+            if len(leaves) > 0:
+                leaves = leaves[np.argsort(self.node_start[leaves])]
+                # reduce the item range of each leaf. [start, end) pairs, and the odd results are ignored.
+                ranges = np.empty(len(leaves) * 2, dtype=np.int32)
+                ranges[0::2] = self.node_start[leaves]
+                ranges[1::2] = self.node_start[leaves] + self.node_count[leaves]
+                items = np.append(self.item_order, self.item_order[0])
+                self.node_bound_min[leaves] = np.minimum.reduceat(self.item_bound_min[items], ranges, axis=0)[0::2]
+                self.node_bound_max[leaves] = np.maximum.reduceat(self.item_bound_max[items], ranges, axis=0)[0::2]
+
+            inners = nodes[np.logical_not(is_leaf)]
+            if len(inners) > 0:
+                left = self.node_left[inners]
+                right = self.node_right[inners]
+                self.node_bound_min[inners] = np.minimum(self.node_bound_min[left], self.node_bound_min[right])
+                self.node_bound_max[inners] = np.maximum(self.node_bound_max[left], self.node_bound_max[right])
+
+            self.node_dirty[nodes] = False
+            parents = self.node_parent[nodes]
+            self.node_dirty[parents[0 <= parents]] = True
+
+    def get_node_items(self, nodes):
+        # The items of a subtree are contiguous in item_order.
+        counts = self.node_count[nodes]
+        total_count = counts.sum()
+        if total_count == 0:
+            return np.zeros(0, dtype=np.int32)
+        offsets = np.repeat(self.node_start[nodes] - (np.cumsum(counts) - counts), counts)
+        return self.item_order[offsets + np.arange(total_count)]
+
+    def frustum_culling(self, planes):
+        """
+        Traverse the tree level by level, testing all nodes of the level at once.
+        :return: bool array of visible items.
+        """
+        visible = np.zeros(self.item_count, dtype=np.bool_)
+        if self.item_count == 0:
+            return visible
+
+        nodes = np.array([0, ], dtype=np.int32)
+        while len(nodes) > 0:
+            intersect, inside = frustum_test(self.node_bound_min[nodes], self.node_bound_max[nodes], planes)
+            # The whole subtree is visible if the node is inside of the frustum.
+            # Leaf nodes have no children to test, so its items are tested below.
+            is_leaf = self.node_left[nodes] < 0
+            visible[self.get_node_items(nodes[inside & np.logical_not(is_leaf)])] = True
+
+            items = self.get_node_items(nodes[intersect & is_leaf])
+            if len(items) > 0:
+                item_intersect, item_inside = frustum_test(self.item_bound_min[items], self.item_bound_max[items],
+                                                           planes)
+                visible[items[item_intersect]] = True
+
+            nodes = nodes[intersect & np.logical_not(inside) & np.logical_not(is_leaf)]
+            nodes = np.concatenate([self.node_left[nodes], self.node_right[nodes]])
+        return visible
+
+
+class FrustumCulling:
+    """
+    The visibility and the statistics of a culling view. ex) main camera, shadow
+    """
+    def __init__(self, name):
+        self.name = name
+        self.visible = np.zeros(0, dtype=np.bool_)
+        self.visible_count = 0
+        self.culled_count = 0
+
+    def update(self, bvh, view_projection, enable=True):
+        if enable:
+            self.visible = bvh.frustum_culling(get_frustum_planes(view_projection))
+        else:
+            self.visible = np.ones(bvh.item_count, dtype=np.bool_)
+        self.visible_count = int(np.count_nonzero(self.visible))
+        self.culled_count = bvh.item_count - self.visible_count
+
+    def cull_render_infos(self, render_infos, item_indices):
+        """
+        :param item_indices: the item index of each render info.
+        """
+        if len(render_infos) == 0 or len(self.visible) == 0:
+            return render_infos
+        return [render_infos[i] for i in np.flatnonzero(self.visible[item_indices])]
+
+    def get_log(self):
+        return "Culling %s : visible %d, culled %d" % (self.name, self.visible_count, self.culled_count)
@@ -220,6 +220,36 @@ def quaternion_to_matrix(quat, rotationMatrix):
     '''
 
 
+def quaternion_to_matrix_array(quaternions):
+    """
+    batch version of quaternion_to_matrix
+    :param quaternions: (..., 4) array of (w, x, y, z)
+    :return: (..., 4, 4) array of rotation matrix
+    """
+    qw, qx, qy, qz = [quaternions[..., i] for i in range(4)]
+    qxqx = qx * qx * 2.0
+    qxqy = qx * qy * 2.0
+    qxqz = qx * qz * 2.0
+    qxqw = qx * qw * 2.0
+    qyqy = qy * qy * 2.0
+    qyqz = qy * qz * 2.0
+    qyqw = qy * qw * 2.0
+    qzqw = qz * qw * 2.0
+    qzqz = qz * qz * 2.0
+    matrices = np.zeros(quaternions.shape[:-1] + (4, 4), dtype=np.float32)
+    matrices[..., 0, 0] = 1.0 - qyqy - qzqz
+    matrices[..., 0, 1] = qxqy + qzqw
+    matrices[..., 0, 2] = qxqz - qyqw
+    matrices[..., 1, 0] = qxqy - qzqw
+    matrices[..., 1, 1] = 1.0 - qxqx - qzqz
+    matrices[..., 1, 2] = qyqz + qxqw
+    matrices[..., 2, 0] = qxqz + qyqw
+    matrices[..., 2, 1] = qyqz - qxqw
+    matrices[..., 2, 2] = 1.0 - qxqx - qyqy
+    matrices[..., 3, 3] = 1.0
+    return matrices
+
+
 def lerp(vector1, vector2, t):
     return vector1 * (1.0 - t) + vector2 * t
 
@@ -244,6 +274,27 @@ def slerp(quaternion1, quaternion2, amount):
     return (num3 * quaternion1) + (num2 * quaternion2)
 
 
+def slerp_array(quaternions1, quaternions2, amounts):
+    """
+    batch version of slerp
+    :param quaternions1, quaternions2: (..., 4) array
+    :param amounts: (...) array
+    """
+    amounts = np.asarray(amounts)
+    cos_theta = np.sum(quaternions1 * quaternions2, axis=-1)
+    flip = cos_theta < 0.0
+    cos_theta = np.abs(cos_theta)
+    # use linear interpolation if the quaternions are very close.
+    is_linear = cos_theta > 0.999999
+    theta = np.arccos(np.minimum(cos_theta, 1.0))
+    sin_theta = np.sin(theta)
+    inv_sin_theta = 1.0 / np.where(is_linear, 1.0, sin_theta)
+    ratio1 = np.where(is_linear, 1.0 - amounts, np.sin((1.0 - amounts) * theta) * inv_sin_theta)
+    ratio2 = np.where(is_linear, amounts, np.sin(amounts * theta) * inv_sin_theta)
+    ratio2 = np.where(flip, -ratio2, ratio2)
+    return ratio1[..., np.newaxis] * quaternions1 + ratio2[..., np.newaxis] * quaternions2
+
+
 def setIdentityMatrix(M):
     M[...] = [[1.0, 0.0, 0.0, 0.0],
             [0.0, 1.0, 0.0, 0.0],
@@ -493,34 +544,45 @@ def convert_triangulate(polygon, vcount, stride=1):
 
 
 def compute_tangent(positions, texcoords, normals, indices):
-    tangents = np.array([0.0, 0.0, 0.0] * len(normals), dtype=np.float32).reshape(len(normals), 3)
-    # binormals = np.array([0.0, 0.0, 0.0] * len(normals), dtype=np.float32).reshape(len(normals), 3)
-
-    for i in range(0, len(indices), 3):
-        i1, i2, i3 = indices[i:i + 3]
-        deltaPos2 = positions[i2] - positions[i1]
-        deltaPos3 = positions[i3] - positions[i1]
-        deltaUV2 = texcoords[i2] - texcoords[i1]
-        deltaUV3 = texcoords[i3] - texcoords[i1]
-        r = (deltaUV2[0] * deltaUV3[1] - deltaUV2[1] * deltaUV3[0])
-        r = 1.0 / r if r != 0.0 else 0.0
-
-        tangent = (deltaPos2 * deltaUV3[1] - deltaPos3 * deltaUV2[1]) * r
-        tangent = normalize(tangent)
-        # binormal = (deltaPos3 * deltaUV2[0]   - deltaPos2 * deltaUV3[0]) * r
-        # binormal = normalize(binormal)
-
-        # invalid tangent
-        if all(x == 0.0 for x in tangent):
-            avg_normal = normalize(normals[i1] + normals[i2] + normals[i3])
-            tangent = np.cross(avg_normal, WORLD_UP)
-
-        tangents[indices[i]] = tangent
-        tangents[indices[i + 1]] = tangent
-        tangents[indices[i + 2]] = tangent
-
-        # binormals[indices[i]] = binormal
-        # binormals[indices[i+1]] = binormal
-        # binormals[indices[i+2]] = binormal
-    # return tangents, binormals
+    """
+    Compute the tangents of all triangles at once, and accumulate them to the vertices weighted by the triangle area.
+    The triangles of the degenerate uv use the tangent of cross(average normal, WORLD_UP).
+    """
+    positions = np.asarray(positions, dtype=np.float32)
+    texcoords = np.asarray(texcoords, dtype=np.float32)
+    normals = np.asarray(normals, dtype=np.float32)
+    triangles = np.asarray(indices, dtype=np.uint32).reshape(-1, 3)
+    tangents = np.zeros((len(normals), 3), dtype=np.float32)
+    if len(triangles) == 0:
+        return tangents
+
+    i1, i2, i3 = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    deltaPos2 = positions[i2] - positions[i1]
+    deltaPos3 = positions[i3] - positions[i1]
+    deltaUV2 = texcoords[i2] - texcoords[i1]
+    deltaUV3 = texcoords[i3] - texcoords[i1]
+    r = deltaUV2[:, 0] * deltaUV3[:, 1] - deltaUV2[:, 1] * deltaUV3[:, 0]
+    r = np.divide(1.0, r, out=np.zeros_like(r), where=(r != 0.0))
+
+    triangle_tangents = (deltaPos2 * deltaUV3[:, 1:2] - deltaPos3 * deltaUV2[:, 1:2]) * r[:, np.newaxis]
+    lengths = np.linalg.norm(triangle_tangents, axis=1)
+
+    # invalid tangent
+    invalid = lengths == 0.0
+    if np.any(invalid):
+        avg_normals = normals[i1[invalid]] + normals[i2[invalid]] + normals[i3[invalid]]
+        triangle_tangents[invalid] = np.cross(avg_normals, WORLD_UP)
+        lengths[invalid] = np.linalg.norm(triangle_tangents[invalid], axis=1)
+
+    # normalize the tangent and weight by the area. The degenerate triangles have a small weight.
+    areas = np.maximum(np.linalg.norm(np.cross(deltaPos2, deltaPos3), axis=1) * 0.5, 1e-12)
+    weights = np.divide(areas, lengths, out=np.zeros_like(lengths), where=(lengths != 0.0))
+    triangle_tangents *= weights[:, np.newaxis]
+
+    np.add.at(tangents, i1, triangle_tangents)
+    np.add.at(tangents, i2, triangle_tangents)
+    np.add.at(tangents, i3, triangle_tangents)
+
+    lengths = np.linalg.norm(tangents, axis=1)
+    tangents /= np.where(lengths != 0.0, lengths, 1.0)[:, np.newaxis]
     return tangents
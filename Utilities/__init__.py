@@ -3,6 +3,7 @@ from .Graphics import *
 from .ImageProcessing import *
 from .Logger import *
 from .Transform import *
+from .Culling import get_frustum_planes, transform_aabb, frustum_test, BoundingVolumeHierarchy, FrustumCulling
 from .Vector import Vector
 from .Singleton import Singleton
 from .AutoEnum import AutoEnum
@@ -0,0 +1,65 @@
+import time
+
+import numpy as np
+
+from Utilities.Transform import WORLD_UP, normalize, compute_tangent
+
+
+def compute_tangent_per_triangle(positions, texcoords, normals, indices):
+    """
+    The previous implementation which loops over triangles. The last triangle overwrites the tangent of the vertex.
+    It is kept here for the comparison with compute_tangent.
+    """
+    tangents = np.array([0.0, 0.0, 0.0] * len(normals), dtype=np.float32).reshape(len(normals), 3)
+    # binormals = np.array([0.0, 0.0, 0.0] * len(normals), dtype=np.float32).reshape(len(normals), 3)
+
+    for i in range(0, len(indices), 3):
+        i1, i2, i3 = indices[i:i + 3]
+        deltaPos2 = positions[i2] - positions[i1]
+        deltaPos3 = positions[i3] - positions[i1]
+        deltaUV2 = texcoords[i2] - texcoords[i1]
+        deltaUV3 = texcoords[i3] - texcoords[i1]
+        r = (deltaUV2[0] * deltaUV3[1] - deltaUV2[1] * deltaUV3[0])
+        r = 1.0 / r if r != 0.0 else 0.0
+
+        tangent = (deltaPos2 * deltaUV3[1] - deltaPos3 * deltaUV2[1]) * r
+        tangent = normalize(tangent)
+        # binormal = (deltaPos3 * deltaUV2[0]   - deltaPos2 * deltaUV3[0]) * r
+        # binormal = normalize(binormal)
+
+        # invalid tangent
+        if all(x == 0.0 for x in tangent):
+            avg_normal = normalize(normals[i1] + normals[i2] + normals[i3])
+            tangent = np.cross(avg_normal, WORLD_UP)
+
+        tangents[indices[i]] = tangent
+        tangents[indices[i + 1]] = tangent
+        tangents[indices[i + 2]] = tangent
+
+        # binormals[indices[i]] = binormal
+        # binormals[indices[i+1]] = binormal
+        # binormals[indices[i+2]] = binormal
+    # return tangents, binormals
+    return tangents
+
+
+def run():
+    # million triangles of synthetic grid mesh
+    grid_size = 708
+    u, v = np.meshgrid(np.linspace(0.0, 1.0, grid_size), np.linspace(0.0, 1.0, grid_size))
+    texcoords = np.stack([u.ravel(), v.ravel()], axis=1).astype(np.float32)
+    positions = np.stack([u.ravel(), np.sin(u.ravel() * 10.0) * 0.1, v.ravel()], axis=1).astype(np.float32)
+    normals = np.tile(WORLD_UP, (len(positions), 1))
+    quads = (np.arange(grid_size - 1)[:, np.newaxis] * grid_size + np.arange(grid_size - 1)).ravel()
+    indices = np.stack([quads, quads + grid_size, quads + 1,
+                        quads + 1, quads + grid_size, quads + grid_size + 1], axis=1).ravel().astype(np.uint32)
+    print("triangles : %d, vertices : %d" % (len(indices) // 3, len(positions)))
+
+    for func in (compute_tangent, compute_tangent_per_triangle):
+        start_time = time.perf_counter()
+        func(positions, texcoords, normals, indices)
+        print("%s : %.3f sec" % (func.__name__, time.perf_counter() - start_time))
+
+
+if __name__ == '__main__':
+    run()
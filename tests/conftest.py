@@ -0,0 +1,9 @@
+import os
+import sys
+
+# the packages of the engine are imported from the root of the repository. ex) import Object
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# import the packages in the order of main.py. Object and App import each other,
+# so importing Object first fails with the partially initialized module.
+import App
@@ -0,0 +1,110 @@
+import pytest
+
+from Object.RenderGraph import RenderGraph
+
+
+def noop():
+    pass
+
+
+def build_frame_graph():
+    render_graph = RenderGraph('TestGraph')
+    render_graph.add_transient_resource('bloom0', 'HDR', 0.5)
+    render_graph.add_transient_resource('bloom1', 'HDR', 0.5)
+    render_graph.add_transient_resource('bloom2', 'HDR', 0.25)
+    render_graph.add_pass('gbuffer', noop, outputs=('DIFFUSE', 'DEPTHSTENCIL'))
+    render_graph.add_pass('shadow', noop, outputs=('SHADOWMAP',))
+    render_graph.add_pass('ssao', noop, inputs=('DEPTHSTENCIL',), outputs=('SSAO',))
+    render_graph.add_pass('solid', noop, inputs=('DIFFUSE', 'DEPTHSTENCIL', 'SHADOWMAP', 'SSAO'), outputs=('HDR',))
+    render_graph.add_pass('bloom_down', noop, inputs=('HDR',), outputs=('bloom0',))
+    render_graph.add_pass('bloom_blur', noop, inputs=('bloom0',), outputs=('bloom2',))
+    render_graph.add_pass('bloom_up', noop, inputs=('bloom2',), outputs=('bloom1',))
+    render_graph.add_pass('bloom_composite', noop, inputs=('HDR', 'bloom1'), outputs=('HDR',))
+    render_graph.add_pass('tone_map', noop, inputs=('HDR',), outputs=('BACKBUFFER',))
+    render_graph.set_outputs('BACKBUFFER')
+    return render_graph
+
+
+def test_passes_keep_the_declaration_order():
+    compiled = build_frame_graph().get_compiled()
+    assert compiled.get_pass_names() == ['gbuffer', 'shadow', 'ssao', 'solid', 'bloom_down', 'bloom_blur',
+                                         'bloom_up', 'bloom_composite', 'tone_map']
+    assert compiled.culled_passes == []
+    assert ('SSAO', 'ssao', 'solid') in compiled.barriers
+
+
+def test_unused_passes_are_culled():
+    render_graph = build_frame_graph()
+    render_graph.add_pass('unused', noop, inputs=('HDR',), outputs=('UNUSED',))
+    render_graph.add_pass('history', noop, inputs=('HDR',), outputs=('HISTORY',), side_effect=True)
+    compiled = render_graph.get_compiled()
+    assert compiled.culled_passes == ['unused']
+    assert 'history' in compiled.get_pass_names()
+
+
+def test_disabled_passes_recompile():
+    enable = [True]
+    render_graph = build_frame_graph()
+    render_graph.add_pass('font', noop, inputs=('BACKBUFFER',), outputs=('BACKBUFFER',), enable=lambda: enable[0])
+    assert 'font' in render_graph.get_compiled().get_pass_names()
+    assert render_graph.get_compiled() is render_graph.get_compiled()
+
+    enable[0] = False
+    assert 'font' not in render_graph.get_compiled().get_pass_names()
+    assert render_graph.compile_count == 2
+
+
+def test_transient_resources_are_aliased_by_lifetime():
+    compiled = build_frame_graph().get_compiled()
+    physical_resources = compiled.physical_resources
+    # bloom0 is not used after bloom_blur, so bloom1 of the same description reuses its texture.
+    assert physical_resources['bloom0'] == physical_resources['bloom1']
+    assert physical_resources['bloom2'] != physical_resources['bloom0']
+    assert compiled.lifetimes['bloom0'] == (4, 5)
+
+
+def test_overlapping_transient_resources_are_not_aliased():
+    render_graph = RenderGraph('TestGraph')
+    render_graph.add_transient_resource('temp0', 'HDR')
+    render_graph.add_transient_resource('temp1', 'HDR')
+    render_graph.add_pass('write0', noop, outputs=('temp0',))
+    render_graph.add_pass('write1', noop, outputs=('temp1',))
+    render_graph.add_pass('combine', noop, inputs=('temp0', 'temp1'), outputs=('HDR',))
+    render_graph.set_outputs('HDR')
+    compiled = render_graph.get_compiled()
+    assert compiled.physical_resources['temp0'] != compiled.physical_resources['temp1']
+
+
+def test_reading_a_transient_resource_before_written_raises():
+    render_graph = RenderGraph('TestGraph')
+    render_graph.add_transient_resource('temp', 'HDR')
+    render_graph.add_pass('read', noop, inputs=('temp',), outputs=('HDR',))
+    render_graph.set_outputs('HDR')
+    with pytest.raises(BaseException):
+        render_graph.get_compiled()
+
+
+def test_debug_overlay_keeps_the_previous_passes():
+    debug_texture = ['SSAO']
+    render_graph = build_frame_graph()
+    render_graph.add_pass('debug_texture', noop, inputs=lambda: ('BACKBUFFER', debug_texture[0]),
+                          outputs=('BACKBUFFER',))
+    compiled = render_graph.get_compiled()
+    assert compiled.culled_passes == []
+    assert compiled.get_pass_names()[-1] == 'debug_texture'
+    assert ('SSAO', 'ssao', 'debug_texture') in compiled.barriers
+
+    # the changed debug texture recompiles the graph.
+    debug_texture[0] = 'SHADOWMAP'
+    assert ('SHADOWMAP', 'shadow', 'debug_texture') in render_graph.get_compiled().barriers
+
+
+def test_execute_runs_the_compiled_passes():
+    executed = []
+    render_graph = RenderGraph('TestGraph')
+    render_graph.add_pass('first', lambda: executed.append('first'), outputs=('HDR',))
+    render_graph.add_pass('culled', lambda: executed.append('culled'), outputs=('UNUSED',))
+    render_graph.add_pass('second', lambda: executed.append('second'), inputs=('HDR',), outputs=('BACKBUFFER',))
+    render_graph.set_outputs('BACKBUFFER')
+    render_graph.execute()
+    assert executed == ['first', 'second']
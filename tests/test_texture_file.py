@@ -0,0 +1,144 @@
+import struct
+
+import numpy as np
+import pytest
+
+from ResourceManager.TextureFile import TEXTURE_FILE_MAGIC, TEXTURE_FILE_VERSION, \
+    generate_mipmaps, is_texture_file, load_texture_file, load_texture_file_header, save_texture_file
+
+GL_UNSIGNED_BYTE = 0x1401
+GL_HALF_FLOAT = 0x140B
+
+
+def make_texture_data(width, height, dtype=np.uint8, data_type=GL_UNSIGNED_BYTE):
+    data = (np.arange(width * height * 4) % 251).astype(dtype)
+    return dict(texture_type='Texture2D', image_mode='RGBA', width=width, height=height, data_type=data_type,
+                min_filter=0x2703, wrap=0x2901, data=data)
+
+
+def test_save_and_load(tmp_path):
+    filepath = str(tmp_path / 'texture.tex')
+    texture_data = make_texture_data(8, 4)
+    save_texture_file(filepath, texture_data, generate_mipmap=False)
+
+    assert is_texture_file(filepath)
+    loaded = load_texture_file(filepath)
+    for key in ('texture_type', 'image_mode', 'width', 'height', 'data_type', 'min_filter', 'wrap'):
+        assert loaded[key] == texture_data[key]
+    assert 'mipmap_datas' not in loaded
+    assert loaded['data'].dtype == np.uint8
+    assert np.array_equal(loaded['data'], texture_data['data'])
+
+
+def test_texture_type_is_saved_as_class_name(tmp_path):
+    class Texture2D:
+        pass
+
+    filepath = str(tmp_path / 'texture.tex')
+    texture_data = make_texture_data(4, 4)
+    texture_data['texture_type'] = Texture2D
+    save_texture_file(filepath, texture_data)
+    assert load_texture_file_header(filepath)['texture_type'] == 'Texture2D'
+
+
+def test_mip_chain(tmp_path):
+    filepath = str(tmp_path / 'texture.tex')
+    save_texture_file(filepath, make_texture_data(48, 64))
+
+    mip_descs = load_texture_file_header(filepath)['mip_descs']
+    sizes = [(mip_desc['width'], mip_desc['height']) for mip_desc in mip_descs]
+    assert sizes == [(48, 64), (24, 32), (12, 16), (6, 8), (3, 4), (1, 2), (1, 1)]
+    for mip_desc in mip_descs:
+        assert mip_desc['offset'] % 16 == 0
+        assert mip_desc['size'] == mip_desc['width'] * mip_desc['height'] * 4
+
+    loaded = load_texture_file(filepath)
+    assert len(loaded['mipmap_datas']) == 6
+    for mip_desc, mipmap_data in zip(mip_descs[1:], loaded['mipmap_datas']):
+        assert mipmap_data.size == mip_desc['width'] * mip_desc['height'] * 4
+
+
+def test_integer_mipmaps_are_rounded():
+    # 2x2 RGBA, the average of the red channel is 1.5 and the average of the green channel is 255.
+    data = np.array([0, 255, 0, 0, 1, 255, 0, 0, 2, 255, 0, 0, 3, 255, 0, 0], dtype=np.uint8)
+    mipmaps = generate_mipmaps(data, 2, 2, 4)
+    assert len(mipmaps) == 1
+    assert mipmaps[0].dtype == np.uint8
+    assert mipmaps[0].tolist() == [2, 255, 0, 0]
+
+
+@pytest.mark.parametrize('dtype', [np.float16, np.float32])
+def test_float_mipmaps_are_not_quantized(dtype):
+    data = np.array([0.0, 0.25, 0.0, 0.0, 1.0, 0.5, 0.0, 0.0, 0.5, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0], dtype=dtype)
+    mipmaps = generate_mipmaps(data, 2, 2, 4)
+    assert mipmaps[0].dtype == dtype
+    assert np.allclose(mipmaps[0], [0.375, 0.1875, 0.0, 0.0])
+
+
+def test_float_texture_round_trip(tmp_path):
+    filepath = str(tmp_path / 'texture.tex')
+    texture_data = make_texture_data(4, 4, dtype=np.float16, data_type=GL_HALF_FLOAT)
+    save_texture_file(filepath, texture_data)
+    loaded = load_texture_file(filepath)
+    assert loaded['data'].dtype == np.float16
+    assert np.array_equal(loaded['data'], texture_data['data'])
+    assert loaded['mipmap_datas'][-1].dtype == np.float16
+
+
+def test_precomputed_mipmaps_are_saved_as_they_are(tmp_path):
+    filepath = str(tmp_path / 'texture.tex')
+    texture_data = make_texture_data(4, 4)
+    mipmap_datas = [np.full(2 * 2 * 4, 7, dtype=np.uint8), np.full(4, 9, dtype=np.uint8)]
+    texture_data['mipmap_datas'] = mipmap_datas
+    save_texture_file(filepath, texture_data)
+
+    loaded = load_texture_file(filepath)
+    assert 'mipmap_datas' not in load_texture_file_header(filepath)
+    assert len(loaded['mipmap_datas']) == 2
+    for mipmap_data, loaded_mipmap_data in zip(mipmap_datas, loaded['mipmap_datas']):
+        assert np.array_equal(mipmap_data, loaded_mipmap_data)
+
+
+def test_save_replaces_the_mapped_file(tmp_path):
+    filepath = str(tmp_path / 'texture.tex')
+    save_texture_file(filepath, make_texture_data(4, 4))
+    loaded = load_texture_file(filepath)
+    data = np.array(loaded['data'])
+
+    texture_data = make_texture_data(4, 4)
+    texture_data['data'] = np.zeros(4 * 4 * 4, dtype=np.uint8)
+    save_texture_file(filepath, texture_data)
+
+    # the memory map of the old file is not changed, and no temp file is left.
+    assert np.array_equal(loaded['data'], data)
+    assert not np.any(load_texture_file(filepath)['data'])
+    assert [path.name for path in tmp_path.iterdir()] == ['texture.tex']
+
+
+def test_loaded_mip_chain_survives_the_smaller_file(tmp_path):
+    filepath = str(tmp_path / 'texture.tex')
+    save_texture_file(filepath, make_texture_data(64, 64))
+    loaded = load_texture_file(filepath)
+    levels = [np.array(loaded['data'])] + [np.array(mipmap_data) for mipmap_data in loaded['mipmap_datas']]
+
+    # The truncated file in place would make the pages of the memory map past the new end of the file invalid.
+    save_texture_file(filepath, make_texture_data(2, 2), generate_mipmap=False)
+
+    mapped_levels = [loaded['data']] + loaded['mipmap_datas']
+    for level, mapped_level in zip(levels, mapped_levels):
+        assert np.array_equal(level, mapped_level)
+    assert load_texture_file(filepath)['width'] == 2
+
+
+@pytest.mark.parametrize('magic, version', [(b'NOTATEX\x00', TEXTURE_FILE_VERSION),
+                                            (TEXTURE_FILE_MAGIC, TEXTURE_FILE_VERSION + 1)])
+def test_invalid_header_raises(tmp_path, magic, version):
+    filepath = str(tmp_path / 'texture.tex')
+    save_texture_file(filepath, make_texture_data(4, 4))
+    with open(filepath, 'r+b') as f:
+        f.write(struct.pack('<8sI', magic, version))
+
+    with pytest.raises(BaseException):
+        load_texture_file_header(filepath)
+    with pytest.raises(BaseException):
+        load_texture_file(filepath)